@@ -1,15 +1,35 @@
 """
 将回测excel数据批量写入数据库
 
-- insert_backtesting_to_db
-  - insert_backtesting_excel_to_db
-    - insert_backtesting_data
-    - insert_trade_data
+- insert_backtesting_to_db / insert_backtesting_to_db_parallel（并行模式） / pipeline.run_pipeline（流水线模式）
+  / async_ingest.insert_backtesting_to_db_async（asyncio模式）
+  - skip_ingested_files（按内容hash跳过已写入过的文件）
+  - parse_backtesting_file（并行模式下在进程池中执行：解析excel、构建backtesting和trade行）
+  - write_and_move_batch（每INGEST_COMMIT_BATCH_SIZE个文件一个事务，提交后移动文件）
+    - add_to_local_analytics（ANALYTICS_ENABLED时同步写入本地DuckDB分析库）
+    - write_backtesting_transaction（连接断开时整个事务重试）
+      - insert_backtesting_data
+      - insert_trade_data
 改动：
-- insert_backtesting_data和insert_trade_data的断开连接异常不再尝试重新连接。因为如果是trade时断开连接，会连同backtesting一起回滚（？），过于复杂，简化处理
+- 运行日志（run_journal.py）：每个文件的 discovered/parsed/committed/moved 状态批量写入本地SQLite，
+  进程中断后 cli.py ingest --resume 不连接数据库移动已提交的文件（finish_committed_moves），只重新写入未完成的文件
+- INGEST_RELOAD（重新写入模式，reload.py）：同一回测（策略、交易对、回测区间、设置相同）再次写入时更新原BackTesting行，
+  trade行与已存储的对比，只写入新增/修改的行，删除已不存在的行，不再新增一条回测
+- 解析结果改为CompactWorkbook（compact_workbook.py）：数值列存为数组、字符串列分类编码，不再是每个单元格一个Python对象
+- 表头元数据解析移到metadata_parsing：指标标签转换按标签缓存、日期格式每个文件只探测一次、正则拆分strategy/exchange/symbol，
+  修正symbol.strip(currency_name)按字符集合去掉两端字符导致symbol错误的问题
+- 超过STREAMING_FILE_SIZE的文件List of trades分块读取、转换、写入（write_streaming_file），内存占用与交易数无关，仍是一个文件一个事务
+- 解析、维表查询、backtesting写入、trade写入、事务、移动文件都有计时（instrumentation.span），运行结束后输出各阶段耗时报告
+- insert_backtesting_data和insert_trade_data不再各自commit：同一文件的维表插入、backtesting、trade在一个事务中一次提交，trade失败不会留下孤立的backtesting行
 - create_db_connection、insert_backtesting_data、insert_trade_data、insert_backtesting_to_db是否应该抛出异常给外部函数？遇到异常就抛出？如果内部只抛出Exception，在外部详细处理各种异常，rollback在哪写？
     考虑：不raise异常，各处理各的。如果raise异常在外层统一处理，不好判断是backtesting还是trade出现异常
          但好像可以通过内部Except块打印/写日志区分具体哪里出现异常
+- 数据库连接改为从连接池（db_pool.ConnectionPool）获取，取出时ping检查断线重连；连接断开时整个事务按指数退避重试
+  COMMIT时连接断开不直接重试，先按事务中分配的backtesting_id确认是否已提交（backtesting_rows_committed），避免重复写入
+- COMMIT之前把文件记录到写入索引的待确认区（record_pending_commits），RDS提交后、记录写入索引之前进程中断时，
+  下次运行按backtesting_id确认已提交（resolve_pending_commits），不会再写入一次
+- 所有移动到processed目录的文件（包括已写入过而跳过的文件）都经过move_to_processed记录运行日志；
+  processed目录中已有同名文件时不覆盖，改名为 文件名_1.xlsx、文件名_2.xlsx ...
 
 待处理：
 - 测试insert_backtesting_data中根据symbol得到exchangeticker_id
@@ -17,47 +37,66 @@
 """
 import json
 import pprint
-from decimal import Decimal, getcontext
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from utils import *
+from trade_rows import build_trade_rows, iter_trade_row_chunks
+from metadata_parsing import DateParser, label_key, split_symbol, strategy_from_file_name
+from compact_workbook import metric_records
+from bulk_loader import bulk_insert_trades
+from reload import STRATEGY_INDEX, SYMBOL_INDEX, backtesting_committed, committed_backtesting_query, \
+    delete_all_trades, delete_trades, diff_trades, fetch_trades, find_backtesting, update_backtesting
+from dimension_cache import DimensionCache
+from db_pool import ConnectionPool, commit_transaction
+from ingest_index import file_sha256, get_ingest_index
+from run_journal import journal_record, journal_record_many
+from parsed_cache import cache_available, read_parsed_cache, write_parsed_cache
+from instrumentation import span, timed, run_with_metrics, merge_metrics, write_metrics_report
+
+
+# 维表缓存，所有写线程共享
+dimension_cache = DimensionCache()
+
+# 选择processed目录中的文件名和移动文件之间不能被其他写线程插入同名文件
+processed_move_lock = threading.Lock()
+
+
+# 插入回测数据
+BACKTESTING_INSERT_QUERY = """
+INSERT INTO BackTesting (
+    ticker_id, performance, trades_analysis, risk_performance_ratios, strategy,
+    trading_range_start, trading_range_end, backtesting_range_start, backtesting_range_end,
+    symbol, timeframe, point_value, chart_type, currency, tick_size, precision_setting,
+    start_date, initial_capital, order_size, pyramiding, commission, slippage,
+    verify_price_ticks, long_margin, short_margin, recalculate_after_order,
+    recalculate_every_tick, recalculate_on_bar_close, use_bar_magnifier
+) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
 
 
-def insert_backtesting_data(connection, excel_data, file_name):
+def read_properties(properties_sheet):
     """
-    将excel数据写入backtesting表，返回backtesting_id
-    :param connection: 数据库连接实例
-    :param excel_data: dict
-    :return: backtesting_id
+    Properties sheet的 A列标签 -> B列值（validate.py校验时用同样的方式读取）
+    :param properties_sheet: parse_excel格式或CompactSheet
+    :return: dict
     """
-    # 1. 从excel获取数据
-    # 辅助函数：构建带列标签的数据字典
-    def build_sheet_data(sheet_data):
-        data = {}
-
-        # 获取A列的所有行标签
-        row_labels = [cell for cell in sheet_data['A'][1:]]
-
-        for row, label in enumerate(row_labels, 1):
-            row_data = {}
-
-            # 添加所有列的数据
-            columns = {
-                'B': 'All_USDT',
-                'C': 'All_percent',
-                'D': 'Long_USDT',
-                'E': 'Long_percent',
-                'F': 'Short_USDT',
-                'G': 'Short_percent'
-            }
-
-            for col, col_name in columns.items():
-                value = sheet_data[col][row]
-                row_data[col_name] = None if str(value) == "nan" else value
+    props = {}
+    for i in range(len(properties_sheet['A'][1:])):
+        props[properties_sheet['A'][i]] = properties_sheet['B'][i]
+    return props
 
-            # 使用A列的标签作为key
-            key = label.lower().replace(' & ', '_and_').replace(' ', '_').replace('&', '_and_').replace('/', '_').replace('%', 'percent')
-            data[key] = row_data
 
-        return data
+def build_backtesting_record(excel_data, file_name):
+    """
+    从excel数据构建backtesting表的一行（不访问数据库，可在子进程中执行）
+    :param excel_data: parse_excel的返回值（dict或CompactWorkbook）
+    :param file_name: str
+    :return: (exchange, symbol, currency_name, row)，row为不含ticker_id的tuple
+    """
+    # 辅助函数：构建带列标签的数据字典（A列的标签作为key，B ~ G列按列一次取出）
+    def build_sheet_data(sheet_data):
+        return {record.key: record.as_dict() for record in metric_records(sheet_data, label_key)}
 
     # 获取Performance表数据
     performance_data = build_sheet_data(excel_data['Performance'])
@@ -67,351 +106,723 @@ def insert_backtesting_data(connection, excel_data, file_name):
     risk_performance_data = build_sheet_data(excel_data['Risk performance ratios'])
 
     # 获取strategy
-    i = len(file_name)-1
-    while file_name[i] != "_":
-        i -= 1
-    strategy = file_name[:i]
+    strategy = strategy_from_file_name(file_name)
 
     # 获取属性数据
-    props = {}
-    properties_sheet = excel_data['Properties']
-
-    for i in range(len(properties_sheet['A'][1:])):
-        props[properties_sheet['A'][i]] = properties_sheet['B'][i]
+    props = read_properties(excel_data['Properties'])
 
-    # 解析日期范围
-    def parse_date_range(date_str):
-        if not date_str or not isinstance(date_str, str):
-            return None, None
-        parts = date_str.split("—")
-        if len(parts) == 2:
-            return parse_date(parts[0].strip()), parse_date(parts[1].strip())
-        return None, None
-
-    trading_range_start, trading_range_end = parse_date_range(props.get("Trading range"))
-    backtesting_range_start, backtesting_range_end = parse_date_range(props.get("Backtesting range"))
+    # 解析日期范围（同一文件的日期格式只探测一次）
+    date_parser = DateParser()
+    trading_range_start, trading_range_end = date_parser.parse_range(props.get("Trading range"))
+    backtesting_range_start, backtesting_range_end = date_parser.parse_range(props.get("Backtesting range"))
     start_date = props.get("Start Date", "")
-    start_date = parse_date(start_date) if start_date else None
+    start_date = date_parser.parse(start_date) if start_date else None
+
+    # 拆分exchange和symbol
+    symbol = props.get("Symbol", "")
+    currency_name = props['Currency']
+
+    exchange, symbol = split_symbol(symbol, currency_name)
+
+    # 处理可能为空的数值
+    def safe_float(value, default=0.0):
+        try:
+            if value is None or str(value).strip() == '':
+                return default
+            if isinstance(value, str) and '%' in value:
+                return float(value.rstrip('%'))
+            return float(value)
+        except (ValueError, TypeError):
+            return default
+
+    def safe_int(value, default=0):
+        try:
+            if value is None or str(value).strip() == '':
+                return default
+            return int(value)
+        except (ValueError, TypeError):
+            return default
+
+    def safe_str(value, default=''):
+        if value is None:
+            return default
+        return str(value).strip()
+
+    backtesting_row = (
+        json.dumps(performance_data, ensure_ascii=False),
+        json.dumps(trades_analysis_data, ensure_ascii=False),
+        json.dumps(risk_performance_data, ensure_ascii=False),
+        strategy,
+        trading_range_start,
+        trading_range_end,
+        backtesting_range_start,
+        backtesting_range_end,
+        symbol,
+        safe_str(props.get("Timeframe")),
+        safe_float(props.get("Point value")),
+        safe_str(props.get("Chart type")),
+        safe_str(props.get("Currency")),
+        safe_float(props.get("Tick size")),
+        safe_str(props.get("Precision")),
+        start_date,
+        safe_float(props.get("Initial capital")),
+        safe_int(props.get("Order size")),
+        safe_int(props.get("Pyramiding")),
+        safe_float(props.get("Commission")),
+        safe_int(props.get("Slippage")),
+        safe_int(props.get("Verify price for limit orders")),
+        safe_float(props.get("Margin for long positions")),
+        safe_float(props.get("Margin for short positions")),
+        'On' if safe_str(props.get("Recalculate after order is filled")) == 'On' else 'Off',
+        'On' if safe_str(props.get("Recalculate on every tick")) == 'On' else 'Off',
+        'On' if safe_str(props.get("Recalculate on bar close")) == 'On' else 'Off',
+        'On' if safe_str(props.get("Backtesting precision. Use bar magnifier")) == 'On' else 'Off'
+    )
+
+    return exchange, symbol, currency_name, backtesting_row
+
+
+@timed('dimension_lookup')
+def resolve_exchangeticker_id(cursor, exchange, symbol, currency_name):
+    """
+    根据exchange、symbol、currency查exchangeticker_id（先查进程内缓存），不存在则依次插入ticker、currency、exchange、exchangeticker
+    调用方提交或回滚事务后需调用dimension_cache.commit()/rollback()
+    :param cursor: 数据库游标
+    :return: exchangeticker_id
+    """
+    return dimension_cache.resolve(cursor, exchange, symbol, currency_name)
 
-    # 2.写入数据库
-    try:
-        with connection.cursor() as cursor:
-            # 从Ticker表查ticker_id
-            symbol = props.get("Symbol", "")
-            currency_name = props['Currency']
 
-            exchange, symbol = symbol.strip(currency_name).split(':')
+@timed('insert_backtesting')
+def insert_backtesting_data(cursor, backtesting_record):
+    """
+    将backtesting行写入backtesting表（不提交事务），返回backtesting_id
+    :param cursor: 数据库游标
+    :param backtesting_record: build_backtesting_record的返回值
+    :return: backtesting_id
+    """
+    exchange, symbol, currency_name, backtesting_row = backtesting_record
+    ticker_id = resolve_exchangeticker_id(cursor, exchange, symbol, currency_name)
 
-            cursor.execute("select id from ticker where symbol=%s", symbol)
-            ticker_id = cursor.fetchone()
+    cursor.execute(BACKTESTING_INSERT_QUERY, (ticker_id,) + backtesting_row)
+    return cursor.lastrowid
 
-            # symbol不存在ticker表,插入
-            if not ticker_id:
-                cursor.execute(f"insert into ticker (symbol) values ({symbol})")
-                ticker_id = cursor.lastrowid
-            else:
-                ticker_id = ticker_id['id']
-
-            # 从ExchangeTicker表查exchangeticker_id
-            cursor.execute(f"select id from exchangeticker where ticker_id={ticker_id}")
-            exchangeticker_id = cursor.fetchone()
-
-            # exchangeticker_id不存在
-            # 1.分别去currency、exchange表检查是否存在，不存在则插入
-            # 2.插入ExchangeTicker表
-            if not exchangeticker_id:
-                # 查currency表
-                cursor.execute("""select * from currency where name = %s""", currency_name)
-                currency_id = cursor.fetchone()
-                if not currency_id:
-                    print("currency不存在，开始插入")
-                    cursor.execute("""insert into Currency (name) values (%s)""", currency_name)
-                    currency_id = cursor.lastrowid
-                else:
-                    currency_id = currency_id['id']
-                # 查exchange表
-                cursor.execute("""select * from exchange where name = %s""", exchange)
-                exchange_id = cursor.fetchone()
-                if not exchange_id:
-                    cursor.execute("""insert into exchange (name) values (%s)""", exchange)
-                    exchange_id = cursor.lastrowid
-                else:
-                    exchange_id = exchange_id['id']
-                # 插入ExchangeTicker表
-                cursor.execute("""insert into exchangeticker (ticker_id,currency_id,exchange_id) values (%s,%s,%s)""", (ticker_id,currency_id,exchange_id))
-                ticker_id = cursor.lastrowid
-            else:
-                ticker_id = exchangeticker_id['id']
-
-            # 插入回测数据
-            insert_query = """
-            INSERT INTO BackTesting (
-                ticker_id, performance, trades_analysis, risk_performance_ratios, strategy,
-                trading_range_start, trading_range_end, backtesting_range_start, backtesting_range_end,
-                symbol, timeframe, point_value, chart_type, currency, tick_size, precision_setting,
-                start_date, initial_capital, order_size, pyramiding, commission, slippage,
-                verify_price_ticks, long_margin, short_margin, recalculate_after_order,
-                recalculate_every_tick, recalculate_on_bar_close, use_bar_magnifier
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
-
-            # 处理可能为空的数值
-            def safe_float(value, default=0.0):
-                try:
-                    if value is None or str(value).strip() == '':
-                        return default
-                    if isinstance(value, str) and '%' in value:
-                        return float(value.rstrip('%'))
-                    return float(value)
-                except (ValueError, TypeError):
-                    return default
-
-            def safe_int(value, default=0):
-                try:
-                    if value is None or str(value).strip() == '':
-                        return default
-                    return int(value)
-                except (ValueError, TypeError):
-                    return default
-
-            def safe_str(value, default=''):
-                if value is None:
-                    return default
-                return str(value).strip()
-
-            json_test = {'name':'gfn',
-                         'age':'99'}
-
-            backtesting_data = (
-                ticker_id,
-                json.dumps(performance_data, ensure_ascii=False),
-                json.dumps(trades_analysis_data, ensure_ascii=False),
-                json.dumps(risk_performance_data, ensure_ascii=False),
-                strategy,
-                trading_range_start,
-                trading_range_end,
-                backtesting_range_start,
-                backtesting_range_end,
-                symbol,
-                safe_str(props.get("Timeframe")),
-                safe_float(props.get("Point value")),
-                safe_str(props.get("Chart type")),
-                safe_str(props.get("Currency")),
-                safe_float(props.get("Tick size")),
-                safe_str(props.get("Precision")),
-                start_date,
-                safe_float(props.get("Initial capital")),
-                safe_int(props.get("Order size")),
-                safe_int(props.get("Pyramiding")),
-                safe_float(props.get("Commission")),
-                safe_int(props.get("Slippage")),
-                safe_int(props.get("Verify price for limit orders")),
-                safe_float(props.get("Margin for long positions")),
-                safe_float(props.get("Margin for short positions")),
-                'On' if safe_str(props.get("Recalculate after order is filled")) == 'On' else 'Off',
-                'On' if safe_str(props.get("Recalculate on every tick")) == 'On' else 'Off',
-                'On' if safe_str(props.get("Recalculate on bar close")) == 'On' else 'Off',
-                'On' if safe_str(props.get("Backtesting precision. Use bar magnifier")) == 'On' else 'Off'
-            )
 
-            cursor.execute(insert_query, backtesting_data)
-            backtesting_id = cursor.lastrowid
-            connection.commit()
+@timed('insert_trade')
+def insert_trade_data(cursor, backtesting_id, trade_rows):
+    """
+    将trade行写入trade表（不提交事务）
+    :param cursor: 数据库游标
+    :param backtesting_id: int
+    :param trade_rows: build_trade_rows返回的trade行
+    :return: 写入的行数
+    """
+    return bulk_insert_trades(cursor, backtesting_id, trade_rows)
 
-            print("写入Backtesting表成功")
-            return backtesting_id
 
-    except IntegrityError as e:
-        # 处理唯一约束、外键约束等违反完整性错误
-        connection.rollback()
-        print(f"数据完整性错误: {e}. 已回滚事务")
+def reload_backtesting_row(cursor, backtesting_record):
+    """
+    重新写入模式下写入backtesting行（不提交事务）：已存储同一回测时更新该行，否则新增
+    :param cursor: 数据库游标
+    :param backtesting_record: build_backtesting_record的返回值
+    :return: (backtesting_id, 是否已存储)
+    """
+    exchange, symbol, currency_name, backtesting_row = backtesting_record
+    ticker_id = resolve_exchangeticker_id(cursor, exchange, symbol, currency_name)
 
-    except DataError as e:
-        # 处理数据格式、类型等错误
-        connection.rollback()
-        print(f"数据处理错误: {e}. 已回滚事务")
+    backtesting_id = find_backtesting(cursor, ticker_id, backtesting_row)
+    if backtesting_id is None:
+        cursor.execute(BACKTESTING_INSERT_QUERY, (ticker_id,) + backtesting_row)
+        return cursor.lastrowid, False
 
-    except ProgrammingError as e:
-        # 处理SQL语法错误、表不存在等问题
-        connection.rollback()
-        print(f"SQL编程错误: {e}. 已回滚事务")
+    update_backtesting(cursor, backtesting_id, ticker_id, backtesting_row)
+    return backtesting_id, True
 
-    except OperationalError as e:
-        # 处理数据库操作错误，如连接断开等
-        connection.rollback()
-        print(f"数据库操作错误: {e}. 已回滚事务")
 
-        # 断开连接
-        if 'Lost connection' in str(e):
-            print("您已断开数据库连接")
+@timed('reload_backtesting')
+def reload_backtesting_data(cursor, backtesting_record, trade_rows):
+    """
+    重新写入模式下写入一个文件（不提交事务）：已存储同一回测时只写入有变化的trade行
+    :param cursor: 数据库游标
+    :param backtesting_record: build_backtesting_record的返回值
+    :param trade_rows: build_trade_rows返回的trade行
+    :return: backtesting_id
+    """
+    backtesting_id, existed = reload_backtesting_row(cursor, backtesting_record)
+    if not existed:
+        insert_trade_data(cursor, backtesting_id, trade_rows)
+        return backtesting_id
 
-    except InternalError as e:
-        # 处理数据库内部错误
-        connection.rollback()
-        print(f"数据库内部错误: {e}. 已回滚事务")
+    insert_rows, delete_ids, unchanged, stats = diff_trades(fetch_trades(cursor, backtesting_id), trade_rows)
+    delete_trades(cursor, backtesting_id, delete_ids)
+    if insert_rows:
+        insert_trade_data(cursor, backtesting_id, insert_rows)
+    print(f"重新写入回测 {backtesting_id}：新增 {stats['added']}，修改 {stats['changed']}，"
+          f"删除 {stats['removed']}，不变 {unchanged}")
+    return backtesting_id
 
-    except NotSupportedError as e:
-        # 处理不支持的数据库特性
-        connection.rollback()
-        print(f"不支持的数据库特性: {e}. 已回滚事务")
 
+def insert_backtesting_excel_to_db(pool, excel_path):
+    """
+    将单个回测文件写入数据库（backtesting和trade在一个事务中提交）
+    :param pool: ConnectionPool
+    :param excel_path: 回测文件路径
+    :return: bool
+    """
+    print("--开始insert_backtesting_excel_to_db--")
+
+    try:
+        backtesting_record, trade_rows, total_trades = parse_backtesting_file(excel_path)
+    except Exception as e:
+        print(f"解析文件失败: {excel_path.name}: {e}")
+        return False
+
+    backtesting_id = write_backtesting_file(pool, backtesting_record, trade_rows)
+    if not backtesting_id:
+        print("写入数据库失败！")
+        db_log(f"Backtesting/Trade insertion failed for file: {excel_path}")
+        return False
+
+    print(f"成功写入 {len(trade_rows)}/{total_trades} 条交易记录")
+    print("回测数据写入成功：", excel_path.name)
+    return True
+
+
+def print_dimension_cache_stats():
+    stats = dimension_cache.stats()
+    print(f"维表缓存：命中 {stats['hits']} 次，未命中 {stats['misses']} 次，未命中时查询 {stats['queries']} 次")
+
+
+def list_backtesting_files():
+    """
+    获取待写入回测文件目录中的所有Excel文件（支持xlsx、xls、csv）
+    :return: list[Path]
+    """
+    return list(BACKTESTING_NEW_DIR.glob("*.[xX][lL][sS]*")) + list(BACKTESTING_NEW_DIR.glob("*.[cC][sS][vV]"))
+
+
+def skip_ingested_files(files):
+    """
+    计算文件内容hash，已写入过数据库的文件不再解析，直接移动到processed目录
+    之前的进程留下待确认的提交时先确认（resolve_pending_commits），无法连接数据库确认时本次不写入任何文件
+    :param files: list[Path]
+    :return: [(file_path, file_hash), ...] 待写入的文件
+    """
+    try:
+        resolve_pending_commits()
     except Error as e:
-        # 捕获其他PyMySQL错误
-        connection.rollback()
-        print(f"数据库错误: {e}. 已回滚事务")
+        print_db_error(e)
+        print("无法确认中断前的提交是否成功，本次不写入，文件留在new目录")
+        return []
+    ingest_index = get_ingest_index()
+    pending = []
+    for file_path in files:
+        file_hash = file_sha256(file_path)
+        backtesting_id = ingest_index.lookup_file(file_hash)
+        if backtesting_id is None:
+            pending.append((file_path, file_hash))
+            continue
+
+        print(f"文件已写入过数据库(backtesting_id={backtesting_id})，跳过: {file_path.name}")
+        move_to_processed(file_path, file_hash)
+
+    journal_record_many([(file_path.name, file_hash, None) for file_path, file_hash in pending], 'discovered')
+    return pending
+
+
+def record_pending_commits(files, backtesting_ids, backtesting_records):
+    """
+    COMMIT之前把文件记录到写入索引的待确认区（pending_commits）：RDS提交后、record_committed_files之前进程中断时，
+    下次运行由resolve_pending_commits确认已提交，文件不会被再写入一次
+    重新写入模式下重新执行本身是幂等的，不记录
+    :param files: [(file_hash, file_name), ...]，与backtesting_ids一一对应，None表示不记录
+    :param backtesting_ids: 事务中分配的backtesting_id
+    :param backtesting_records: 对应的build_backtesting_record返回值
+    """
+    if INGEST_RELOAD or not files:
+        return
+    get_ingest_index().record_pending([
+        (file_hash, file_name, backtesting_id, row[STRATEGY_INDEX], row[SYMBOL_INDEX])
+        for (file_hash, file_name), backtesting_id, (_, _, _, row) in zip(files, backtesting_ids, backtesting_records)
+    ])
+
+
+def fetch_committed_backtesting(connection, backtesting_ids):
+    """:return: committed_backtesting_query的查询结果"""
+    with connection.cursor() as cursor:
+        cursor.execute(committed_backtesting_query(backtesting_ids), backtesting_ids)
+        return cursor.fetchall()
+
+
+def resolve_pending_commits():
+    """
+    确认之前的（已中断的）进程留下的待确认提交：按backtesting_id查BackTesting表，strategy、symbol一致的（已提交）
+    补记到写入索引，之后按已写入跳过并移动；其余的（COMMIT之前中断）删除，文件重新写入
+    没有待确认的提交时不连接数据库
+    :return: 确认为已提交的文件数
+    """
+    ingest_index = get_ingest_index()
+    entries = ingest_index.stale_pending()
+    if not entries:
+        return 0
+
+    backtesting_ids = [backtesting_id for _, _, backtesting_id, _, _ in entries]
+    pool = ConnectionPool(size=1)
+    try:
+        stored_rows = pool.run_in_transaction(fetch_committed_backtesting, backtesting_ids)
+    finally:
+        pool.close()
+
+    stored = {row['id']: (row['strategy'], row['symbol']) for row in stored_rows}
+    committed = [
+        (file_hash, file_name, backtesting_id) for file_hash, file_name, backtesting_id, strategy, symbol in entries
+        if stored.get(backtesting_id) == (strategy, symbol)
+    ]
+    ingest_index.record_files(committed)
+    ingest_index.discard_pending([entry[0] for entry in entries])
+    print(f"中断前未确认的提交 {len(entries)} 个：已提交 {len(committed)} 个，不再写入；未提交 {len(entries) - len(committed)} 个")
+    return len(committed)
+
+
+def record_committed_files(entries):
+    """
+    提交成功后记录到写入索引和运行日志，在移动文件之前立即写入
+    :param entries: [(file_hash, file_name, backtesting_id), ...]
+    """
+    get_ingest_index().record_files(entries)
+    journal_record_many(
+        [(file_name, file_hash, backtesting_id) for file_hash, file_name, backtesting_id in entries],
+        'committed', flush=True
+    )
+
+
+def record_parse_failure(file_path, e):
+    """
+    解析失败：文件留在new目录，记录到db_log，运行日志中标记为failed（各写入方式相同）
+    :param file_path: Path
+    :param e: Exception
+    """
+    print(f"解析文件失败: {file_path.name}: {e}")
+    db_log(f"Backtesting parsing failed for file: {file_path}: {type(e).__name__}: {e}")
+    journal_record(file_path.name, 'failed')
+
+
+def finish_committed_moves(journal):
+    """
+    --resume：中断前已提交但还没移动的文件不连接数据库，补记写入索引后直接移动到processed目录
+    new目录中同名文件的内容已变化时不移动，按新文件重新写入
+    :param journal: run_journal.RunJournal（重新打开的中断运行）
+    :return: 移动的文件数
+    """
+    moved = 0
+    for file_name, file_hash, _, backtesting_id in journal.files(('committed',)):
+        file_path = BACKTESTING_NEW_DIR / file_name
+        if not file_path.exists():
+            if (BACKTESTING_PROCESSED_DIR / file_name).exists():
+                journal.record(file_name, 'moved') # 已移动，但状态在中断前没来得及写入
+            continue
+        if file_sha256(file_path) != file_hash:
+            print(f"文件内容已变化，重新写入: {file_name}")
+            continue
+        get_ingest_index().record_files([(file_hash, file_name, backtesting_id)])
+        moved += move_to_processed(file_path)
+
+    unfinished = journal.files(('discovered', 'parsed', 'failed'))
+    print(f"中断前已提交未移动的文件：移动 {moved} 个；未完成的文件 {len(unfinished)} 个，重新写入")
+    return moved
+
+
+def verify_ingest_index(prune=False):
+    """
+    检查本地索引与BackTesting表是否一致
+    :param prune: 是否从索引中删除BackTesting表中已不存在的记录（之后这些文件会被重新写入）
+    :return: list，BackTesting表中已不存在的(hash, file_name, backtesting_id)
+    """
+    pool = ConnectionPool(size=1)
+    connection = pool.acquire()
+    try:
+        with connection.cursor() as cursor:
+            missing = get_ingest_index().verify(cursor, prune=prune)
+    finally:
+        pool.release(connection)
+        pool.close()
+
+    for file_hash, file_name, backtesting_id in missing:
+        print(f"BackTesting表中不存在 backtesting_id={backtesting_id}: {file_name} ({file_hash[:12]})")
+    print(f"索引校验结束，{len(missing)} 条记录在BackTesting表中不存在" + ("，已从索引删除" if prune and missing else ""))
+    return missing
+
+
+def load_excel_data(excel_path, file_hash=None):
+    """
+    读取工作簿：有解析缓存时从缓存读取，否则解析xlsx并写入缓存
+    :param excel_path: Path
+    :param file_hash: 文件内容sha256，None表示不使用缓存
+    :return: CompactWorkbook（按列的数组存储，见compact_workbook.py）
+    """
+    use_cache = PARSED_CACHE_ENABLED and file_hash is not None and cache_available()
+    excel_data = read_parsed_cache(file_hash, compact=True) if use_cache else None
+    if excel_data is not None:
+        return excel_data
+
+    excel_data = parse_excel(excel_path, compact=True)
+    if use_cache:
+        try:
+            write_parsed_cache(file_hash, excel_data)
+        except Exception as e:
+            print(f"写入解析缓存失败: {excel_path.name}: {e}")
+    return excel_data
+
+
+@timed('parse_file')
+def parse_backtesting_file(excel_path, file_hash=None):
+    """
+    解析单个回测文件，构建待写入的backtesting行和trade行（进程池中执行，不访问数据库）
+    :param excel_path: Path
+    :param file_hash: 文件内容sha256，传入时使用解析缓存
+    :return: (backtesting_record, trade_rows, total_trades)
+    """
+    excel_data = load_excel_data(excel_path, file_hash)
+    backtesting_record = build_backtesting_record(excel_data, excel_path.name)
+    trade_rows, total_trades = build_trade_rows(excel_data)
+    return backtesting_record, trade_rows, total_trades
 
 
-def insert_trade_data(connection, backtesting_id, excel_data):
+def reprocess_processed_files(files=None):
     """
-    将excel数据写入trade表
+    重新解析processed目录中已写入的文件（修改解析逻辑或表结构后的重新处理、补数据），优先从解析缓存读取
+    :param files: 要重新处理的文件，默认processed目录中的所有Excel文件
+    :return: 生成器，yield (file_path, file_hash, backtesting_record, trade_rows, total_trades)
+    """
+    if files is None:
+        files = list(BACKTESTING_PROCESSED_DIR.glob("*.[xX][lL][sS]*")) + list(BACKTESTING_PROCESSED_DIR.glob("*.[cC][sS][vV]"))
+
+    for file_path in files:
+        file_hash = file_sha256(file_path)
+        try:
+            yield (file_path, file_hash) + parse_backtesting_file(file_path, file_hash)
+        except Exception as e:
+            print(f"解析文件失败: {file_path.name}: {e}")
+
+
+def add_to_local_analytics(items):
+    """
+    将已提交的回测同步写入本地分析库（analytics.py），失败不影响RDS写入
+    :param items: [(backtesting_id, backtesting_record, trade_rows), ...]
+    """
+    from analytics import get_local_analytics
+    try:
+        local_analytics = get_local_analytics()
+        for backtesting_id, backtesting_record, trade_rows in items:
+            local_analytics.add_backtesting(backtesting_id, backtesting_record, trade_rows)
+    except Exception as e:
+        print(f"写入本地分析库失败: {e}")
+
+
+def backfill_local_analytics(files=None):
+    """
+    将processed目录中已写入RDS的文件补写到本地分析库（backtesting_id从写入索引中查询）
+    :param files: 要补写的文件，默认processed目录中的所有Excel文件
+    :return: 补写的文件数
+    """
+    ingest_index = get_ingest_index()
+    count = 0
+    for file_path, file_hash, backtesting_record, trade_rows, _ in reprocess_processed_files(files):
+        backtesting_id = ingest_index.lookup_file(file_hash)
+        if backtesting_id is None:
+            print(f"写入索引中没有该文件，跳过: {file_path.name}")
+            continue
+        add_to_local_analytics([(backtesting_id, backtesting_record, trade_rows)])
+        count += 1
+    print(f"本地分析库补写 {count} 个文件")
+    return count
+
+
+@timed('transaction')
+def write_backtesting_transaction(connection, batch_rows, files=None):
+    """
+    在一个事务中写入一个或多个文件的backtesting行和trade行，只commit一次，异常时抛出（由调用方回滚/重试）
     :param connection: 数据库连接实例
-    :param backtesting_id: int
-    :param excel_data: dict
+    :param batch_rows: [(backtesting_record, trade_rows), ...]
+    :param files: [(file_hash, file_name), ...]，COMMIT之前记录为待确认的提交（record_pending_commits）
+    :return: list，每个文件的backtesting_id
+    """
+    backtesting_ids = []
+    try:
+        with connection.cursor() as cursor:
+            for backtesting_record, trade_rows in batch_rows:
+                if INGEST_RELOAD:
+                    backtesting_id = reload_backtesting_data(cursor, backtesting_record, trade_rows)
+                else:
+                    backtesting_id = insert_backtesting_data(cursor, backtesting_record)
+                    insert_trade_data(cursor, backtesting_id, trade_rows)
+                backtesting_ids.append(backtesting_id)
+        record_pending_commits(files, backtesting_ids, [record for record, _ in batch_rows])
+        commit_transaction(connection, backtesting_ids)
+    except BaseException:
+        dimension_cache.rollback()
+        raise
+
+    dimension_cache.commit()
+    return backtesting_ids
+
+
+def backtesting_rows_committed(connection, backtesting_ids, backtesting_records):
+    """
+    提交时连接断开后，在新连接上确认事务是否已提交（reload.backtesting_committed）
+    重新写入模式下重新执行本身是幂等的，直接返回False重新执行
+    :param connection: 数据库连接实例
+    :param backtesting_ids: 事务中分配的backtesting_id
+    :param backtesting_records: 对应的build_backtesting_record返回值
     :return: bool
     """
-    # 1. 从excel获取数据
-    trades = excel_data['List of trades']
+    if INGEST_RELOAD:
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(committed_backtesting_query(backtesting_ids), backtesting_ids)
+        return backtesting_committed(cursor.fetchall(), backtesting_ids, backtesting_records)
 
-    # 统计成功插入的交易记录数
-    total_insert_num = total_trades = len(trades['A']) - 1
 
-    # 2. 批量插入数据
+def write_backtesting_batch(pool, batch_rows, files=None):
+    """
+    从连接池取连接，在一个事务中写入多个文件，连接断开等可重试错误时整个事务重试
+    :param pool: ConnectionPool
+    :param batch_rows: [(backtesting_record, trade_rows), ...]
+    :param files: [(file_hash, file_name), ...]，见write_backtesting_transaction
+    :return: list，每个文件的backtesting_id，失败返回None
+    """
+    try:
+        return pool.run_in_transaction(
+            write_backtesting_transaction, batch_rows, files,
+            verify_commit=lambda connection, backtesting_ids: backtesting_rows_committed(
+                connection, backtesting_ids, [record for record, _ in batch_rows]
+            )
+        )
+    except Error as e:
+        print_db_error(e)
+
+
+def write_backtesting_file(pool, backtesting_record, trade_rows):
+    """
+    在一个事务中写入单个文件
+    :param pool: ConnectionPool
+    :param backtesting_record: build_backtesting_record的返回值
+    :param trade_rows: build_trade_rows返回的trade行
+    :return: backtesting_id，失败返回None
+    """
+    if not trade_rows:
+        print("警告：没有有效的交易记录可写入")
+        return None
+
+    backtesting_ids = write_backtesting_batch(pool, [(backtesting_record, trade_rows)])
+    return backtesting_ids[0] if backtesting_ids else None
+
+
+def is_streaming_file(file_path):
+    """超过STREAMING_FILE_SIZE的文件分块写入，不在解析阶段整表解析"""
+    return os.path.getsize(file_path) > STREAMING_FILE_SIZE
+
+
+def streaming_item(file_path, file_hash):
+    """
+    分块写入的文件在批次中的占位（backtesting_record、trade_rows为None，写入时再读取文件）
+    :return: 与parse_backtesting_file结果拼接后的批次元素格式相同
+    """
+    return file_path, file_hash, None, None, 0
+
+
+def write_backtesting_streaming_transaction(connection, excel_path, backtesting_record, chunk_rows, file_hash=None):
+    """
+    在一个事务中写入backtesting行，再逐块读取、转换、写入List of trades，最后只commit一次
+    每块写入后即释放，内存占用与交易数无关；任何一块失败整个文件回滚
+    重新写入模式下已存储同一回测时，更新backtesting行并删除原有trade行后整体重写（不逐行对比，避免整表读入内存）
+    :param connection: 数据库连接实例
+    :param excel_path: Path
+    :param backtesting_record: build_backtesting_record的返回值
+    :param chunk_rows: 每块的交易行数
+    :param file_hash: 文件内容sha256，COMMIT之前记录为待确认的提交（record_pending_commits）
+    :return: (backtesting_id, 写入的trade行数, 交易总行数)，没有有效交易记录时回滚并返回(None, 0, 交易总行数)
+    """
+    written = total = 0
     try:
         with connection.cursor() as cursor:
-            insert_query = """
-            INSERT INTO Trade (
-                backtesting_id, trade_id, trade_type, signal_type, exec_time, exec_price, quantity,
-                pnl_absolute, pnl_percent, runup_absolute, runup_percent, 
-                drawdown_absolute, drawdown_percent, cumulative_pnl_absolute, cumulative_pnl_percent
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
-
-            # 小数点后位数
-            getcontext().prec = 8
-
-            def parse_decimal(value):
-                return Decimal(str(value).replace(',', '').strip()) # value有的是str有的是float，所以统一str()
-
-            # 2. 准备批量插入数据
-            batch_data = []
-            for i in range(1, len(trades['A'])):
-                try:
-                    # 获取当前行数据
-                    trade_num = trades['A'][i]
-                    trade_type = trades['B'][i].lower()
-
-                    trade_data = (
-                        backtesting_id,
-                        int(trade_num),
-                        trade_type,
-                        str(trades['C'][i]),
-                        datetime.strptime(str(trades['D'][i]), "%Y-%m-%d %H:%M:%S"),
-                        parse_decimal(trades['E'][i]),  # 价格
-                        int(trades['F'][i]),            # Quantity
-                        parse_decimal(trades['G'][i]),  # P&L金额
-                        parse_decimal(trades['H'][i]),  # P&L%
-                        parse_decimal(trades['I'][i]),  # Run-up金额
-                        parse_decimal(trades['J'][i]),  # Run-up%
-                        parse_decimal(trades['K'][i]),  # Drawdown金额
-                        parse_decimal(trades['L'][i]),  # Drawdown%
-                        parse_decimal(trades['M'][i]),  # 累计P&L金额
-                        parse_decimal(trades['N'][i])   # 累计P&L%
-                    )
-
-                    batch_data.append(trade_data)
-
-                except Exception as e:
-                    print(f"跳过格式错误的交易记录 #{trade_num}: {str(e)}")
-                    total_insert_num -= 1
-                    continue
-            # 批量执行插入
-            if batch_data:
-                cursor.executemany(insert_query, batch_data)
-                connection.commit()
-                print(f"成功写入 {total_insert_num}/{total_trades} 条交易记录")
-                return True
+            if INGEST_RELOAD:
+                backtesting_id, existed = reload_backtesting_row(cursor, backtesting_record)
+                if existed:
+                    delete_all_trades(cursor, backtesting_id)
             else:
-                print("警告：没有有效的交易记录可写入")
-                return False
-
-    except IntegrityError as e:
-        # 处理唯一约束、外键约束等违反完整性错误
-        connection.rollback()
-        print(f"数据完整性错误: {e}. 已回滚事务")
-
-    except DataError as e:
-        # 处理数据格式、类型等错误
-        connection.rollback()
-        print(f"数据处理错误: {e}. 已回滚事务")
-
-    except ProgrammingError as e:
-        # 处理SQL语法错误、表不存在等问题
-        connection.rollback()
-        print(f"SQL编程错误: {e}. 已回滚事务")
-
-    except OperationalError as e:
-        # 处理数据库操作错误，如连接断开等
-        connection.rollback()
-        print(f"数据库操作错误: {e}. 已回滚事务")
-
-        # 断开连接
-        if 'Lost connection' in str(e):
-            print("您已断开数据库连接")
-
-    except InternalError as e:
-        # 处理数据库内部错误
-        connection.rollback()
-        print(f"数据库内部错误: {e}. 已回滚事务")
-
-    except NotSupportedError as e:
-        # 处理不支持的数据库特性
-        connection.rollback()
-        print(f"不支持的数据库特性: {e}. 已回滚事务")
-
-    except Error as e:
-        # 捕获其他PyMySQL错误
-        connection.rollback()
-        print(f"数据库错误: {e}. 已回滚事务")
+                backtesting_id = insert_backtesting_data(cursor, backtesting_record)
+            chunks = iter_sheet_chunks(excel_path, 'List of trades', chunk_rows)
+            for trade_rows, chunk_total in iter_trade_row_chunks(chunks):
+                if trade_rows:
+                    insert_trade_data(cursor, backtesting_id, trade_rows)
+                written += len(trade_rows)
+                total += chunk_total
+        if not written:
+            connection.rollback()
+            dimension_cache.rollback()
+            return None, 0, total
+        if file_hash:
+            record_pending_commits([(file_hash, excel_path.name)], [backtesting_id], [backtesting_record])
+        commit_transaction(connection, (backtesting_id, written, total))
+    except BaseException:
+        dimension_cache.rollback()
+        raise
+
+    dimension_cache.commit()
+    return backtesting_id, written, total
+
+
+def processed_path(file_name):
+    """
+    processed目录中不与已有文件重名的路径：同名文件已存在时依次尝试 文件名_1、文件名_2 ...（调用方持有processed_move_lock）
+    :param file_name: 文件名
+    :return: Path
+    """
+    target = BACKTESTING_PROCESSED_DIR / file_name
+    index = 0
+    while target.exists():
+        index += 1
+        target = BACKTESTING_PROCESSED_DIR / f"{Path(file_name).stem}_{index}{Path(file_name).suffix}"
+    return target
 
 
-def insert_backtesting_excel_to_db(connection, excel_path):
+def move_to_processed(file_path, file_hash=None):
     """
-    将回测数据写入数据库
-    :param excel_path: 回测文件路径
+    提交成功（或已写入过）后将文件移动到processed目录，不覆盖processed目录中的同名文件
+    :param file_hash: 文件内容sha256，记录到运行日志（None时保留原有的值）
     :return: bool
     """
-    print("--开始insert_backtesting_excel_to_db--")
-
     try:
-        excel_data = parse_excel(excel_path)
-
-        # 1. 写入backtesting表（引用ticker_id）
-        print("---开始insert_backtesting_data---")
-        backtesting_id = insert_backtesting_data(connection, excel_data, excel_path.name)
-        if not backtesting_id:
-            print("写入backtesting表失败！")
-            db_log(f"Backtesting table insertion failed for file: {excel_path}")
-            return False
-
-        # 2. 写入trade表
-        print("---开始insert_trade_data---")
-        success = insert_trade_data(connection, backtesting_id, excel_data)
-        if not success:
-            print("写入trade表失败！")
-            db_log(f"Trade table insertion failed for backtesting ID: {backtesting_id}, file: {excel_path}")
-            return False
-
-        print("回测数据写入成功：", excel_path.name)
+        with span('move_file', file=file_path.name), processed_move_lock:
+            target = processed_path(file_path.name)
+            shutil.move(file_path, target)
+        if target.name != file_path.name:
+            print(f"processed目录中已有同名文件，改名为: {target.name}")
+        print(f"成功移动并删除文件: {file_path.name}")
+        journal_record(file_path.name, 'moved', file_hash)
         return True
+    except Exception as e:
+        # 移动删除文件异常，此时new目录仍有该文件
+        print(f"移动删除文件失败： {file_path.name}: {str(e)}")
+        return False
+
 
+@timed('write_streaming_file')
+def write_streaming_file(pool, file_path, file_hash, chunk_rows=TRADE_CHUNK_ROWS):
+    """
+    分块写入单个大文件并移动到processed目录（小sheet整表解析，List of trades分块）
+    :param pool: ConnectionPool
+    :param file_path: Path
+    :param file_hash: 文件内容sha256
+    :param chunk_rows: 每块的交易行数
+    :return: (成功的文件数, 写入的行数)
+    """
+    print(f"-分块写入大文件{file_path.name}-")
+    try:
+        backtesting_record = build_backtesting_record(parse_excel(file_path, BACKTESTING_SHEETS[:-1]), file_path.name)
+        backtesting_id, written, total_trades = pool.run_in_transaction(
+            write_backtesting_streaming_transaction, file_path, backtesting_record, chunk_rows, file_hash,
+            verify_commit=lambda connection, result: backtesting_rows_committed(
+                connection, [result[0]], [backtesting_record]
+            )
+        )
+    except Error as e:
+        print_db_error(e)
+        backtesting_id = None
     except Exception as e:
-        print(e)
+        record_parse_failure(file_path, e)
+        return 0, 0
+
+    if backtesting_id is None:
+        print(f"文件写入数据库失败，无法移动删除: {file_path.name}")
+        db_log(f"Backtesting/Trade insertion failed for file: {file_path}")
+        journal_record(file_path.name, 'failed')
+        return 0, 0
 
+    record_committed_files([(file_hash, file_path.name, backtesting_id)])
+    print(f"成功写入 {written}/{total_trades} 条交易记录: {file_path.name}")
+    if not move_to_processed(file_path):
+        return 0, 0
+    return 1, written + 1
 
-def insert_backtesting_to_db():
+
+def write_and_move_batch(pool, batch):
+    """
+    将一批已解析的文件在一个事务中写入并移动到processed目录
+    整批失败且多于一个文件时，逐个文件重新写入，避免一个坏文件拖累同批的其他文件
+    分块写入的大文件（streaming_item）各自一个事务
+    :param pool: ConnectionPool
+    :param batch: [(file_path, file_hash, backtesting_record, trade_rows, total_trades), ...]
+    :return: (成功的文件数, 写入的行数)
+    """
+    if any(item[2] is None for item in batch):
+        success_files, success_rows = write_and_move_batch(pool, [item for item in batch if item[2] is not None])
+        for file_path, file_hash, _, _, _ in (item for item in batch if item[2] is None):
+            files, rows = write_streaming_file(pool, file_path, file_hash)
+            success_files += files
+            success_rows += rows
+        return success_files, success_rows
+
+    valid_batch = []
+    for item in batch:
+        if item[3]:
+            valid_batch.append(item)
+        else:
+            print(f"警告：没有有效的交易记录可写入，无法移动删除: {item[0].name}")
+    if not valid_batch:
+        return 0, 0
+
+    journal_record_many([(file_path.name, file_hash, None) for file_path, file_hash, _, _, _ in valid_batch], 'parsed')
+    backtesting_ids = write_backtesting_batch(
+        pool, [(record, trade_rows) for _, _, record, trade_rows, _ in valid_batch],
+        [(file_hash, file_path.name) for file_path, file_hash, _, _, _ in valid_batch]
+    )
+    if not backtesting_ids:
+        if len(valid_batch) > 1:
+            print(f"批量写入 {len(valid_batch)} 个文件失败，改为逐个写入")
+            success_files = success_rows = 0
+            for item in valid_batch:
+                files, rows = write_and_move_batch(pool, [item])
+                success_files += files
+                success_rows += rows
+            return success_files, success_rows
+
+        file_path = valid_batch[0][0]
+        print(f"文件写入数据库失败，无法移动删除: {file_path.name}")
+        db_log(f"Backtesting/Trade insertion failed for file: {file_path}")
+        journal_record(file_path.name, 'failed')
+        return 0, 0
+
+    # 记录内容hash，再次出现的相同文件在解析前跳过
+    record_committed_files([
+        (file_hash, file_path.name, backtesting_id)
+        for (file_path, file_hash, _, _, _), backtesting_id in zip(valid_batch, backtesting_ids)
+    ])
+
+    if ANALYTICS_ENABLED:
+        add_to_local_analytics([
+            (backtesting_id, record, trade_rows)
+            for (_, _, record, trade_rows, _), backtesting_id in zip(valid_batch, backtesting_ids)
+        ])
+
+    # 提交成功后才移动文件
+    success_files = success_rows = 0
+    for file_path, _, _, trade_rows, total_trades in valid_batch:
+        print(f"成功写入 {len(trade_rows)}/{total_trades} 条交易记录: {file_path.name}")
+        if not move_to_processed(file_path):
+            continue
+        success_files += 1
+        success_rows += len(trade_rows) + 1
+    return success_files, success_rows
+
+
+@timed('insert_backtesting_to_db', scope='run')
+def insert_backtesting_to_db(batch_size=INGEST_COMMIT_BATCH_SIZE):
     """
-    1.将待写入回测文件目录中的所有excel文件写入数据库
+    1.将待写入回测文件目录中的所有excel文件写入数据库（每batch_size个文件一个事务）
     2.将文件移动到processed目录
+    :param batch_size: 每个事务包含的文件数
     :return: bool
     """
     print("===== 开始insert_backtesting_to_db =====")
@@ -421,44 +832,38 @@ def insert_backtesting_to_db():
         print("警告：文件目录不存在")
         return False
 
-    # 2. 获取所有Excel文件（支持xlsx、xls、csv）
-    files = list(BACKTESTING_NEW_DIR.glob("*.[xX][lL][sS]*")) + list(BACKTESTING_NEW_DIR.glob("*.[cC][sS][vV]"))
+    # 2. 获取所有Excel文件（支持xlsx、xls、csv），跳过已写入过的文件
+    files = skip_ingested_files(list_backtesting_files())
 
     if not files:
         print("没有待处理回测数据")
         return True
 
     # 3. 写入数据库+移动删除文件
-    # 创建数据库连接
-    connection = create_db_connection()
-    if not connection:
-        return False
-
-    # 遍历所有待写入回测文件
-    current_file = None
-    try:
-        for file_path in files:
-            print("-正在处理%s-" % file_path.name)
-            current_file = file_path
-            if insert_backtesting_excel_to_db(connection, file_path): # 成功写入数据库
-                # 构建目标路径
-                dest_path = BACKTESTING_PROCESSED_DIR / file_path.name
-                # 移动并删除文件
-                shutil.move(file_path, dest_path)
-                print(f"成功移动并删除文件: {file_path.name}")
-            else: # 写入数据库失败
-                print(f"文件写入数据库失败，无法移动删除: {file_path.name}")
+    # 单连接的连接池：每个事务开始前ping检查，断开则重连并重试该事务
+    pool = ConnectionPool(size=1)
+
+    # 遍历所有待写入回测文件，凑满batch_size个文件后一起提交
+    batch = []
+    for i, (file_path, file_hash) in enumerate(files):
+        print("-正在处理%s-" % file_path.name)
+        try:
+            if is_streaming_file(file_path):
+                batch.append(streaming_item(file_path, file_hash))
+            else:
+                batch.append((file_path, file_hash) + parse_backtesting_file(file_path, file_hash))
+        except Exception as e:
+            record_parse_failure(file_path, e)
 
-    except Exception as e:
-        # 移动删除文件异常，此时new目录仍有待处理文件
-        print(f"移动删除文件失败： {current_file.name}: {str(e)}")
+        if batch and (len(batch) >= batch_size or i == len(files) - 1):
+            write_and_move_batch(pool, batch)
+            batch = []
 
     # 4.关闭数据库连接
-    if connection.open: # 两种情况：①数据库连接正常，但某个文件移动删除出现异常 ②一切正常，全部文件移动删除完成
-        connection.close()
-        print("数据库连接已正常关闭")
-    else:
-        print("数据库连接异常中断！@insert_backtesting_to_db")
+    pool.close()
+    print("数据库连接已关闭")
+
+    print_dimension_cache_stats()
 
     if os.listdir(BACKTESTING_NEW_DIR):
         print("部分回测文件写入失败！")
@@ -467,6 +872,102 @@ def insert_backtesting_to_db():
     return True
 
 
+@timed('insert_backtesting_to_db_parallel', scope='run')
+def insert_backtesting_to_db_parallel(parse_workers=INGEST_PARSE_WORKERS, db_workers=INGEST_DB_WORKERS,
+                                      batch_size=INGEST_COMMIT_BATCH_SIZE):
+    """
+    insert_backtesting_to_db的并行版本
+    1.进程池解析excel并构建backtesting、trade行
+    2.线程池（共用连接池）每batch_size个文件一个事务提交，连接断开时重试该事务，提交成功后才移动到processed目录
+    3.打印本次运行的 文件/s、行/s
+    :param parse_workers: 解析进程数
+    :param db_workers: 写数据库线程数
+    :param batch_size: 每个事务包含的文件数
+    :return: bool
+    """
+    print("===== 开始insert_backtesting_to_db_parallel =====")
+
+    # 1. 判断目录是否存在
+    if not (os.path.exists(BACKTESTING_PROCESSED_DIR) and os.path.exists(BACKTESTING_NEW_DIR)):
+        print("警告：文件目录不存在")
+        return False
+
+    # 2. 获取所有Excel文件，跳过已写入过的文件
+    files = skip_ingested_files(list_backtesting_files())
+
+    if not files:
+        print("没有待处理回测数据")
+        return True
+
+    # 3. 写线程共用连接池
+    pool = ConnectionPool(size=db_workers)
+
+    # 4. 解析和写入并行进行：解析完的文件凑满batch_size个后交给写线程，一个事务提交
+    start_time = time.perf_counter()
+    success_files = 0
+    success_rows = 0
+
+    with ProcessPoolExecutor(max_workers=parse_workers) as parse_pool, \
+            ThreadPoolExecutor(max_workers=db_workers) as write_pool:
+        # 大文件不在进程池中整表解析，由写线程分块写入
+        parse_futures = {
+            parse_pool.submit(run_with_metrics, parse_backtesting_file, file_path, file_hash): (file_path, file_hash)
+            for file_path, file_hash in files if not is_streaming_file(file_path)
+        }
+        write_futures = [
+            write_pool.submit(write_and_move_batch, pool, [streaming_item(file_path, file_hash)])
+            for file_path, file_hash in files if is_streaming_file(file_path)
+        ]
+        batch = []
+
+        for future in as_completed(parse_futures):
+            file_path, file_hash = parse_futures[future]
+            try:
+                batch.append((file_path, file_hash) + merge_metrics(future.result()))
+            except Exception as e:
+                record_parse_failure(file_path, e)
+                continue
+            if len(batch) >= batch_size:
+                write_futures.append(write_pool.submit(write_and_move_batch, pool, batch))
+                batch = []
+        if batch:
+            write_futures.append(write_pool.submit(write_and_move_batch, pool, batch))
+
+        for future in as_completed(write_futures):
+            files_done, rows_done = future.result()
+            success_files += files_done
+            success_rows += rows_done
+
+    elapsed = time.perf_counter() - start_time
+
+    # 5.关闭数据库连接
+    pool.close()
+
+    print(f"共写入 {success_files}/{len(files)} 个文件，{success_rows} 行，耗时 {elapsed:.2f}s，"
+          f"{success_files / elapsed:.2f} 文件/s，{success_rows / elapsed:.0f} 行/s")
+    print_dimension_cache_stats()
+
+    if success_files < len(files):
+        print("部分回测文件写入失败！")
+        return False
+    print("全部回测文件写入成功！")
+    return True
+
+
 if __name__ == "__main__":
-    unzip_all_and_backup()
-    insert_backtesting_to_db()
+    from run_journal import start_run, finish_run
+    start_run(INGEST_MODE)
+    if INGEST_MODE == 'pipeline':
+        from pipeline import run_pipeline
+        run_pipeline()
+    else:
+        unzip_all_and_backup()
+        if INGEST_MODE == 'parallel':
+            insert_backtesting_to_db_parallel()
+        elif INGEST_MODE == 'async':
+            from async_ingest import insert_backtesting_to_db_async
+            insert_backtesting_to_db_async()
+        else:
+            insert_backtesting_to_db()
+    finish_run(not list_backtesting_files())
+    write_metrics_report(INGEST_MODE)
@@ -0,0 +1,262 @@
+"""
+本地分析库（DuckDB）：不访问RDS，在本地对已写入的回测做聚合查询
+
+- add_backtesting：写入与insert_backtesting_data、insert_trade_data相同的行
+- top_strategies：按净利润或夏普比率排名前N的回测
+- ticker_rollup：按交易所+品种汇总
+- equity_curve：由cumulative_pnl_absolute重建权益曲线和回撤
+- max_drawdowns：每个回测的最大回撤（窗口函数一次算出），用于按策略看回撤分布
+- add_simulations：批量写入simulate.py按手续费、滑点重算的结果
+需要安装duckdb
+"""
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+
+from config import ANALYTICS_DB_PATH
+from schema import BACKTESTING_FIELDS, TRADE_FIELDS, SIMULATION_METRICS
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+
+# 不需要存入本地库的大字段以外，额外提取的排序指标：(列名, sheet字段, 指标key)
+EXTRACTED_METRICS = (
+    ('net_profit', 'performance', 'net_profit'),
+    ('sharpe_ratio', 'risk_performance_ratios', 'sharpe_ratio'),
+    ('sortino_ratio', 'risk_performance_ratios', 'sortino_ratio'),
+)
+
+BACKTESTING_TYPES = {
+    'trading_range_start': 'TIMESTAMP', 'trading_range_end': 'TIMESTAMP',
+    'backtesting_range_start': 'TIMESTAMP', 'backtesting_range_end': 'TIMESTAMP', 'start_date': 'TIMESTAMP',
+    'point_value': 'DOUBLE', 'tick_size': 'DOUBLE', 'initial_capital': 'DOUBLE', 'commission': 'DOUBLE',
+    'long_margin': 'DOUBLE', 'short_margin': 'DOUBLE',
+    'order_size': 'BIGINT', 'pyramiding': 'BIGINT', 'slippage': 'BIGINT', 'verify_price_ticks': 'BIGINT',
+}
+
+TRADE_TYPES = {
+    'trade_id': 'BIGINT', 'trade_type': 'VARCHAR', 'signal_type': 'VARCHAR', 'exec_time': 'TIMESTAMP',
+    'quantity': 'BIGINT',
+}
+
+
+def metric_value(sheet_json, key):
+    """
+    从performance等JSON中取All_USDT（没有时取All_percent）
+    :return: float，没有该指标返回None
+    """
+    metric = json.loads(sheet_json).get(key)
+    if not metric:
+        return None
+    value = metric.get('All_USDT')
+    if value is None:
+        value = metric.get('All_percent')
+    try:
+        return float(str(value).replace(',', '').rstrip('%'))
+    except (TypeError, ValueError):
+        return None
+
+
+class LocalAnalytics:
+    def __init__(self, path=ANALYTICS_DB_PATH):
+        """
+        :param path: DuckDB文件路径，':memory:'表示内存库
+        """
+        if duckdb is None:
+            raise ImportError("LocalAnalytics需要安装duckdb")
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = duckdb.connect(str(path))
+        self.create_tables()
+
+    def create_tables(self):
+        backtesting_columns = ['backtesting_id BIGINT PRIMARY KEY', 'exchange VARCHAR']
+        backtesting_columns += [f"{field} {BACKTESTING_TYPES.get(field, 'VARCHAR')}"
+                                for field in BACKTESTING_FIELDS if field != 'ticker_id']
+        backtesting_columns += [f"{column} DOUBLE" for column, _, _ in EXTRACTED_METRICS]
+        trade_columns = [f"{field} {TRADE_TYPES.get(field, 'DOUBLE')}" for field in TRADE_FIELDS if field != 'backtesting_id']
+        with self.lock:
+            self.db.execute(f"create table if not exists backtesting ({', '.join(backtesting_columns)})")
+            self.db.execute(f"create table if not exists trade (backtesting_id BIGINT, {', '.join(trade_columns)})")
+            self.db.execute(
+                "create table if not exists simulation (backtesting_id BIGINT, commission DOUBLE, slippage DOUBLE, "
+                + ', '.join(f"{metric} DOUBLE" for metric in SIMULATION_METRICS)
+                + ", primary key (backtesting_id, commission, slippage))"
+            )
+
+    def add_backtesting(self, backtesting_id, backtesting_record, trade_rows):
+        """
+        写入一个回测（已存在则先删除，可重复写入）
+        :param backtesting_id: RDS中的backtesting_id
+        :param backtesting_record: build_backtesting_record的返回值
+        :param trade_rows: build_trade_rows返回的trade行
+        """
+        exchange, _, _, backtesting_row = backtesting_record
+        fields = [field for field in BACKTESTING_FIELDS if field != 'ticker_id']
+        values = dict(zip(fields, backtesting_row))
+        backtesting_df = pd.DataFrame([
+            [backtesting_id, exchange] + list(backtesting_row)
+            + [metric_value(values[sheet], key) for _, sheet, key in EXTRACTED_METRICS]
+        ], columns=['backtesting_id', 'exchange'] + fields + [column for column, _, _ in EXTRACTED_METRICS])
+
+        # trade行按列构建DataFrame，Decimal列转成float
+        trade_fields = TRADE_FIELDS[1:]
+        columns = list(zip(*trade_rows)) if trade_rows else [[] for _ in trade_fields]
+        trade_df = pd.DataFrame({
+            field: (column if TRADE_TYPES.get(field, 'DOUBLE') != 'DOUBLE' else np.array(column, dtype=float))
+            for field, column in zip(trade_fields, columns)
+        })
+        trade_df.insert(0, 'backtesting_id', backtesting_id)
+
+        with self.lock:
+            self.db.execute("begin transaction")
+            try:
+                self.db.execute("delete from trade where backtesting_id = ?", [backtesting_id])
+                self.db.execute("delete from backtesting where backtesting_id = ?", [backtesting_id])
+                self.db.register('backtesting_df', backtesting_df)
+                self.db.register('trade_df', trade_df)
+                self.db.execute("insert into backtesting by name select * from backtesting_df")
+                self.db.execute("insert into trade by name select * from trade_df")
+                self.db.execute("commit")
+            except BaseException:
+                self.db.execute("rollback")
+                raise
+            finally:
+                self.db.unregister('backtesting_df')
+                self.db.unregister('trade_df')
+
+    def add_simulations(self, results):
+        """
+        批量写入重算结果，同一回测同一参数的旧结果被覆盖
+        :param results: pandas.DataFrame，simulate.run_simulations的返回值
+        """
+        with self.lock:
+            self.db.register('simulation_df', results)
+            try:
+                self.db.execute("insert or replace into simulation by name select * from simulation_df")
+            finally:
+                self.db.unregister('simulation_df')
+
+    def query(self, sql, params=None):
+        """
+        执行查询
+        :return: pandas.DataFrame
+        """
+        with self.lock:
+            return self.db.execute(sql, params or []).df()
+
+    def top_strategies(self, metric='net_profit', n=10):
+        """
+        按指标排名前N的回测
+        :param metric: 'net_profit'、'sharpe_ratio'或'sortino_ratio'
+        :param n: int
+        :return: pandas.DataFrame
+        """
+        if metric not in {column for column, _, _ in EXTRACTED_METRICS}:
+            raise ValueError(f"Unknown metric: {metric}")
+        return self.query(f"""
+            select backtesting_id, strategy, exchange, symbol, timeframe, net_profit, sharpe_ratio, sortino_ratio
+            from backtesting
+            where {metric} is not null
+            order by {metric} desc
+            limit ?
+        """, [n])
+
+    def ticker_rollup(self):
+        """
+        按交易所+品种汇总：回测数、策略数、净利润、交易数、胜率
+        :return: pandas.DataFrame
+        """
+        return self.query("""
+            with exits as (
+                select backtesting_id, count(*) as trades, count(*) filter (where pnl_absolute > 0) as wins
+                from trade
+                where trade_type ilike 'exit%'
+                group by backtesting_id
+            )
+            select b.exchange, b.symbol,
+                   count(*) as backtests,
+                   count(distinct b.strategy) as strategies,
+                   avg(b.net_profit) as avg_net_profit,
+                   max(b.net_profit) as max_net_profit,
+                   sum(e.trades) as trades,
+                   sum(e.wins) / nullif(sum(e.trades), 0) as win_rate
+            from backtesting b
+            left join exits e using (backtesting_id)
+            group by b.exchange, b.symbol
+            order by avg_net_profit desc nulls last
+        """)
+
+    def equity_curve(self, backtesting_id):
+        """
+        由平仓记录的cumulative_pnl_absolute重建权益曲线
+        :param backtesting_id: int
+        :return: dict，exec_time、equity（初始资金+累计盈亏）、drawdown（相对历史最高点，从初始资金算起）均为numpy数组
+        """
+        with self.lock:
+            initial_capital = self.db.execute(
+                "select initial_capital from backtesting where backtesting_id = ?", [backtesting_id]
+            ).fetchone()
+            arrays = self.db.execute("""
+                select exec_time, cumulative_pnl_absolute
+                from trade
+                where backtesting_id = ? and trade_type ilike 'exit%'
+                order by trade_id, exec_time
+            """, [backtesting_id]).fetchnumpy()
+
+        initial_capital = float(initial_capital[0]) if initial_capital and initial_capital[0] else 0.0
+        equity = initial_capital + np.asarray(arrays['cumulative_pnl_absolute'], dtype=float)
+        # 历史最高点从初始资金开始：第一笔就亏损时回撤不为0
+        peak = np.maximum.accumulate(np.concatenate(([initial_capital], equity)))[1:]
+        drawdown = equity - peak
+        return {'exec_time': np.asarray(arrays['exec_time']), 'equity': equity, 'drawdown': drawdown}
+
+    def max_drawdowns(self, strategy=None):
+        """
+        每个回测的最大回撤（基于累计盈亏的历史最高点，最高点从0开始，即从初始资金算起）
+        :param strategy: 只看某个策略，None表示全部
+        :return: pandas.DataFrame，backtesting_id、strategy、symbol、max_drawdown
+        """
+        return self.query("""
+            with curve as (
+                select backtesting_id, cumulative_pnl_absolute as pnl,
+                       greatest(max(cumulative_pnl_absolute) over (
+                           partition by backtesting_id order by trade_id, exec_time
+                           rows between unbounded preceding and current row
+                       ), 0) as peak
+                from trade
+                where trade_type ilike 'exit%'
+            )
+            select b.backtesting_id, b.strategy, b.symbol, min(least(c.pnl - c.peak, 0)) as max_drawdown
+            from curve c
+            join backtesting b using (backtesting_id)
+            where ? is null or b.strategy = ?
+            group by b.backtesting_id, b.strategy, b.symbol
+            order by max_drawdown
+        """, [strategy, strategy])
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+_local_analytics = None
+_local_analytics_lock = threading.Lock()
+
+
+def get_local_analytics():
+    """
+    进程内共享的本地分析库实例（首次使用时打开）
+    :return: LocalAnalytics
+    """
+    global _local_analytics
+    with _local_analytics_lock:
+        if _local_analytics is None:
+            ANALYTICS_DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+            _local_analytics = LocalAnalytics()
+        return _local_analytics
@@ -0,0 +1,539 @@
+"""
+asyncio写入模式（INGEST_MODE = 'async'，需要aiomysql）
+
+与insert_backtesting_to_db / insert_backtesting_to_db_parallel写入同样的行，区别在于等待RDS往返时不阻塞：
+- 每个文件一个协程、一个事务，最多ASYNC_INGEST_CONCURRENCY个文件同时解析或写入（aiomysql连接池大小相同），
+  解析前先占用并发名额，内存中最多同时持有ASYNC_INGEST_CONCURRENCY个已解析的文件
+- excel解析在进程池中执行（run_in_executor），大文件的List of trades分块读取在线程池中执行
+- 维表缓存（AsyncDimensionCache）与DimensionCache共用查询语句和缓存逻辑，只重写IO部分，未提交的插入按协程（contextvars）隔离
+- Trade表的分块多行INSERT语句与bulk_loader.insert_trades_chunked共用（insert_trades_statements）
+- 连接断开、死锁等可重试错误时回滚并按指数退避重试整个文件的事务，与ConnectionPool.run_in_transaction相同；
+  COMMIT时连接断开先确认是否已提交，确认未提交才重试
+- 提交成功后记录写入索引、（ANALYTICS_ENABLED时）写入本地分析库、移动到processed目录
+- 结束时打印 文件/s、行/s，与parallel模式同一批文件对比吞吐量
+Trade表固定用分块多行INSERT（BULK_INSERT_ROWS行一条语句），不支持load_data模式
+INGEST_RELOAD时与write_backtesting_transaction相同：已存储同一回测时更新该行，只写入有变化的trade行（reload.py）
+"""
+import asyncio
+import contextvars
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from pymysql import Error
+
+from config import *
+from bulk_loader import insert_trades_statements
+from db_pool import SQL_CONVERSIONS, CommitUnknownError, is_connection_lost, is_retryable
+from dimension_cache import DimensionCache, NAME_TABLES, EXCHANGETICKER_WARM_QUERY, EXCHANGETICKER_SELECT_QUERY, \
+    EXCHANGETICKER_INSERT_QUERY, name_warm_query, name_select_query, name_insert_query
+from reload import FIND_BACKTESTING_QUERY, BACKTESTING_UPDATE_QUERY, FETCH_TRADES_QUERY, DELETE_ALL_TRADES_QUERY, \
+    find_backtesting_params, match_backtesting, update_backtesting_params, stored_trades, diff_trades, \
+    delete_trades_query, committed_backtesting_query, backtesting_committed
+from instrumentation import span, timed, run_with_metrics, merge_metrics
+from trade_rows import iter_trade_row_chunks
+from utils import parse_excel, iter_sheet_chunks, print_db_error, db_log, BACKTESTING_SHEETS
+from run_journal import journal_record
+from Backtesting import BACKTESTING_INSERT_QUERY, build_backtesting_record, parse_backtesting_file, \
+    list_backtesting_files, skip_ingested_files, is_streaming_file, move_to_processed, add_to_local_analytics, \
+    record_committed_files, record_pending_commits
+
+try:
+    import aiomysql
+except ImportError:
+    aiomysql = None
+
+
+class AsyncDimensionCache(DimensionCache):
+    """
+    DimensionCache的asyncio版本：共享缓存、统计和查询语句不变，只把查询/插入改为await
+    所有协程在同一线程中运行，未提交的id不能放在threading.local中，改为按协程的contextvars隔离
+    """
+
+    def __init__(self, ttl=DIMENSION_CACHE_TTL):
+        super().__init__(ttl)
+        self.local_pending = contextvars.ContextVar('dimension_pending', default=None)
+
+    def pending(self):
+        pending = self.local_pending.get()
+        if pending is None:
+            pending = ({table: {} for table in NAME_TABLES}, {})
+            self.local_pending.set(pending)
+        return pending
+
+    def clear_pending(self):
+        self.local_pending.set(None)
+
+    async def warm(self, cursor):
+        name_rows = {}
+        for table in NAME_TABLES:
+            await cursor.execute(name_warm_query(table))
+            name_rows[table] = await cursor.fetchall()
+        await cursor.execute(EXCHANGETICKER_WARM_QUERY)
+        self.load(name_rows, await cursor.fetchall())
+
+    async def resolve(self, cursor, exchange, symbol, currency_name):
+        if self.needs_warm():
+            await self.warm(cursor)
+
+        ticker_id = await self.resolve_name(cursor, 'ticker', symbol)
+        currency_id = await self.resolve_name(cursor, 'currency', currency_name)
+        exchange_id = await self.resolve_name(cursor, 'exchange', exchange)
+        key = (ticker_id, currency_id, exchange_id)
+
+        exchangeticker_id = self.cached_exchangeticker(key)
+        if exchangeticker_id:
+            return exchangeticker_id
+
+        exchangeticker_id = await self.select_or_insert(
+            cursor, EXCHANGETICKER_SELECT_QUERY, EXCHANGETICKER_INSERT_QUERY, key
+        )
+        self.remember_exchangeticker(key, exchangeticker_id)
+        return exchangeticker_id
+
+    async def resolve_name(self, cursor, table, name):
+        row_id = self.cached_name(table, name)
+        if row_id:
+            return row_id
+
+        row_id = await self.select_or_insert(cursor, name_select_query(table), name_insert_query(table), (name,))
+        self.remember_name(table, name, row_id)
+        return row_id
+
+    async def select_or_insert(self, cursor, select_query, insert_query, params):
+        self.count_query()
+        await cursor.execute(select_query, params)
+        row = await cursor.fetchone()
+        if row:
+            return row['id']
+
+        self.count_query()
+        await cursor.execute(insert_query, params)
+        return cursor.lastrowid
+
+
+# 维表缓存，所有协程共享
+async_dimension_cache = AsyncDimensionCache()
+
+
+def aiomysql_config(config=None):
+    """
+    把pymysql.connect的参数转换成aiomysql.create_pool的参数
+    :param config: 默认config.db_config
+    :return: dict
+    """
+    config = dict(config or db_config)
+    config['db'] = config.pop('database')
+    config['cursorclass'] = aiomysql.DictCursor
+    config.setdefault('conv', SQL_CONVERSIONS)
+    config['autocommit'] = False
+    return config
+
+
+async def commit_transaction_async(connection, result=None):
+    """
+    db_pool.commit_transaction的asyncio版本：连接在提交过程中断开时抛出CommitUnknownError
+    :param result: 事务函数本来要返回的值，确认是否已提交时使用
+    """
+    try:
+        await connection.commit()
+    except Error as e:
+        if is_connection_lost(e):
+            raise CommitUnknownError(*e.args, result=result) from e
+        raise
+
+
+async def backtesting_rows_committed_async(connection, backtesting_ids, backtesting_records):
+    """
+    Backtesting.backtesting_rows_committed的asyncio版本
+    :return: bool
+    """
+    if INGEST_RELOAD:
+        return False
+    async with connection.cursor() as cursor:
+        await cursor.execute(committed_backtesting_query(backtesting_ids), backtesting_ids)
+        return backtesting_committed(await cursor.fetchall(), backtesting_ids, backtesting_records)
+
+
+async def insert_backtesting_data_async(cursor, backtesting_record):
+    """
+    insert_backtesting_data的asyncio版本（不提交事务）
+    :return: backtesting_id
+    """
+    exchange, symbol, currency_name, backtesting_row = backtesting_record
+    with span('dimension_lookup'):
+        ticker_id = await async_dimension_cache.resolve(cursor, exchange, symbol, currency_name)
+    with span('insert_backtesting'):
+        await cursor.execute(BACKTESTING_INSERT_QUERY, (ticker_id,) + backtesting_row)
+    return cursor.lastrowid
+
+
+async def insert_trade_data_async(cursor, backtesting_id, trade_rows, rows_per_statement=BULK_INSERT_ROWS):
+    """
+    分块多行INSERT写入trade行（不提交事务），语句与bulk_loader.insert_trades_chunked相同
+    :return: 写入的行数
+    """
+    with span('insert_trade', rows=len(trade_rows)):
+        for query, params in insert_trades_statements(backtesting_id, trade_rows, rows_per_statement):
+            await cursor.execute(query, params)
+    return len(trade_rows)
+
+
+async def reload_backtesting_row_async(cursor, backtesting_record):
+    """
+    Backtesting.reload_backtesting_row的asyncio版本（不提交事务）
+    :return: (backtesting_id, 是否已存储)
+    """
+    exchange, symbol, currency_name, backtesting_row = backtesting_record
+    with span('dimension_lookup'):
+        ticker_id = await async_dimension_cache.resolve(cursor, exchange, symbol, currency_name)
+
+    await cursor.execute(FIND_BACKTESTING_QUERY, find_backtesting_params(ticker_id, backtesting_row))
+    backtesting_id = match_backtesting(await cursor.fetchall(), backtesting_row)
+    with span('insert_backtesting'):
+        if backtesting_id is None:
+            await cursor.execute(BACKTESTING_INSERT_QUERY, (ticker_id,) + backtesting_row)
+            return cursor.lastrowid, False
+        await cursor.execute(BACKTESTING_UPDATE_QUERY,
+                             update_backtesting_params(backtesting_id, ticker_id, backtesting_row))
+    return backtesting_id, True
+
+
+async def reload_backtesting_data_async(cursor, backtesting_record, trade_rows):
+    """
+    Backtesting.reload_backtesting_data的asyncio版本（不提交事务）
+    :return: (backtesting_id, 写入的trade行数)
+    """
+    with span('reload_backtesting'):
+        backtesting_id, existed = await reload_backtesting_row_async(cursor, backtesting_record)
+        if not existed:
+            return backtesting_id, await insert_trade_data_async(cursor, backtesting_id, trade_rows)
+
+        await cursor.execute(FETCH_TRADES_QUERY, (backtesting_id,))
+        insert_rows, delete_ids, unchanged, stats = diff_trades(stored_trades(await cursor.fetchall()), trade_rows)
+        if delete_ids:
+            await cursor.execute(*delete_trades_query(backtesting_id, delete_ids))
+        if insert_rows:
+            await insert_trade_data_async(cursor, backtesting_id, insert_rows)
+    print(f"重新写入回测 {backtesting_id}：新增 {stats['added']}，修改 {stats['changed']}，"
+          f"删除 {stats['removed']}，不变 {unchanged}")
+    return backtesting_id, len(insert_rows)
+
+
+async def write_file_transaction(connection, backtesting_record, trade_rows, file=None):
+    """
+    在一个事务中写入一个已解析的文件
+    :param file: (file_hash, file_name)，COMMIT之前记录为待确认的提交（Backtesting.record_pending_commits）
+    :return: (backtesting_id, 写入的trade行数)
+    """
+    try:
+        async with connection.cursor() as cursor:
+            if INGEST_RELOAD:
+                backtesting_id, _ = await reload_backtesting_data_async(cursor, backtesting_record, trade_rows)
+            else:
+                backtesting_id = await insert_backtesting_data_async(cursor, backtesting_record)
+                await insert_trade_data_async(cursor, backtesting_id, trade_rows)
+        if file:
+            record_pending_commits([file], [backtesting_id], [backtesting_record])
+        await commit_transaction_async(connection, (backtesting_id, len(trade_rows)))
+    except BaseException:
+        async_dimension_cache.rollback()
+        raise
+
+    async_dimension_cache.commit()
+    return backtesting_id, len(trade_rows)
+
+
+async def write_streaming_transaction(connection, file_path, backtesting_record, file_hash=None, chunk_rows=TRADE_CHUNK_ROWS):
+    """
+    write_backtesting_streaming_transaction的asyncio版本：在线程池中逐块读取List of trades，每块写入后即释放
+    file_hash不为None时COMMIT之前记录为待确认的提交
+    :return: (backtesting_id, 写入的trade行数)，没有有效交易记录时回滚并返回(None, 0)
+    """
+    loop = asyncio.get_running_loop()
+    written = 0
+    try:
+        async with connection.cursor() as cursor:
+            if INGEST_RELOAD:
+                backtesting_id, existed = await reload_backtesting_row_async(cursor, backtesting_record)
+                if existed:
+                    await cursor.execute(DELETE_ALL_TRADES_QUERY, (backtesting_id,))
+            else:
+                backtesting_id = await insert_backtesting_data_async(cursor, backtesting_record)
+            chunks = iter_trade_row_chunks(iter_sheet_chunks(file_path, 'List of trades', chunk_rows))
+            while True:
+                chunk = await loop.run_in_executor(None, next, chunks, None)
+                if chunk is None:
+                    break
+                trade_rows, _ = chunk
+                if trade_rows:
+                    await insert_trade_data_async(cursor, backtesting_id, trade_rows)
+                written += len(trade_rows)
+        if not written:
+            await connection.rollback()
+            async_dimension_cache.rollback()
+            return None, 0
+        if file_hash:
+            record_pending_commits([(file_hash, file_path.name)], [backtesting_id], [backtesting_record])
+        await commit_transaction_async(connection, (backtesting_id, written))
+    except BaseException:
+        async_dimension_cache.rollback()
+        raise
+
+    async_dimension_cache.commit()
+    return backtesting_id, written
+
+
+def parse_backtesting_header(file_path):
+    """
+    大文件只解析List of trades以外的sheet，构建backtesting行（在进程池中执行）
+    :return: build_backtesting_record的返回值
+    """
+    return build_backtesting_record(parse_excel(file_path, BACKTESTING_SHEETS[:-1]), file_path.name)
+
+
+class AsyncIngester:
+    def __init__(self, pool, parse_pool, concurrency=ASYNC_INGEST_CONCURRENCY, retries=DB_RETRY_TIMES,
+                 base_delay=DB_RETRY_BASE_DELAY, max_delay=DB_RETRY_MAX_DELAY):
+        """
+        :param pool: aiomysql连接池
+        :param parse_pool: 解析excel的进程池
+        :param concurrency: 同时进行的文件事务数
+        :param retries: 事务最多重试次数
+        :param base_delay: 第一次重试前等待的秒数，之后每次翻倍
+        :param max_delay: 单次等待的最大秒数
+        """
+        self.pool = pool
+        self.parse_pool = parse_pool
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    async def run_in_transaction(self, func, *args, verify_commit=None):
+        """
+        ConnectionPool.run_in_transaction的asyncio版本：取一个连接执行func(connection, *args)，func内部负责commit
+        可重试错误（包括取连接时的错误）时回滚、关闭该连接并重试整个func，其他错误回滚后抛出
+        COMMIT时连接断开（CommitUnknownError）：没有verify_commit时不重试直接抛出；
+        否则在新连接上await verify_commit(connection, result)，已提交则返回result，确认未提交才重新执行func
+        :param verify_commit: 确认事务是否已提交的协程函数，返回bool
+        :return: func的返回值
+        """
+        attempt = 0
+        uncertain = None  # 提交结果未知的CommitUnknownError，下一次取到连接时先确认
+        while True:
+            connection = None
+            try:
+                connection = await self.pool.acquire()
+                if uncertain is not None:
+                    committed = await verify_commit(connection, uncertain.result)
+                    await connection.rollback()
+                    if committed:
+                        print("提交时连接断开，确认事务已提交，不再重试")
+                        self.pool.release(connection)
+                        return uncertain.result
+                    print("提交时连接断开，确认事务未提交，重新执行")
+                    uncertain = None
+                result = await func(connection, *args)
+            except CommitUnknownError as e:
+                if connection is not None:
+                    connection.close()
+                    self.pool.release(connection)
+                if verify_commit is None or attempt >= self.retries:
+                    raise
+                uncertain = e
+                delay = self.backoff(attempt)
+                attempt += 1
+                print(f"提交时数据库连接异常: {e}，{delay:.1f}s后确认是否已提交")
+                await asyncio.sleep(delay)
+                continue
+            except Error as e:
+                if connection is not None:
+                    try:
+                        await connection.rollback()
+                    except Error:
+                        pass
+                if not is_retryable(e) or attempt >= self.retries:
+                    if connection is not None:
+                        self.pool.release(connection)
+                    raise
+                if connection is not None:
+                    connection.close()
+                    self.pool.release(connection)
+                delay = self.backoff(attempt)
+                attempt += 1
+                print(f"数据库连接异常: {e}，{delay:.1f}s后第{attempt}次重试")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                if connection is not None:
+                    try:
+                        await connection.rollback()
+                    except Error:
+                        pass
+                    self.pool.release(connection)
+                raise
+
+            self.pool.release(connection)
+            return result
+
+    def backoff(self, attempt):
+        """第attempt次重试前的等待秒数（指数退避，带随机抖动）"""
+        return min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1)
+
+    async def parse(self, func, *args):
+        """在进程池中执行func，合并子进程中记录的计时"""
+        loop = asyncio.get_running_loop()
+        return merge_metrics(await loop.run_in_executor(self.parse_pool, run_with_metrics, func, *args))
+
+    async def ingest_file(self, file_path, file_hash):
+        """
+        write_and_move_file，任何异常（分块读取时的解析错误、写入索引或移动文件时的OSError等）只影响该文件：
+        记录到db_log、运行日志中标记为failed，不中断gather中的其他文件
+        :return: (成功的文件数, 写入的行数)
+        """
+        try:
+            return await self.write_and_move_file(file_path, file_hash)
+        except Exception as e:
+            print(f"写入文件失败: {file_path.name}: {type(e).__name__}: {e}")
+            db_log(f"Backtesting ingestion failed for file: {file_path}: {type(e).__name__}: {e}")
+            journal_record(file_path.name, 'failed')
+            return 0, 0
+
+    async def write_and_move_file(self, file_path, file_hash):
+        """
+        解析、写入（一个事务）并移动单个文件；解析前占用并发名额，写入提交后释放（已解析的文件不会无限堆积在内存中）
+        :return: (成功的文件数, 写入的行数)
+        """
+        async with self.semaphore:
+            print(f"-正在处理{file_path.name}-")
+            streaming = is_streaming_file(file_path)
+            try:
+                if streaming:
+                    backtesting_record = await self.parse(parse_backtesting_header, file_path)
+                    trade_rows, total_trades = None, None
+                else:
+                    backtesting_record, trade_rows, total_trades = await self.parse(
+                        parse_backtesting_file, file_path, file_hash
+                    )
+            except Exception as e:
+                print(f"解析文件失败: {file_path.name}: {e}")
+                db_log(f"Backtesting parsing failed for file: {file_path}: {type(e).__name__}: {e}")
+                journal_record(file_path.name, 'failed')
+                return 0, 0
+
+            if not streaming and not trade_rows:
+                print(f"警告：没有有效的交易记录可写入，无法移动删除: {file_path.name}")
+                return 0, 0
+            journal_record(file_path.name, 'parsed')
+
+            try:
+                with span('transaction', file=file_path.name):
+                    if streaming:
+                        backtesting_id, written = await self.run_in_transaction(
+                            write_streaming_transaction, file_path, backtesting_record, file_hash,
+                            verify_commit=lambda connection, result: backtesting_rows_committed_async(
+                                connection, [result[0]], [backtesting_record]
+                            )
+                        )
+                    else:
+                        backtesting_id, written = await self.run_in_transaction(
+                            write_file_transaction, backtesting_record, trade_rows, (file_hash, file_path.name),
+                            verify_commit=lambda connection, result: backtesting_rows_committed_async(
+                                connection, [result[0]], [backtesting_record]
+                            )
+                        )
+            except Error as e:
+                print_db_error(e)
+                backtesting_id = None
+
+        if backtesting_id is None:
+            print(f"文件写入数据库失败，无法移动删除: {file_path.name}")
+            db_log(f"Backtesting/Trade insertion failed for file: {file_path}")
+            journal_record(file_path.name, 'failed')
+            return 0, 0
+
+        record_committed_files([(file_hash, file_path.name, backtesting_id)])
+        if ANALYTICS_ENABLED and not streaming:
+            add_to_local_analytics([(backtesting_id, backtesting_record, trade_rows)])
+
+        print(f"成功写入 {written}/{total_trades if total_trades is not None else written} 条交易记录: {file_path.name}")
+        if not await asyncio.to_thread(move_to_processed, file_path):
+            return 0, 0
+        return 1, written + 1
+
+
+async def ingest_files_async(files, concurrency=ASYNC_INGEST_CONCURRENCY, parse_workers=INGEST_PARSE_WORKERS,
+                             config=None):
+    """
+    并发写入文件
+    :param files: [(file_path, file_hash), ...]
+    :param concurrency: 同时进行的文件事务数（也是连接池大小）
+    :param parse_workers: 解析进程数
+    :param config: pymysql.connect参数，默认config.db_config
+    :return: (成功的文件数, 写入的行数)
+    """
+    pool = await aiomysql.create_pool(minsize=1, maxsize=concurrency, **aiomysql_config(config))
+    print("成功连接到阿里云RDS数据库")
+    try:
+        # 先预热维表缓存，避免所有协程同时发现缓存过期、各自预热
+        async with pool.acquire() as connection:
+            async with connection.cursor() as cursor:
+                await async_dimension_cache.warm(cursor)
+
+        with ProcessPoolExecutor(max_workers=parse_workers) as parse_pool:
+            ingester = AsyncIngester(pool, parse_pool, concurrency)
+            results = await asyncio.gather(*(ingester.ingest_file(path, file_hash) for path, file_hash in files))
+    finally:
+        pool.close()
+        await pool.wait_closed()
+
+    return sum(files_done for files_done, _ in results), sum(rows for _, rows in results)
+
+
+@timed('insert_backtesting_to_db_async', scope='run')
+def insert_backtesting_to_db_async(concurrency=ASYNC_INGEST_CONCURRENCY, parse_workers=INGEST_PARSE_WORKERS):
+    """
+    insert_backtesting_to_db的asyncio版本：每个文件一个事务，最多concurrency个事务同时进行
+    :param concurrency: 同时进行的文件事务数
+    :param parse_workers: 解析进程数
+    :return: bool
+    """
+    print("===== 开始insert_backtesting_to_db_async =====")
+
+    if aiomysql is None:
+        print("警告：未安装aiomysql，无法使用async模式")
+        return False
+
+    # 1. 判断目录是否存在
+    if not (os.path.exists(BACKTESTING_PROCESSED_DIR) and os.path.exists(BACKTESTING_NEW_DIR)):
+        print("警告：文件目录不存在")
+        return False
+
+    # 2. 获取所有Excel文件，跳过已写入过的文件
+    files = skip_ingested_files(list_backtesting_files())
+
+    if not files:
+        print("没有待处理回测数据")
+        return True
+
+    # 3. 并发写入
+    start_time = time.perf_counter()
+    success_files, success_rows = asyncio.run(ingest_files_async(files, concurrency, parse_workers))
+    elapsed = time.perf_counter() - start_time
+
+    stats = async_dimension_cache.stats()
+    print(f"共写入 {success_files}/{len(files)} 个文件，{success_rows} 行，耗时 {elapsed:.2f}s，"
+          f"{success_files / elapsed:.2f} 文件/s，{success_rows / elapsed:.0f} 行/s（并发 {concurrency}）")
+    print(f"维表缓存：命中 {stats['hits']} 次，未命中 {stats['misses']} 次，未命中时查询 {stats['queries']} 次")
+
+    if success_files < len(files):
+        print("部分回测文件写入失败！")
+        return False
+    print("全部回测文件写入成功！")
+    return True
+
+
+if __name__ == "__main__":
+    insert_backtesting_to_db_async()
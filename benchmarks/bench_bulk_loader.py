@@ -0,0 +1,141 @@
+"""
+Trade表批量写入基准：executemany、分块多行INSERT（不同rows_per_statement）、LOAD DATA LOCAL INFILE
+
+需要本地MySQL/MariaDB（不要连生产库），通过环境变量配置：
+BENCH_DB_HOST（默认127.0.0.1）、BENCH_DB_PORT（默认3306）、BENCH_DB_USER（默认root）、BENCH_DB_PASSWORD、BENCH_DB_NAME（默认bench_backtesting）
+会在BENCH_DB_NAME库中重建Trade表
+计时前先检查insert和load_data两种模式写入的行完全相同（NULL、NaN、带微秒的datetime、需要转义的字符串）
+用法：python benchmarks/bench_bulk_loader.py [交易行数]
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pymysql
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bulk_loader import TRADE_FIELDS, build_multi_insert_query, bulk_insert_trades
+from db_pool import SQL_CONVERSIONS
+
+
+CREATE_TRADE_TABLE = """
+CREATE TABLE Trade (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    backtesting_id INT NOT NULL,
+    trade_id INT NOT NULL,
+    trade_type VARCHAR(32),
+    signal_type VARCHAR(64),
+    exec_time DATETIME,
+    exec_price DECIMAL(20, 8),
+    quantity INT,
+    pnl_absolute DECIMAL(20, 8),
+    pnl_percent DECIMAL(20, 8),
+    runup_absolute DECIMAL(20, 8),
+    runup_percent DECIMAL(20, 8),
+    drawdown_absolute DECIMAL(20, 8),
+    drawdown_percent DECIMAL(20, 8),
+    cumulative_pnl_absolute DECIMAL(20, 8),
+    cumulative_pnl_percent DECIMAL(20, 8)
+)
+"""
+
+
+def bench_connection():
+    database = os.environ.get('BENCH_DB_NAME', 'bench_backtesting')
+    connection = pymysql.connect(
+        host=os.environ.get('BENCH_DB_HOST', '127.0.0.1'),
+        port=int(os.environ.get('BENCH_DB_PORT', 3306)),
+        user=os.environ.get('BENCH_DB_USER', 'root'),
+        password=os.environ.get('BENCH_DB_PASSWORD', ''),
+        charset='utf8mb4',
+        local_infile=True,
+        conv=SQL_CONVERSIONS,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {database}")
+        cursor.execute(f"USE {database}")
+    return connection
+
+
+def make_trade_rows(trade_count):
+    start = datetime(2022, 1, 1)
+    return [
+        (i // 2 + 1, 'exit long' if i % 2 else 'entry long', 'Long', start + timedelta(hours=i),
+         Decimal('20000.25') + i, 1, Decimal('1.5'), Decimal('0.05'), Decimal('12.5'), Decimal('0.06'),
+         Decimal('-3.25'), Decimal('-0.02'), Decimal(i) / 100, Decimal('0.1'))
+        for i in range(trade_count)
+    ]
+
+
+def edge_trade_rows():
+    """两种模式容易写得不一样的值"""
+    nan = Decimal('NaN')
+    return [
+        (1, 'entry long', 'Long', datetime(2022, 1, 1, 9, 30), Decimal('20000.25'), 1,
+         None, None, None, None, None, None, None, None),
+        (1, 'exit long', 'Tab\tBack\\slash\nNew line', datetime(2022, 1, 2, 9, 30, 0, 500000), Decimal('20010.5'), 1,
+         nan, nan, Decimal('12.5'), Decimal('0.06'), nan, Decimal('-0.02'), Decimal('10.25'), nan),
+        (2, 'entry short', '中文信号 "quoted" \'single\'', datetime(2022, 1, 3), Decimal('-0.00000001'), 3,
+         Decimal('0'), Decimal('1E+2'), Decimal('-3.25'), Decimal('-0.02'), Decimal('1'), Decimal('2'), Decimal('3'),
+         Decimal('4')),
+    ]
+
+
+def check_loaders_equivalent(connection):
+    """insert和load_data写入同样的行后，逐行比较表中的内容"""
+    trade_rows = edge_trade_rows()
+    stored = {}
+    for mode in ('insert', 'load_data'):
+        reset_table(connection)
+        with connection.cursor() as cursor:
+            bulk_insert_trades(cursor, 1, trade_rows, mode=mode)
+            connection.commit()
+            cursor.execute(f"SELECT {', '.join(TRADE_FIELDS)} FROM Trade ORDER BY id")
+            stored[mode] = cursor.fetchall()
+    assert len(stored['insert']) == len(trade_rows), stored['insert']
+    for insert_row, load_row in zip(stored['insert'], stored['load_data']):
+        assert insert_row == load_row, (insert_row, load_row)
+    print("insert与load_data写入的行一致（NULL、NaN、datetime、转义字符）")
+
+
+def reset_table(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS Trade")
+        cursor.execute(CREATE_TRADE_TABLE)
+    connection.commit()
+
+
+def timed(connection, label, func, trade_count):
+    reset_table(connection)
+    with connection.cursor() as cursor:
+        start = time.perf_counter()
+        func(cursor)
+        connection.commit()
+        elapsed = time.perf_counter() - start
+        cursor.execute("SELECT COUNT(*) FROM Trade")
+        assert cursor.fetchone()[0] == trade_count, label
+    print(f"{label:<28} {elapsed:6.2f}s  {trade_count / elapsed:10.0f} 行/s")
+
+
+def main(trade_count=200000):
+    trade_rows = make_trade_rows(trade_count)
+    connection = bench_connection()
+    try:
+        check_loaders_equivalent(connection)
+        executemany_query = build_multi_insert_query(1)
+        timed(connection, 'executemany', lambda cursor: cursor.executemany(
+            executemany_query, [(1,) + row for row in trade_rows]), trade_count)
+        for rows_per_statement in (100, 1000, 5000):
+            timed(connection, f'insert rows_per_statement={rows_per_statement}', lambda cursor: bulk_insert_trades(
+                cursor, 1, trade_rows, mode='insert', rows_per_statement=rows_per_statement), trade_count)
+        timed(connection, 'load_data', lambda cursor: bulk_insert_trades(
+            cursor, 1, trade_rows, mode='load_data'), trade_count)
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,68 @@
+"""
+parse_excel的dict-of-lists格式与CompactWorkbook的内存对比
+
+对不同交易数的合成导出文件，分别解析成两种格式，用tracemalloc测量：
+- 解析后持有的内存（批处理进程同时持有多个工作簿时，每个工作簿占用的内存）
+- 解析过程中的峰值内存
+并比较build_backtesting_record、build_trade_rows在两种格式上的耗时，检查结果完全一致
+用法：python benchmarks/bench_compact.py [交易数,交易数,...]
+"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from synthetic_export import write_export
+from utils import parse_excel
+from trade_rows import build_trade_rows
+from Backtesting import build_backtesting_record
+
+
+def parse_retained(path, compact):
+    """
+    :return: (工作簿, 持有的字节数, 峰值字节数)
+    """
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    with contextlib.redirect_stdout(io.StringIO()):
+        excel_data = parse_excel(path, compact=compact)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return excel_data, current - baseline, peak - baseline
+
+
+def build_time(excel_data, file_name):
+    """:return: (耗时, (backtesting_record, trade_rows))"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = build_backtesting_record(excel_data, file_name), build_trade_rows(excel_data)
+    return time.perf_counter() - start, result
+
+
+def main(trade_counts=(1000, 10000, 50000)):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for trade_count in trade_counts:
+            path = os.path.join(tmp_dir, f'MACD Cross_BINANCE_BTCUSDT_bench-{trade_count}.xlsx')
+            write_export(path, trade_count)
+            file_name = os.path.basename(path)
+
+            dict_data, dict_retained, dict_peak = parse_retained(path, compact=False)
+            compact_data, compact_retained, compact_peak = parse_retained(path, compact=True)
+
+            dict_time, dict_result = build_time(dict_data, file_name)
+            compact_time, compact_result = build_time(compact_data, file_name)
+            assert repr(dict_result) == repr(compact_result), "两种格式构建的行不一致"
+
+            print(f"交易数 {trade_count:>6}：持有 dict {dict_retained / 2**20:7.2f} MB，"
+                  f"compact {compact_retained / 2**20:7.2f} MB（{dict_retained / compact_retained:4.1f}x）；"
+                  f"解析峰值 dict {dict_peak / 2**20:7.2f} MB，compact {compact_peak / 2**20:7.2f} MB；"
+                  f"构建行 dict {dict_time:5.2f}s，compact {compact_time:5.2f}s")
+
+
+if __name__ == "__main__":
+    main(tuple(int(count) for count in sys.argv[1].split(',')) if len(sys.argv) > 1 else (1000, 10000, 50000))
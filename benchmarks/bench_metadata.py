@@ -0,0 +1,119 @@
+"""
+表头元数据解析的微基准：原build_backtesting_record中的写法与metadata_parsing的对比
+
+- 标签转换：replace链 与 label_key（按标签缓存）
+- 日期：每次依次尝试三个格式 与 DateParser（每个文件记住成功的格式），用排在后面的格式测试最能体现差异
+- strategy、exchange、symbol：逐字符循环 + strip(currency) 与 正则
+并列出原写法拆出的symbol与新写法不同的样例（strip按字符集合去掉两端字符的问题）
+用法：python benchmarks/bench_metadata.py [文件数]
+"""
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from metadata_parsing import DATE_FORMATS, DateParser, label_key, split_symbol, strategy_from_file_name
+
+
+# 三个指标sheet中的A列标签（每个文件都相同）
+LABELS = (
+    'Net Profit', 'Gross Profit', 'Gross Loss', 'Max Run-up', 'Max Drawdown', 'Buy & Hold Return',
+    'Sharpe Ratio', 'Sortino Ratio', 'Profit Factor', 'Max Contracts Held', 'Open PL', 'Commission Paid',
+    'Total Closed Trades', 'Total Open Trades', 'Number Winning Trades', 'Number Losing Trades',
+    'Percent Profitable', 'Avg Trade', 'Avg Winning Trade', 'Avg Losing Trade', 'Ratio Avg Win / Avg Loss',
+    'Largest Winning Trade', 'Largest Losing Trade', 'Avg # Bars in Trades', 'Avg # Bars in Winning Trades',
+    'Avg # Bars in Losing Trades', 'Margin Calls', 'Net Profit %', 'Return on Initial Capital & Max DD',
+)
+
+SYMBOLS = ('BINANCE:BTCUSDT', 'BINANCE:DOTUSDT', 'BINANCE:SUSHIUSDT', 'BYBIT:TUSDUSDT', 'BINANCE:ETHUSDT.P',
+           'COINBASE:BTCUSD', 'OKX:UNIUSDT')
+
+
+def old_label_key(label):
+    return label.lower().replace(' & ', '_and_').replace(' ', '_').replace('&', '_and_').replace('/', '_').replace('%', 'percent')
+
+
+def old_parse_date(date_str):
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(date_str.strip(), fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"Cannot parse date: {date_str}")
+
+
+def old_split(file_name, symbol, currency_name):
+    i = len(file_name) - 1
+    while file_name[i] != "_":
+        i -= 1
+    exchange, symbol = symbol.strip(currency_name).split(':')
+    return file_name[:i], exchange, symbol
+
+
+def make_files(file_count):
+    """每个文件的 (文件名, Symbol, Currency, 日期字符串列表)"""
+    files = []
+    for i in range(file_count):
+        symbol = SYMBOLS[i % len(SYMBOLS)]
+        currency = 'USD' if symbol.endswith('USD') else 'USDT'
+        fmt = DATE_FORMATS[i % len(DATE_FORMATS)]
+        dates = [datetime(2022, 1 + j, 1 + i % 28, 12).strftime(fmt) for j in range(5)]
+        files.append((f"MACD Cross_{symbol.replace(':', '_')}_2024-01-{i % 28 + 1:02d}.xlsx", symbol, currency, dates))
+    return files
+
+
+def parse_all(date_parser, dates):
+    return [date_parser.parse(date_str) for date_str in dates]
+
+
+def timeit(func, files):
+    start = time.perf_counter()
+    for item in files:
+        func(*item)
+    return time.perf_counter() - start
+
+
+def old_file(file_name, symbol, currency, dates):
+    for _ in range(3):
+        for label in LABELS:
+            old_label_key(label)
+    for date_str in dates:
+        old_parse_date(date_str)
+    return old_split(file_name, symbol, currency)
+
+
+def new_file(file_name, symbol, currency, dates):
+    for _ in range(3):
+        for label in LABELS:
+            label_key(label)
+    parse_all(DateParser(), dates)
+    return (strategy_from_file_name(file_name),) + split_symbol(symbol, currency)
+
+
+def main(file_count=20000):
+    files = make_files(file_count)
+
+    for name, part in (
+            ('标签', (lambda *item: [old_label_key(label) for label in LABELS],
+                      lambda *item: [label_key(label) for label in LABELS])),
+            ('日期', (lambda f, s, c, dates: [old_parse_date(d) for d in dates],
+                      lambda f, s, c, dates: parse_all(DateParser(), dates))),
+            ('strategy/symbol', (lambda f, s, c, d: old_split(f, s, c),
+                                 lambda f, s, c, d: (strategy_from_file_name(f),) + split_symbol(s, c))),
+            ('合计（每个文件）', (old_file, new_file))):
+        old_time, new_time = timeit(part[0], files), timeit(part[1], files)
+        print(f"{name:<16} 原写法 {old_time:6.3f}s  metadata_parsing {new_time:6.3f}s  {old_time / new_time:5.2f}x")
+
+    # strategy应一致，symbol的差异即strip的问题
+    for file_name, symbol, currency, _ in files[:len(SYMBOLS)]:
+        old = old_split(file_name, symbol, currency)
+        new = (strategy_from_file_name(file_name),) + split_symbol(symbol, currency)
+        assert old[0] == new[0], (old, new)
+        if old != new:
+            print(f"{symbol:<20} 原写法 {old[1]}:{old[2]:<10} 修正后 {new[1]}:{new[2]}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,86 @@
+"""
+parse_excel（openpyxl只读逐行）与parse_excel_pandas（pandas DataFrame）的对比基准
+
+生成一个包含大量"List of trades"行的xlsx，分别用两种方式解析，比较耗时、峰值内存，并检查结果是否一致
+用法：python benchmarks/bench_parse_excel.py [交易行数]
+"""
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils import parse_excel, parse_excel_pandas, BACKTESTING_SHEETS
+
+
+def write_trades_workbook(path, trade_count):
+    """
+    生成只含List of trades和几个小sheet的测试xlsx
+    :param path: str
+    :param trade_count: int
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    for sheet_name in BACKTESTING_SHEETS[:-1]:
+        sheet = workbook.create_sheet(sheet_name)
+        sheet.append(['', 'All USDT', 'All %', 'Long USDT', 'Long %', 'Short USDT', 'Short %'])
+        for i in range(20):
+            sheet.append([f'Metric {i}', i * 1.5, i * 0.1, i, None, -i, -i * 0.1])
+
+    sheet = workbook.create_sheet('List of trades')
+    sheet.append(['Trade #', 'Type', 'Signal', 'Date/Time', 'Price USDT', 'Contracts',
+                  'Profit USDT', 'Profit %', 'Run-up USDT', 'Run-up %',
+                  'Drawdown USDT', 'Drawdown %', 'Cumulative profit USDT', 'Cumulative profit %'])
+    start = datetime(2022, 1, 1)
+    for i in range(trade_count):
+        trade_num = i // 2 + 1
+        sheet.append([trade_num, 'Exit long' if i % 2 else 'Entry long', 'Long', start + timedelta(hours=i),
+                      20000 + i * 0.25, 1, round(i * 0.01, 2), 0.05, 12.5, 0.06, -3.25, -0.02,
+                      round(i * 0.02, 2), 0.1])
+    workbook.save(path)
+
+
+def same_value(a, b):
+    if isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b):
+        return True
+    return str(a) == str(b)
+
+
+def run(func, path):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(path)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main(trade_count=100000):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, f'bench_{trade_count}.xlsx')
+        write_trades_workbook(path, trade_count)
+
+        fast, fast_time, fast_peak = run(parse_excel, path)
+        slow, slow_time, slow_peak = run(lambda p: parse_excel_pandas(p, BACKTESTING_SHEETS), path)
+
+    # 检查两种方式的结果一致
+    for sheet_name, columns in slow.items():
+        assert fast[sheet_name].keys() == columns.keys(), sheet_name
+        for letter, values in columns.items():
+            assert len(fast[sheet_name][letter]) == len(values), (sheet_name, letter)
+            assert all(same_value(a, b) for a, b in zip(fast[sheet_name][letter], values)), (sheet_name, letter)
+
+    print(f"List of trades行数: {trade_count}")
+    print(f"parse_excel_pandas: {slow_time:.2f}s, 峰值内存 {slow_peak / 2**20:.1f} MB")
+    print(f"parse_excel       : {fast_time:.2f}s, 峰值内存 {fast_peak / 2**20:.1f} MB")
+    print(f"加速 {slow_time / fast_time:.2f}x，结果一致")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,90 @@
+"""
+解析缓存（Arrow IPC / Parquet）与openpyxl解析xlsx的对比基准
+
+对不同交易行数的工作簿，比较parse_excel与read_parsed_cache的耗时，并检查还原的数据一致
+开始前先检查CompactColumn的int、datetime列走直接转换的分支（Arrow数组引用原NumPy buffer，不逐值转换），且能原样还原
+用法：python benchmarks/bench_parsed_cache.py [交易行数 ...]
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import parsed_cache
+from bench_parse_excel import write_trades_workbook, same_value
+from compact_workbook import CompactColumn, CompactSheet, KIND_INT, KIND_DATETIME
+from ingest_index import file_sha256
+from utils import parse_excel
+
+
+def timed(func, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def check_compact_round_trip():
+    """int、datetime列直接转换成Arrow数组，decode_sheet_compact还原成同类型的CompactColumn"""
+    columns = {
+        'A': CompactColumn.from_values(['Trade #', 1, 2, 3]),
+        'B': CompactColumn.from_values(['Date/Time', datetime(2024, 1, 1, 9, 30), datetime(2024, 1, 2), datetime(2024, 1, 3)]),
+    }
+    expected_types = {'A': parsed_cache.pa.int64(), 'B': parsed_cache.pa.timestamp('us')}
+    for letter, arrow_type in expected_types.items():
+        array = parsed_cache.encode_compact_column(columns[letter])
+        assert array.type == arrow_type, (letter, array.type)
+        # 直接转换时Arrow数组引用CompactColumn的NumPy buffer；逐值转换（encode_column）会新分配buffer
+        assert array.buffers()[1].address == columns[letter].body().ctypes.data, f"{letter}列没有直接转换"
+
+    table = parsed_cache.encode_sheet('List of trades', CompactSheet(columns))
+
+    _, sheet = parsed_cache.decode_sheet_compact(table)
+    for letter, kind in (('A', KIND_INT), ('B', KIND_DATETIME)):
+        assert sheet[letter].kind == kind, (letter, sheet[letter].kind)
+        assert sheet[letter][0] == columns[letter][0], letter
+        assert sheet[letter].body_list() == columns[letter].body_list(), letter
+    print("CompactColumn int/datetime列直接转换并原样还原")
+
+
+def main(trade_counts=(1000, 10000, 100000)):
+    if not parsed_cache.cache_available():
+        print("未安装pyarrow，无法测试解析缓存")
+        return
+
+    check_compact_round_trip()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        parsed_cache.PARSED_CACHE_DIR = Path(tmp_dir) / 'cache'
+
+        for trade_count in trade_counts:
+            path = os.path.join(tmp_dir, f'bench_{trade_count}.xlsx')
+            write_trades_workbook(path, trade_count)
+            file_hash = file_sha256(path)
+
+            excel_data, xlsx_time = timed(parse_excel, path, repeat=1)
+            line = f"交易行数 {trade_count:>7}: openpyxl {xlsx_time:7.3f}s"
+            for file_format in ('arrow', 'parquet'):
+                cache_hash = f"{file_hash}{file_format}"
+                parsed_cache.write_parsed_cache(cache_hash, excel_data, file_format=file_format)
+                cached, cache_time = timed(parsed_cache.read_parsed_cache, cache_hash)
+
+                for sheet_name, columns in excel_data.items():
+                    for letter, values in columns.items():
+                        assert all(same_value(a, b) and type(a) is type(b)
+                                   for a, b in zip(values, cached[sheet_name][letter])), (sheet_name, letter)
+
+                size = sum(p.stat().st_size for p in parsed_cache.cache_dir(cache_hash).iterdir())
+                line += f" | {file_format} {cache_time:7.3f}s ({xlsx_time / cache_time:5.1f}x, {size / 2**20:.1f} MB)"
+            print(line)
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or (1000, 10000, 100000))
@@ -0,0 +1,68 @@
+"""
+simulate_backtesting的吞吐量基准（场景/s）
+
+构造一个回测的trade行，在 手续费 x 滑点 参数网格下重算，并检查原参数场景的净利润与导出值一致
+用法：python benchmarks/bench_simulate.py [交易数] [手续费取值个数] [滑点取值个数]
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from simulate import scenario_grid, simulate_backtesting
+
+
+def make_trade_rows(trade_count, commission, slippage, tick_size, seed=0):
+    """
+    构造按给定手续费（%）和滑点（tick）成交的trade行（开仓、平仓各一行）
+    :return: (trade_rows, 净利润)
+    """
+    rng = np.random.default_rng(seed)
+    start = datetime(2022, 1, 1)
+    trade_rows = []
+    cumulative = Decimal(0)
+    price = 20000.0
+    for i in range(trade_count):
+        direction = 1 if i % 2 else -1
+        side = 'long' if direction == 1 else 'short'
+        entry = round(price + direction * slippage * tick_size, 2)
+        price = max(price * (1 + rng.normal(0, 0.01)), 100.0)
+        exit_ = round(price - direction * slippage * tick_size, 2)
+        pnl = Decimal(str(round(direction * (exit_ - entry) - (entry + exit_) * commission / 100, 2)))
+        cumulative += pnl
+        for kind, exec_price, offset in (('Entry', entry, 0), ('Exit', exit_, 1)):
+            trade_rows.append((
+                i + 1, f'{kind} {side}', side.capitalize(), start + timedelta(hours=2 * i + offset),
+                Decimal(str(exec_price)), 1, pnl, Decimal(0), abs(pnl) + 5, Decimal(0), -abs(pnl) - 5, Decimal(0),
+                cumulative, Decimal(0)
+            ))
+    return trade_rows, float(cumulative)
+
+
+def main(trade_count=2000, commission_count=20, slippage_count=10):
+    params = {'commission': 0.04, 'slippage': 2, 'tick_size': 0.1, 'point_value': 1, 'initial_capital': 100000}
+    trade_rows, net_profit = make_trade_rows(trade_count, params['commission'], params['slippage'], params['tick_size'])
+
+    commissions = np.append(np.linspace(0, 0.1, commission_count - 1), params['commission'])
+    slippages = np.append(np.arange(slippage_count - 1), params['slippage'])
+    scenario_commissions, scenario_slippages = scenario_grid(commissions, slippages)
+
+    start = time.perf_counter()
+    results = simulate_backtesting(1, params, trade_rows, scenario_commissions, scenario_slippages)
+    elapsed = time.perf_counter() - start
+
+    baseline = results[(results.commission == params['commission']) & (results.slippage == params['slippage'])]
+    assert np.allclose(baseline.net_profit, net_profit), (baseline.net_profit.tolist(), net_profit)
+
+    print(f"交易数: {trade_count}，场景数: {len(results)}")
+    print(f"耗时 {elapsed:.3f}s，{len(results) / elapsed:.0f} 场景/s，原参数场景净利润与导出一致")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:4]]
+    main(*args)
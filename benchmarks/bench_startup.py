@@ -0,0 +1,75 @@
+"""
+启动耗时基准：new目录为空时（cron每分钟触发的常见情况）各入口从启动到退出的时间
+
+- python -c pass：解释器本身的启动时间
+- cli.py ingest / cli.py status：只导入标准库和config
+- import Backtesting：原入口在判断有没有待处理文件之前就要导入的模块（pandas、numpy、pymysql等）
+每个命令在子进程中运行repeat次取中位数，BT_BACKTESTING_DIR指向临时的空目录；
+并用 -X importtime 列出cli.py ingest导入耗时最多的模块，检查没有重模块混进启动路径
+用法：python benchmarks/bench_startup.py [重复次数]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+COMMANDS = (
+    ('python -c pass', ['-c', 'pass']),
+    ('cli.py ingest', ['cli.py', 'ingest']),
+    ('cli.py status', ['cli.py', 'status']),
+    ('import Backtesting', ['-c', 'import Backtesting']),
+)
+
+
+def run(args, env):
+    """:return: (耗时秒数, 退出码)"""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable] + args, cwd=ROOT_DIR, env=env, capture_output=True)
+    return time.perf_counter() - start, result.returncode
+
+
+def slowest_imports(args, env, top=10):
+    """
+    :return: [(累计微秒, 模块名), ...]，-X importtime中累计耗时最多的顶层导入
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + args, cwd=ROOT_DIR, env=env,
+                            capture_output=True, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '):  # 只看顶层导入（缩进表示被其他模块导入）
+            imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def main(repeat=10):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        (Path(tmp_dir) / 'new').mkdir()
+        env = dict(os.environ, BT_BACKTESTING_DIR=tmp_dir)
+
+        for name, args in COMMANDS:
+            times = []
+            for _ in range(repeat):
+                seconds, returncode = run(args, env)
+                if returncode != 0:
+                    break
+                times.append(seconds)
+            if not times:
+                print(f"{name:<20} 运行失败（退出码 {returncode}，可能缺少依赖）")
+                continue
+            print(f"{name:<20} 中位数 {statistics.median(times) * 1000:7.1f} ms  最小 {min(times) * 1000:7.1f} ms")
+
+        print("\ncli.py ingest 导入耗时最多的模块：")
+        for cumulative, module in slowest_imports(['cli.py', 'ingest'], env):
+            print(f"{cumulative / 1000:7.1f} ms  {module}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
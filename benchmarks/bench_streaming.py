@@ -0,0 +1,70 @@
+"""
+List of trades整表解析与分块读取的峰值内存对比
+
+对不同交易数的合成导出文件，分别用 parse_excel + build_trade_rows 与 iter_sheet_chunks + iter_trade_row_chunks
+（每块转换后即丢弃，模拟write_streaming_file）读取，比较耗时和tracemalloc峰值内存，并检查行数、首尾行相同
+分块方式的峰值内存应基本不随交易数增长
+用法：python benchmarks/bench_streaming.py [交易数,交易数,...] [每块行数]
+"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from synthetic_export import write_export
+from utils import parse_excel, iter_sheet_chunks
+from trade_rows import build_trade_rows, iter_trade_row_chunks
+
+
+def run(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def full(path):
+    """:return: (行数, 第一行, 最后一行)"""
+    trade_rows, _ = build_trade_rows(parse_excel(path, ['List of trades']))
+    return len(trade_rows), trade_rows[0], trade_rows[-1]
+
+
+def chunked(path, chunk_rows):
+    """:return: (行数, 第一行, 最后一行)，不保留已处理的块"""
+    count = 0
+    first = last = None
+    for trade_rows, _ in iter_trade_row_chunks(iter_sheet_chunks(path, 'List of trades', chunk_rows)):
+        count += len(trade_rows)
+        first = first or trade_rows[0]
+        last = trade_rows[-1]
+    return count, first, last
+
+
+def main(trade_counts=(10000, 50000, 200000), chunk_rows=20000):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for trade_count in trade_counts:
+            path = os.path.join(tmp_dir, f'bench_{trade_count}.xlsx')
+            write_export(path, trade_count)
+
+            full_result, full_time, full_peak = run(lambda: full(path))
+            chunk_result, chunk_time, chunk_peak = run(lambda: chunked(path, chunk_rows))
+            assert full_result == chunk_result, (full_result, chunk_result)
+            full_count = full_result[0]
+
+            print(f"交易数 {trade_count:>7}（{full_count} 行）："
+                  f"整表 {full_time:6.2f}s 峰值 {full_peak / 2**20:7.1f} MB，"
+                  f"分块({chunk_rows}) {chunk_time:6.2f}s 峰值 {chunk_peak / 2**20:7.1f} MB")
+
+
+if __name__ == "__main__":
+    counts = tuple(int(count) for count in sys.argv[1].split(',')) if len(sys.argv) > 1 else (10000, 50000, 200000)
+    main(counts, int(sys.argv[2]) if len(sys.argv) > 2 else 20000)
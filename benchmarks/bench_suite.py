@@ -0,0 +1,266 @@
+"""
+写入流程的分阶段与端到端基准，结果与基线比较以发现性能回退
+
+用benchmarks/synthetic_export.py生成的合成导出文件，每个阶段重复多次取中位数：
+- parse_excel：解析xlsx
+- build_trade_rows / build_backtesting_record：构建trade行和backtesting行
+- unzip_file：解压打包了多个文件的zip
+- insert_trade（需要本地数据库）：bulk_insert_trades写入Trade表
+- end_to_end（需要本地数据库）：解压 -> 解析 -> 一个事务写入backtesting、trade（不移动文件、不写写入索引）
+数据库阶段使用本地MySQL/MariaDB（环境变量与bench_bulk_loader.py相同，会重建BENCH_DB_NAME库中的表），未设置--db时跳过
+结果写入benchmarks/results/（不提交），与benchmarks/baselines.json比较，比基线慢超过--tolerance的阶段标为回退并以非0退出
+baselines.json随代码提交，记录生成基线的机器（machine）；在其他机器上比较前先用--update-baseline在该机器上生成基线
+用法：python benchmarks/bench_suite.py [--trades 100,10000,100000] [--files 8] [--repeat 3] [--db] [--update-baseline]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+
+from synthetic_export import write_export, write_export_zip
+from utils import parse_excel, unzip_file
+from trade_rows import build_trade_rows
+from bulk_loader import bulk_insert_trades
+
+
+BASELINE_PATH = BENCH_DIR / 'baselines.json'
+RESULTS_DIR = BENCH_DIR / 'results'
+
+# 本地数据库的表结构（与Backtesting.py、dimension_cache.py用到的字段一致）
+STANDIN_TABLES = {
+    'ticker': "CREATE TABLE ticker (id INT AUTO_INCREMENT PRIMARY KEY, symbol VARCHAR(64) NOT NULL UNIQUE)",
+    'currency': "CREATE TABLE currency (id INT AUTO_INCREMENT PRIMARY KEY, name VARCHAR(32) NOT NULL UNIQUE)",
+    'exchange': "CREATE TABLE exchange (id INT AUTO_INCREMENT PRIMARY KEY, name VARCHAR(64) NOT NULL UNIQUE)",
+    'exchangeticker': """
+        CREATE TABLE exchangeticker (
+            id INT AUTO_INCREMENT PRIMARY KEY, ticker_id INT NOT NULL, currency_id INT NOT NULL, exchange_id INT NOT NULL,
+            UNIQUE KEY (ticker_id, currency_id, exchange_id)
+        )""",
+    'BackTesting': """
+        CREATE TABLE BackTesting (
+            id INT AUTO_INCREMENT PRIMARY KEY, ticker_id INT, performance JSON, trades_analysis JSON,
+            risk_performance_ratios JSON, strategy VARCHAR(255), trading_range_start DATETIME, trading_range_end DATETIME,
+            backtesting_range_start DATETIME, backtesting_range_end DATETIME, symbol VARCHAR(64), timeframe VARCHAR(16),
+            point_value DOUBLE, chart_type VARCHAR(32), currency VARCHAR(32), tick_size DOUBLE,
+            precision_setting VARCHAR(32), start_date DATETIME, initial_capital DOUBLE, order_size INT, pyramiding INT,
+            commission DOUBLE, slippage INT, verify_price_ticks INT, long_margin DOUBLE, short_margin DOUBLE,
+            recalculate_after_order VARCHAR(8), recalculate_every_tick VARCHAR(8), recalculate_on_bar_close VARCHAR(8),
+            use_bar_magnifier VARCHAR(8)
+        )""",
+}
+
+
+def standin_config():
+    """
+    本地数据库的连接参数（DictCursor，与config.db_config一致），并重建表
+    :return: dict
+    """
+    import pymysql
+    from bench_bulk_loader import CREATE_TRADE_TABLE, bench_connection
+
+    connection = bench_connection()
+    with connection.cursor() as cursor:
+        for table, ddl in list(STANDIN_TABLES.items()) + [('Trade', CREATE_TRADE_TABLE)]:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+            cursor.execute(ddl)
+    connection.commit()
+    connection.close()
+
+    return {
+        'host': os.environ.get('BENCH_DB_HOST', '127.0.0.1'),
+        'port': int(os.environ.get('BENCH_DB_PORT', 3306)),
+        'user': os.environ.get('BENCH_DB_USER', 'root'),
+        'password': os.environ.get('BENCH_DB_PASSWORD', ''),
+        'database': os.environ.get('BENCH_DB_NAME', 'bench_backtesting'),
+        'charset': 'utf8mb4',
+        'local_infile': True,
+        'cursorclass': pymysql.cursors.DictCursor,
+    }
+
+
+def measure(func, repeat, setup=None):
+    """
+    重复执行取中位数（屏蔽被测函数的print）
+    :param setup: 每次执行前调用（不计时），返回值传给func
+    :return: 中位数耗时（秒）
+    """
+    times = []
+    for _ in range(repeat):
+        argument = setup() if setup else None
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func(argument) if setup else func()
+            times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def stage_benchmarks(work_dir, trade_counts, file_count, repeat, db_config):
+    """
+    :return: dict，'阶段/规模' -> {'seconds', 'units', 'unit'}
+    """
+    from Backtesting import build_backtesting_record
+
+    results = {}
+
+    def record(name, seconds, units, unit):
+        results[name] = {'seconds': seconds, 'units': units, 'unit': unit}
+        print(f"{name:<36} {seconds:9.4f}s  {units / seconds:12.0f} {unit}/s")
+
+    for trade_count in trade_counts:
+        path = work_dir / f"MACD Cross_BINANCE_BTCUSDT_bench-{trade_count}.xlsx"
+        write_export(path, trade_count)
+        rows = trade_count * 2
+
+        record(f"parse_excel/{trade_count}", measure(lambda: parse_excel(path), repeat), rows, 'rows')
+        excel_data = parse_excel(path)
+        record(f"build_trade_rows/{trade_count}", measure(lambda: build_trade_rows(excel_data), repeat), rows, 'rows')
+        record(f"build_backtesting_record/{trade_count}",
+               measure(lambda: build_backtesting_record(excel_data, path.name), repeat), 1, 'files')
+
+        if db_config:
+            import pymysql
+            trade_rows, _ = build_trade_rows(excel_data)
+            connection = pymysql.connect(**db_config)
+
+            def insert():
+                with connection.cursor() as cursor:
+                    cursor.execute("TRUNCATE TABLE Trade")
+                    bulk_insert_trades(cursor, 1, trade_rows)
+                connection.commit()
+
+            record(f"insert_trade/{trade_count}", measure(insert, repeat), rows, 'rows')
+            connection.close()
+
+    # 解压：每个规模中最小的交易数，打包file_count个文件
+    zip_trades = min(trade_counts)
+    zip_path = str(work_dir / f"bench_{file_count}x{zip_trades}.zip")
+    write_export_zip(zip_path, file_count, zip_trades)
+
+    def fresh_dir():
+        output_dir = work_dir / 'unzipped'
+        shutil.rmtree(output_dir, ignore_errors=True)
+        output_dir.mkdir()
+        return output_dir
+
+    zip_bytes = os.path.getsize(zip_path)
+    record(f"unzip_file/{file_count}x{zip_trades}",
+           measure(lambda output_dir: unzip_with_fresh_index(zip_path, output_dir), repeat, setup=fresh_dir),
+           zip_bytes / 2**20, 'MB')
+
+    if db_config:
+        record(f"end_to_end/{file_count}x{zip_trades}",
+               measure(lambda output_dir: end_to_end(zip_path, output_dir, db_config), repeat, setup=fresh_dir),
+               file_count, 'files')
+    return results
+
+
+def unzip_with_fresh_index(zip_path, output_dir):
+    """解压时使用临时的写入索引，避免已解压过的成员被跳过、也不写入正式索引"""
+    import ingest_index
+    with tempfile.TemporaryDirectory() as index_dir:
+        previous = ingest_index._ingest_index
+        ingest_index._ingest_index = ingest_index.IngestIndex(Path(index_dir) / 'index.sqlite')
+        try:
+            return unzip_file(zip_path, str(output_dir))
+        finally:
+            ingest_index._ingest_index.close()
+            ingest_index._ingest_index = previous
+
+
+def end_to_end(zip_path, output_dir, db_config):
+    """解压 -> 解析 -> 每个文件一个事务写入"""
+    from Backtesting import parse_backtesting_file, write_backtesting_batch
+    from db_pool import ConnectionPool
+
+    unzip_with_fresh_index(zip_path, output_dir)
+    pool = ConnectionPool(size=1, config=db_config)
+    try:
+        for path in sorted(Path(output_dir).iterdir()):
+            record, trade_rows, _ = parse_backtesting_file(path)
+            if not write_backtesting_batch(pool, [(record, trade_rows)]):
+                raise RuntimeError(f"写入失败: {path.name}")
+    finally:
+        pool.close()
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    :return: list，比基线慢超过tolerance的 (阶段, 基线秒数, 本次秒数)
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        expected = baseline[name]['seconds']
+        change = result['seconds'] / expected - 1
+        flag = '回退' if change > tolerance else ''
+        print(f"{name:<36} 基线 {expected:9.4f}s  本次 {result['seconds']:9.4f}s  {change:+7.1%} {flag}")
+        if change > tolerance:
+            regressions.append((name, expected, result['seconds']))
+    return regressions
+
+
+def machine_info():
+    return {'python': platform.python_version(), 'machine': platform.machine(), 'processor': platform.processor(),
+            'cpu_count': os.cpu_count(), 'node': platform.node()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='写入流程基准')
+    parser.add_argument('--trades', default='100,10000,100000', help='每个文件的交易数，逗号分隔（100 ~ 500000）')
+    parser.add_argument('--files', type=int, default=8, help='zip中打包的文件数')
+    parser.add_argument('--repeat', type=int, default=3, help='每个阶段重复次数（取中位数）')
+    parser.add_argument('--db', action='store_true', help='运行需要本地数据库的阶段')
+    parser.add_argument('--update-baseline', action='store_true', help='把本次结果写为基线')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='比基线慢多少视为回退')
+    args = parser.parse_args()
+
+    trade_counts = [int(count) for count in args.trades.split(',')]
+    db_config = standin_config() if args.db else None
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = stage_benchmarks(Path(work_dir), trade_counts, args.files, args.repeat, db_config)
+
+    report = {'time': datetime.now().isoformat(timespec='seconds'), 'machine': machine_info(),
+              'repeat': args.repeat, 'results': results}
+    RESULTS_DIR.mkdir(exist_ok=True)
+    result_path = RESULTS_DIR / f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    result_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+    print(f"结果: {result_path}")
+
+    if args.update_baseline:
+        baseline = json.loads(BASELINE_PATH.read_text(encoding='utf-8')) if BASELINE_PATH.exists() else {}
+        baseline.update({'machine': report['machine'], 'time': report['time']})
+        baseline.setdefault('results', {}).update(results)
+        BASELINE_PATH.write_text(json.dumps(baseline, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f"基线已更新: {BASELINE_PATH}")
+        return 0
+
+    if not BASELINE_PATH.exists():
+        print("没有基线，使用--update-baseline生成")
+        return 0
+    baseline = json.loads(BASELINE_PATH.read_text(encoding='utf-8'))
+    if baseline.get('machine') != report['machine']:
+        print("警告：基线来自不同的机器，比较结果仅供参考")
+    regressions = compare_with_baseline(results, baseline.get('results', {}), args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} 个阶段性能回退")
+        return 1
+    print("没有性能回退")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
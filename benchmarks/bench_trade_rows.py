@@ -0,0 +1,66 @@
+"""
+build_trade_rows（按列转换）与build_trade_rows_rowwise（逐行转换）的对比基准
+
+构造一个List of trades（含少量格式错误的行），比较两种方式的耗时，并检查结果完全一致
+用法：python benchmarks/bench_trade_rows.py [交易行数]
+"""
+import contextlib
+import io
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from trade_rows import build_trade_rows, build_trade_rows_rowwise
+
+
+def make_trades(trade_count):
+    """
+    构造parse_excel格式的List of trades，每1000行放一个格式错误的行
+    :param trade_count: int
+    :return: dict
+    """
+    header = ['Trade #', 'Type', 'Signal', 'Date/Time', 'Price USDT', 'Contracts',
+              'Profit USDT', 'Profit %', 'Run-up USDT', 'Run-up %',
+              'Drawdown USDT', 'Drawdown %', 'Cumulative profit USDT', 'Cumulative profit %']
+    trades = {chr(65 + i): [name] for i, name in enumerate(header)}
+    start = datetime(2022, 1, 1)
+    for i in range(trade_count):
+        row = [i // 2 + 1, 'Exit long' if i % 2 else 'Entry long', 'Long',
+               start + timedelta(hours=i) if i % 3 else str(start + timedelta(hours=i)),
+               f'{20000 + i * 0.25:,}', 1, round(i * 0.01, 2), 0.05, '12.5', 0.06, -3.25, -0.02,
+               round(i * 0.02, 2), 0.1]
+        if i % 1000 == 999:
+            row[4 + i % 10] = float('nan') if i % 2 else 'N/A'
+        for letter, value in zip(trades, row):
+            trades[letter].append(value)
+    return {'List of trades': trades}
+
+
+def main(trade_count=100000):
+    excel_data = make_trades(trade_count)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        rowwise_rows, _ = build_trade_rows_rowwise(excel_data)
+        rowwise_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        columnar_rows, _ = build_trade_rows(excel_data)
+        columnar_time = time.perf_counter() - start
+
+    # 逐字段比较类型和值（Decimal('NaN') != Decimal('NaN')，所以比较str）
+    assert len(rowwise_rows) == len(columnar_rows)
+    for expected, actual in zip(rowwise_rows, columnar_rows):
+        assert [(type(v), str(v)) for v in expected] == [(type(v), str(v)) for v in actual], (expected, actual)
+
+    print(f"List of trades行数: {trade_count}，有效行数: {len(columnar_rows)}")
+    print(f"build_trade_rows_rowwise: {rowwise_time:.2f}s")
+    print(f"build_trade_rows        : {columnar_time:.2f}s")
+    print(f"加速 {rowwise_time / columnar_time:.2f}x，结果一致")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
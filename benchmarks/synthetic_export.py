@@ -0,0 +1,335 @@
+"""
+生成与TradingView导出格式一致的合成回测文件（供基准测试使用）
+
+- Properties、Performance、Trades analysis、Risk performance ratios、List of trades 五个sheet，行名、列结构与Backtesting.py读取的一致
+- 汇总sheet中的指标由生成的交易按metrics.py的口径算出，只能检查读取、换算流程，不能证明公式正确
+  （公式由benchmarks/metrics_fixtures.json中手算的基准校验）
+- 交易数可配置（100 ~ 500k），同一seed生成的文件完全相同
+- write_export_zip：多个文件打包成zip（放在zip内的子目录中，与实际下载的压缩包一致）
+用法：python benchmarks/synthetic_export.py 输出目录 [交易数] [文件数] [--zip]
+"""
+import math
+import os
+import random
+import sys
+import zipfile
+from datetime import datetime, timedelta
+
+
+TRADE_HEADER = ['Trade #', 'Type', 'Signal', 'Date/Time', 'Price USDT', 'Contracts',
+                'Profit USDT', 'Profit %', 'Run-up USDT', 'Run-up %',
+                'Drawdown USDT', 'Drawdown %', 'Cumulative profit USDT', 'Cumulative profit %']
+SUMMARY_HEADER = ['', 'All USDT', 'All %', 'Long USDT', 'Long %', 'Short USDT', 'Short %']
+
+EXCHANGES = ('BINANCE', 'BYBIT', 'OKX')
+SYMBOLS = ('BTC', 'ETH', 'SOL', 'BNB', 'XRP')
+STRATEGIES = ('MACD Cross', 'RSI Reversal', 'Bollinger Breakout', 'EMA Ribbon')
+
+RISK_FREE_RATE = 0.02
+
+
+def generate_trades(trade_count, seed=0, initial_capital=100000.0, commission=0.04, order_size=1,
+                    start=datetime(2022, 1, 1)):
+    """
+    随机游走价格上生成交易（多空随机，开平仓之间1~48小时）
+    :return: list，每笔交易一个dict（direction、entry_time、exit_time、entry_price、exit_price、quantity、pnl、runup、drawdown）
+    """
+    rng = random.Random(seed)
+    price = 20000.0
+    now = start
+    trades = []
+    for _ in range(trade_count):
+        direction = 1 if rng.random() < 0.55 else -1
+        entry_time = now + timedelta(hours=rng.randint(1, 24))
+        exit_time = entry_time + timedelta(hours=rng.randint(1, 48))
+        entry_price = round(price, 2)
+        price = max(price * (1 + rng.gauss(0, 0.01)), 100.0)
+        exit_price = round(price, 2)
+        pnl = round(direction * (exit_price - entry_price) * order_size
+                    - (entry_price + exit_price) * order_size * commission / 100, 2)
+        trades.append({
+            'direction': direction,
+            'entry_time': entry_time,
+            'exit_time': exit_time,
+            'entry_price': entry_price,
+            'exit_price': exit_price,
+            'quantity': order_size,
+            'pnl': pnl,
+            'runup': round(max(pnl, 0.0) + rng.uniform(0, 50), 2),
+            'drawdown': round(max(-pnl, 0.0) + rng.uniform(0, 50), 2),
+        })
+        now = exit_time
+    return trades
+
+
+def direction_metrics(pnls):
+    """与metrics.trade_statistics口径一致的按方向统计"""
+    wins = [pnl for pnl in pnls if pnl > 0]
+    losses = [pnl for pnl in pnls if pnl < 0]
+    gross_profit = sum(wins)
+    gross_loss = -sum(losses)
+    return {
+        'net_profit': sum(pnls),
+        'gross_profit': gross_profit,
+        'gross_loss': gross_loss,
+        'profit_factor': gross_profit / gross_loss if gross_loss else None,
+        'total_trades': len(pnls),
+        'winning_trades': len(wins),
+        'losing_trades': len(losses),
+        'percent_profitable': len(wins) * 100 / len(pnls) if pnls else None,
+        'avg_trade': sum(pnls) / len(pnls) if pnls else None,
+        'avg_winning_trade': gross_profit / len(wins) if wins else None,
+        'avg_losing_trade': -gross_loss / len(losses) if losses else None,
+        'largest_winning_trade': max(wins) if wins else None,
+        'largest_losing_trade': min(losses) if losses else None,
+    }
+
+
+def equity_metrics(trades):
+    """与metrics.equity_statistics口径一致的最大回撤、最大涨幅"""
+    closed = peak = trough = 0.0
+    max_drawdown = max_runup = 0.0
+    for trade in trades:
+        before = closed
+        closed += trade['pnl']
+        high = max(before + trade['runup'], closed)
+        low = min(before - trade['drawdown'], closed)
+        max_drawdown = max(max_drawdown, peak - low)
+        max_runup = max(max_runup, high - trough)
+        peak = max(peak, high)
+        trough = min(trough, low)
+    return max_drawdown, max_runup
+
+
+def ratio_metrics(trades, initial_capital):
+    """与metrics.ratio_statistics口径一致的按月夏普、索提诺比率"""
+    if not trades:
+        return None, None
+    month_index = lambda t: t.year * 12 + t.month - 1
+    first = month_index(trades[0]['exit_time'])
+    monthly = [0.0] * (month_index(trades[-1]['exit_time']) - first + 1)
+    for trade in trades:
+        monthly[month_index(trade['exit_time']) - first] += trade['pnl']
+
+    returns = []
+    equity = initial_capital
+    for pnl in monthly:
+        returns.append(pnl / equity if equity else 0.0)
+        equity += pnl
+    monthly_risk_free = RISK_FREE_RATE / 12
+    mean_excess = sum(r - monthly_risk_free for r in returns) / len(returns)
+    mean = sum(returns) / len(returns)
+    std = math.sqrt(sum((r - mean) ** 2 for r in returns) / len(returns))
+    downside = math.sqrt(sum(min(r - monthly_risk_free, 0.0) ** 2 for r in returns) / len(returns))
+    return (mean_excess / std if std else None), (mean_excess / downside if downside else None)
+
+
+def summary_sheets(trades, initial_capital):
+    """
+    :return: dict，sheet名 -> 行list（第一行为表头）
+    """
+    by_direction = {
+        'all': direction_metrics([t['pnl'] for t in trades]),
+        'long': direction_metrics([t['pnl'] for t in trades if t['direction'] == 1]),
+        'short': direction_metrics([t['pnl'] for t in trades if t['direction'] == -1]),
+    }
+    max_drawdown, max_runup = equity_metrics(trades)
+    sharpe, sortino = ratio_metrics(trades, initial_capital)
+
+    def money(label, key):
+        row = [label]
+        for direction in ('all', 'long', 'short'):
+            value = by_direction[direction][key]
+            row += [round(value, 2) if value is not None else None,
+                    round(value * 100 / initial_capital, 2) if value is not None else None]
+        return row
+
+    def count(label, key):
+        row = [label]
+        for direction in ('all', 'long', 'short'):
+            row += [by_direction[direction][key], None]
+        return row
+
+    def percent(label, key):
+        row = [label]
+        for direction in ('all', 'long', 'short'):
+            value = by_direction[direction][key]
+            row += [None, round(value, 2) if value is not None else None]
+        return row
+
+    def ratio(label, value, digits=3):
+        return [label, round(value, digits) if value is not None else None, None, None, None, None, None]
+
+    def all_only(label, value):
+        return [label, round(value, 2), round(value * 100 / initial_capital, 2), None, None, None, None]
+
+    return {
+        'Performance': [
+            SUMMARY_HEADER,
+            money('Net profit', 'net_profit'),
+            money('Gross profit', 'gross_profit'),
+            money('Gross loss', 'gross_loss'),
+            ['Commission paid', None, None, None, None, None, None],
+            all_only('Max equity run-up', max_runup),
+            all_only('Max equity drawdown', max_drawdown),
+        ],
+        'Trades analysis': [
+            SUMMARY_HEADER,
+            count('Total trades', 'total_trades'),
+            ['Total open trades', 0, None, 0, None, 0, None],
+            count('Winning trades', 'winning_trades'),
+            count('Losing trades', 'losing_trades'),
+            percent('Percent profitable', 'percent_profitable'),
+            money('Avg P&L', 'avg_trade'),
+            money('Avg winning trade', 'avg_winning_trade'),
+            money('Avg losing trade', 'avg_losing_trade'),
+            money('Largest winning trade', 'largest_winning_trade'),
+            money('Largest losing trade', 'largest_losing_trade'),
+        ],
+        'Risk performance ratios': [
+            SUMMARY_HEADER,
+            ratio('Sharpe ratio', sharpe),
+            ratio('Sortino ratio', sortino),
+            ratio('Profit factor', by_direction['all']['profit_factor']),
+            ['Margin calls', 0, None, 0, None, 0, None],
+        ],
+    }
+
+
+def properties_rows(trades, exchange, symbol, currency, initial_capital, commission, order_size):
+    date_format = "%b %d, %Y, %H:%M"
+    first = trades[0]['entry_time'] if trades else datetime(2022, 1, 1)
+    last = trades[-1]['exit_time'] if trades else datetime(2022, 1, 1)
+    range_text = f"{first.strftime(date_format)} — {last.strftime(date_format)}"
+    return [
+        ['name', 'value'],
+        ['Trading range', range_text],
+        ['Backtesting range', range_text],
+        ['Symbol', f"{exchange}:{symbol}{currency}"],
+        ['Timeframe', '1h'],
+        ['Point value', 1],
+        ['Chart type', 'Candles'],
+        ['Currency', currency],
+        ['Tick size', 0.01],
+        ['Precision', 'Default'],
+        ['Start Date', first.strftime(date_format)],
+        ['Initial capital', initial_capital],
+        ['Order size', order_size],
+        ['Pyramiding', 1],
+        ['Commission', f"{commission} %"],
+        ['Slippage', 0],
+        ['Verify price for limit orders', 0],
+        ['Margin for long positions', 100],
+        ['Margin for short positions', 100],
+        ['Recalculate after order is filled', 'Off'],
+        ['Recalculate on every tick', 'Off'],
+        ['Recalculate on bar close', 'On'],
+        ['Backtesting precision. Use bar magnifier', 'Off'],
+        ['Fill orders on standard OHLC', 'Off'],
+    ]
+
+
+def trade_rows(trades, initial_capital):
+    """
+    :return: List of trades的数据行（每笔交易开仓、平仓各一行，按交易编号升序）
+    """
+    rows = []
+    cumulative = 0.0
+    for number, trade in enumerate(trades, 1):
+        side = 'long' if trade['direction'] == 1 else 'short'
+        notional = trade['entry_price'] * trade['quantity']
+        cumulative = round(cumulative + trade['pnl'], 2)
+        tail = [trade['quantity'],
+                trade['pnl'], round(trade['pnl'] * 100 / notional, 2),
+                trade['runup'], round(trade['runup'] * 100 / notional, 2),
+                -trade['drawdown'], round(-trade['drawdown'] * 100 / notional, 2),
+                cumulative, round(cumulative * 100 / initial_capital, 2)]
+        rows.append([number, f'Entry {side}', side.capitalize(), trade['entry_time'], trade['entry_price']] + tail)
+        rows.append([number, f'Exit {side}', 'Close', trade['exit_time'], trade['exit_price']] + tail)
+    return rows
+
+
+def export_name(index, seed=0):
+    """
+    :return: (文件名, exchange, symbol)，文件名最后一个"_"之前是strategy
+    """
+    rng = random.Random(seed * 100003 + index)
+    exchange = rng.choice(EXCHANGES)
+    symbol = rng.choice(SYMBOLS)
+    strategy = rng.choice(STRATEGIES)
+    return f"{strategy}_{exchange}_{symbol}USDT_{seed}-{index:05d}.xlsx", exchange, symbol
+
+
+def write_export(path, trade_count, seed=0, exchange='BINANCE', symbol='BTC', currency='USDT',
+                 initial_capital=100000.0, commission=0.04, order_size=1):
+    """
+    写出一个合成导出文件
+    :param path: 输出路径（.xlsx）
+    :param trade_count: 交易数（List of trades的行数为其2倍）
+    :return: 生成的交易list
+    """
+    from openpyxl import Workbook
+
+    trades = generate_trades(trade_count, seed, initial_capital, commission, order_size)
+    workbook = Workbook(write_only=True)
+    sheets = {'Properties': properties_rows(trades, exchange, symbol, currency, initial_capital, commission, order_size)}
+    sheets.update(summary_sheets(trades, initial_capital))
+    for sheet_name, rows in sheets.items():
+        sheet = workbook.create_sheet(sheet_name)
+        for row in rows:
+            sheet.append(row)
+
+    sheet = workbook.create_sheet('List of trades')
+    sheet.append(TRADE_HEADER)
+    for row in trade_rows(trades, initial_capital):
+        sheet.append(row)
+    workbook.save(path)
+    return trades
+
+
+def write_exports(output_dir, file_count, trade_count, seed=0):
+    """
+    写出多个合成导出文件（交易所、品种、策略随机）
+    :return: list，文件路径
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for index in range(file_count):
+        file_name, exchange, symbol = export_name(index, seed)
+        path = os.path.join(output_dir, file_name)
+        write_export(path, trade_count, seed=seed * 100003 + index, exchange=exchange, symbol=symbol)
+        paths.append(path)
+    return paths
+
+
+def write_export_zip(zip_path, file_count, trade_count, seed=0):
+    """
+    写出多个合成导出文件并打包成zip（文件放在zip内与zip同名的子目录中）
+    :return: zip_path
+    """
+    folder = os.path.splitext(os.path.basename(zip_path))[0]
+    staging_dir = zip_path + '.staging'
+    paths = write_exports(staging_dir, file_count, trade_count, seed)
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for path in paths:
+            zf.write(path, f"{folder}/{os.path.basename(path)}")
+    for path in paths:
+        os.remove(path)
+    os.rmdir(staging_dir)
+    return zip_path
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if arg != '--zip']
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+    output_dir = args[0]
+    trades_per_file = int(args[1]) if len(args) > 1 else 1000
+    files = int(args[2]) if len(args) > 2 else 1
+    if '--zip' in sys.argv:
+        os.makedirs(output_dir, exist_ok=True)
+        print(write_export_zip(os.path.join(output_dir, f"synthetic_{files}x{trades_per_file}.zip"), files, trades_per_file))
+    else:
+        for written in write_exports(output_dir, files, trades_per_file):
+            print(written)
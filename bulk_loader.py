@@ -0,0 +1,125 @@
+"""
+Trade表批量写入
+
+两种模式：
+- insert：分块的多行INSERT ... VALUES (...),(...)，每条语句行数由rows_per_statement控制
+- load_data：先写临时TSV文件，再用LOAD DATA LOCAL INFILE流式上传（连接需开启local_infile）
+都不提交事务，由调用方commit；写入完成后打印 行/s 便于按部署环境选择模式
+两种模式写入的行相同：None和NaN（excel空单元格转换得到的Decimal('NaN')）写入NULL（insert模式由db_pool.SQL_CONVERSIONS转义），
+datetime、Decimal与pymysql的转义格式一致
+"""
+import os
+import tempfile
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from config import BULK_LOAD_MODE, BULK_INSERT_ROWS
+from schema import TRADE_FIELDS
+
+
+BULK_LOAD_MODES = ('insert', 'load_data')
+
+
+def build_multi_insert_query(row_count, table='Trade', fields=TRADE_FIELDS):
+    """
+    构建一次插入row_count行的INSERT语句
+    :param row_count: int
+    :return: str
+    """
+    placeholders = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    return f"INSERT INTO {table} ({', '.join(fields)}) VALUES " + ', '.join([placeholders] * row_count)
+
+
+def insert_trades_statements(backtesting_id, trade_rows, rows_per_statement=BULK_INSERT_ROWS):
+    """
+    分块多行INSERT的语句（同步和asyncio写入共用）
+    :param backtesting_id: int
+    :param trade_rows: build_trade_rows返回的trade行（不含backtesting_id）
+    :param rows_per_statement: 每条INSERT语句的行数
+    :return: 生成器，yield (语句, 参数)
+    """
+    full_query = build_multi_insert_query(rows_per_statement)
+    for start in range(0, len(trade_rows), rows_per_statement):
+        chunk = trade_rows[start:start + rows_per_statement]
+        params = []
+        for row in chunk:
+            params.append(backtesting_id)
+            params.extend(row)
+        # 最后一块行数不足时单独构建语句
+        query = full_query if len(chunk) == rows_per_statement else build_multi_insert_query(len(chunk))
+        yield query, params
+
+
+def insert_trades_chunked(cursor, backtesting_id, trade_rows, rows_per_statement=BULK_INSERT_ROWS):
+    """
+    分块多行INSERT写入trade行
+    :param cursor: 数据库游标
+    :param backtesting_id: int
+    :param trade_rows: build_trade_rows返回的trade行（不含backtesting_id）
+    :param rows_per_statement: 每条INSERT语句的行数
+    """
+    for query, params in insert_trades_statements(backtesting_id, trade_rows, rows_per_statement):
+        cursor.execute(query, params)
+
+
+def tsv_field(value):
+    """
+    转成LOAD DATA默认格式（FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'）的字段
+    """
+    if value is None or value != value:
+        return '\\N'
+    if isinstance(value, datetime):
+        # 与pymysql相同：有微秒时带上微秒
+        return str(value)
+    if isinstance(value, Decimal):
+        # 与pymysql相同：定点表示（str()可能是1E-8、1E+2这样的科学计数法）
+        return format(value, 'f')
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def load_trades_infile(cursor, backtesting_id, trade_rows):
+    """
+    写临时TSV文件后用LOAD DATA LOCAL INFILE写入trade行
+    注意：LOAD DATA LOCAL遇到格式错误只产生warning，不会报错
+    :param cursor: 数据库游标（连接需开启local_infile）
+    :param backtesting_id: int
+    :param trade_rows: build_trade_rows返回的trade行（不含backtesting_id）
+    """
+    prefix = f"{backtesting_id}\t"
+    with tempfile.NamedTemporaryFile('w', suffix='.tsv', encoding='utf-8', newline='\n', delete=False) as f:
+        tsv_path = f.name
+        for row in trade_rows:
+            f.write(prefix + '\t'.join(map(tsv_field, row)) + '\n')
+
+    try:
+        cursor.execute(
+            f"LOAD DATA LOCAL INFILE %s INTO TABLE Trade CHARACTER SET utf8mb4 ({', '.join(TRADE_FIELDS)})",
+            tsv_path
+        )
+    finally:
+        os.remove(tsv_path)
+
+
+def bulk_insert_trades(cursor, backtesting_id, trade_rows, mode=BULK_LOAD_MODE, rows_per_statement=BULK_INSERT_ROWS):
+    """
+    按mode批量写入trade行并打印写入速度，不提交事务
+    :param cursor: 数据库游标
+    :param backtesting_id: int
+    :param trade_rows: build_trade_rows返回的trade行（不含backtesting_id）
+    :param mode: 'insert' 或 'load_data'
+    :param rows_per_statement: insert模式下每条INSERT语句的行数
+    :return: 写入的行数
+    """
+    if mode not in BULK_LOAD_MODES:
+        raise ValueError(f"Unknown bulk load mode: {mode}")
+
+    start_time = time.perf_counter()
+    if mode == 'insert':
+        insert_trades_chunked(cursor, backtesting_id, trade_rows, rows_per_statement)
+    else:
+        load_trades_infile(cursor, backtesting_id, trade_rows)
+    elapsed = time.perf_counter() - start_time
+
+    print(f"Trade批量写入({mode}) {len(trade_rows)} 行，耗时 {elapsed:.2f}s，{len(trade_rows) / max(elapsed, 1e-9):.0f} 行/s")
+    return len(trade_rows)
@@ -0,0 +1,189 @@
+"""
+命令行入口
+
+- unzip：解压new目录中的zip并备份到backup目录
+- ingest [--mode sequential|parallel|pipeline|async] [--reload]：解压并写入new目录中的回测文件（默认INGEST_MODE），
+  --reload时已写入过的同一回测就地更新，只写入有变化的交易（INGEST_RELOAD，见reload.py）；
+  每个文件的状态记录在运行日志（run_journal.py），--resume继续最近一次中断的运行：已提交的文件直接移动，只重新写入未完成的文件
+- status [--verify [--prune]]：new目录待处理文件、processed目录文件数和写入索引的统计，--verify与BackTesting表核对索引
+- validate [--workers N] [--report 路径] [--quarantine] [目录/文件/zip ...]：只解析、校验，不连接数据库，输出JSON报告，
+  --quarantine把有错误的文件移到invalid目录（默认校验new目录，先unzip再validate --quarantine，ingest只处理通过的文件）
+- reprocess (--analytics | --check) [文件 ...]：重新解析processed目录中的文件，补写本地分析库或核对重新计算的指标
+启动时只导入标准库和config，pandas、openpyxl、numpy、pymysql等在子命令真正需要时才导入：
+new目录为空时ingest只列一次目录就退出，cron每分钟触发也几乎没有开销（benchmarks/bench_startup.py）
+配置来自环境变量BT_<常量名>或JSON配置文件（见config.py），--config指定配置文件
+退出码：0 成功；1 有文件未写入成功（validate：有文件校验出错误）
+用法：python cli.py [--config backtesting.json] <子命令> ...
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+
+# 与Backtesting.list_backtesting_files相同的文件类型
+EXCEL_PATTERNS = ("*.[xX][lL][sS]*", "*.[cC][sS][vV]")
+ZIP_PATTERN = "*.zip"
+
+INGEST_MODES = ('sequential', 'parallel', 'pipeline', 'async')
+
+
+def has_match(directory, patterns):
+    """目录中是否有匹配的文件（找到第一个即返回，不列出整个目录）"""
+    return any(next(directory.glob(pattern), None) is not None for pattern in patterns)
+
+
+def count_matches(directory, patterns):
+    return sum(1 for pattern in patterns for _ in directory.glob(pattern))
+
+
+def unzip(args):
+    from config import BACKTESTING_NEW_DIR
+
+    if not has_match(BACKTESTING_NEW_DIR, (ZIP_PATTERN,)):
+        print("没有待解压文件")
+        return 0
+
+    from utils import unzip_all_and_backup
+    unzip_all_and_backup()
+    return 0
+
+
+def ingest(args):
+    from config import BACKTESTING_NEW_DIR, INGEST_MODE
+
+    pending_patterns = EXCEL_PATTERNS + (ZIP_PATTERN,)
+    if not has_match(BACKTESTING_NEW_DIR, pending_patterns):
+        print("没有待处理回测数据")
+        return 0
+
+    from run_journal import start_run, finish_run
+    mode = args.mode or INGEST_MODE
+    # 运行中断时不调用finish_run，下次--resume从中断处继续
+    journal, resumed = start_run(mode, resume=args.resume)
+    if resumed:
+        from Backtesting import finish_committed_moves
+        finish_committed_moves(journal)
+
+    if mode == 'pipeline':
+        from pipeline import run_pipeline
+        run_pipeline()
+    else:
+        from utils import unzip_all_and_backup
+        unzip_all_and_backup()
+        if mode == 'parallel':
+            from Backtesting import insert_backtesting_to_db_parallel
+            insert_backtesting_to_db_parallel()
+        elif mode == 'async':
+            from async_ingest import insert_backtesting_to_db_async
+            insert_backtesting_to_db_async()
+        else:
+            from Backtesting import insert_backtesting_to_db
+            insert_backtesting_to_db()
+
+    from instrumentation import write_metrics_report
+    write_metrics_report(mode)
+    failed = has_match(BACKTESTING_NEW_DIR, pending_patterns)
+    finish_run(not failed)
+    return 1 if failed else 0
+
+
+def status(args):
+    from config import BACKTESTING_NEW_DIR, BACKTESTING_PROCESSED_DIR, INGEST_INDEX_PATH
+
+    print(f"new目录: {count_matches(BACKTESTING_NEW_DIR, EXCEL_PATTERNS)} 个待写入文件，"
+          f"{count_matches(BACKTESTING_NEW_DIR, (ZIP_PATTERN,))} 个待解压zip")
+    print(f"processed目录: {count_matches(BACKTESTING_PROCESSED_DIR, EXCEL_PATTERNS)} 个文件")
+
+    if INGEST_INDEX_PATH.exists():
+        from ingest_index import get_ingest_index
+        stats = get_ingest_index().stats()
+        print(f"写入索引: {stats['files']} 个文件，{stats['zip_members']} 个zip成员，"
+              f"{stats['pending_commits']} 个待确认的提交，最后写入 {stats['last_ingested_at']}")
+    else:
+        print("写入索引: 不存在")
+
+    if args.verify:
+        from Backtesting import verify_ingest_index
+        verify_ingest_index(prune=args.prune)
+    return 0
+
+
+def validate(args):
+    from validate import validate_paths
+    from config import INGEST_PARSE_WORKERS
+    report = validate_paths(args.paths or None, args.workers or INGEST_PARSE_WORKERS, args.report, args.quarantine)
+    return 1 if report['counts']['error'] else 0
+
+
+def reprocess(args):
+    files = [Path(file) for file in args.files] or None
+    if args.analytics:
+        from Backtesting import backfill_local_analytics
+        backfill_local_analytics(files)
+    else:
+        from Backtesting import reprocess_processed_files
+        from metrics import self_check
+        self_check(
+            (file_path.name, backtesting_record, trade_rows)
+            for file_path, _, backtesting_record, trade_rows, _ in reprocess_processed_files(files)
+        )
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cli.py', description='回测文件解压、写入数据库')
+    parser.add_argument('--config', help='JSON配置文件（默认环境变量BACKTESTING_CONFIG或backtesting.json）')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('unzip', help='解压new目录中的zip并备份').set_defaults(func=unzip)
+
+    ingest_parser = commands.add_parser('ingest', help='解压并写入new目录中的回测文件')
+    ingest_parser.add_argument('--mode', choices=INGEST_MODES, help='写入方式，默认INGEST_MODE')
+    ingest_parser.add_argument('--reload', action='store_true',
+                               help='重新写入模式：同一回测已存在时更新，只写入有变化的交易（默认INGEST_RELOAD）')
+    ingest_parser.add_argument('--resume', action='store_true',
+                               help='继续最近一次中断的运行：已提交未移动的文件不连接数据库直接移动，只重新写入未完成的文件')
+    ingest_parser.set_defaults(func=ingest)
+
+    status_parser = commands.add_parser('status', help='待处理文件和写入索引的统计')
+    status_parser.add_argument('--verify', action='store_true', help='与BackTesting表核对写入索引（需要连接数据库）')
+    status_parser.add_argument('--prune', action='store_true', help='--verify时从索引中删除BackTesting表中已不存在的记录')
+    status_parser.set_defaults(func=status)
+
+    validate_parser = commands.add_parser('validate', help='只解析、校验回测文件，不写入数据库')
+    validate_parser.add_argument('--workers', type=int, help='解析进程数，默认INGEST_PARSE_WORKERS')
+    validate_parser.add_argument('--report', help='JSON报告路径，默认VALIDATION_REPORT_DIR下按时间命名')
+    validate_parser.add_argument('--quarantine', action='store_true', help='把有错误的文件移到BACKTESTING_INVALID_DIR')
+    validate_parser.add_argument('paths', nargs='*', help='目录、excel文件或zip，默认new目录')
+    validate_parser.set_defaults(func=validate)
+
+    reprocess_parser = commands.add_parser('reprocess', help='重新解析processed目录中的文件')
+    target = reprocess_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--analytics', action='store_true', help='补写本地分析库')
+    target.add_argument('--check', action='store_true', help='由List of trades重新计算指标，与导出的指标核对')
+    reprocess_parser.add_argument('files', nargs='*', help='要重新处理的文件，默认processed目录中的所有文件')
+    reprocess_parser.set_defaults(func=reprocess)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    # config在导入时读取配置文件，所以先设置路径再导入
+    if args.config:
+        if not os.path.exists(args.config):
+            parser.error(f"配置文件不存在: {args.config}")
+        os.environ['BACKTESTING_CONFIG'] = args.config
+    if getattr(args, 'reload', False):
+        os.environ['BT_INGEST_RELOAD'] = '1'
+    try:
+        import config
+    except ValueError as e:
+        # config.SettingError：配置值无法转换，只打印哪个配置有误
+        parser.error(str(e))
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+"""
+解析结果的紧凑内存表示
+
+parse_excel原来的格式是 {sheet: {列名: list}}，每个单元格都是一个Python对象（float 24字节 + list中8字节的指针），
+同时持有多个工作簿的批处理进程中，内存主要被这些对象占用。CompactWorkbook按列存储：
+- 数值列：float64数组；整数与小数混杂的列另存一个"原来是int"的bool数组，取值时还原成int
+- 整数列：int64数组
+- 字符串列：分类编码（uint8/uint16/int32编号 + 去重后的字符串，字符串经sys.intern在工作簿之间共享）
+- 日期列：datetime64[us]数组
+- 其他类型混杂的列：保留list
+表头（第0行）单独存放。CompactColumn支持len、下标、切片、迭代，取出的值与parse_excel的类型相同，
+build_backtesting_record、build_trade_rows、parsed_cache无需区分两种格式；body()直接返回数组（不复制）
+
+- compact_workbook / compact_sheet：由parse_excel格式转换
+- column_from_array：由解析缓存的Arrow列直接构建（数值、日期列不复制内存映射的buffer）
+- metric_records：指标sheet逐行的MetricRecord（__slots__），用于构建performance等JSON
+"""
+import sys
+from collections.abc import Mapping
+from datetime import datetime
+
+import numpy as np
+
+
+# 列的存储方式
+KIND_NUMBER, KIND_INT, KIND_STR, KIND_DATETIME, KIND_OBJECT = 'number', 'int', 'str', 'datetime', 'object'
+
+# float64能精确表示的整数范围，超出时不放入数值列
+MAX_EXACT_INT = 2 ** 53
+
+# 指标sheet中的列 -> JSON字段
+METRIC_COLUMNS = (
+    ('B', 'All_USDT'),
+    ('C', 'All_percent'),
+    ('D', 'Long_USDT'),
+    ('E', 'Long_percent'),
+    ('F', 'Short_USDT'),
+    ('G', 'Short_percent'),
+)
+
+
+def column_kind(values):
+    """
+    判断一列（不含表头）的存储方式
+    :param values: list
+    :return: KIND_*
+    """
+    types = set(map(type, values))
+    if not types:
+        return KIND_OBJECT
+    if types <= {float, int}:
+        if int in types and any(type(value) is int and abs(value) > MAX_EXACT_INT for value in values):
+            return KIND_OBJECT
+        return KIND_INT if types == {int} else KIND_NUMBER
+    if types == {str}:
+        return KIND_STR
+    if types == {datetime} and all(value.tzinfo is None for value in values):
+        return KIND_DATETIME
+    return KIND_OBJECT
+
+
+def code_dtype(category_count):
+    if category_count <= 1 << 8:
+        return np.uint8
+    if category_count <= 1 << 16:
+        return np.uint16
+    return np.int32
+
+
+def encode_categories(values):
+    """
+    :param values: 字符串list
+    :return: (编号数组, 去重后的字符串数组)
+    """
+    codes = {}
+    code_list = [codes.setdefault(value, len(codes)) for value in values]
+    categories = np.array([sys.intern(value) for value in codes], dtype=object)
+    return np.array(code_list, dtype=code_dtype(len(categories))), categories
+
+
+class CompactColumn:
+    __slots__ = ('header', 'kind', 'data', 'int_mask', 'categories')
+
+    def __init__(self, header, kind, data, int_mask=None, categories=None):
+        """
+        :param header: 表头单元格（第0行），没有表头行时为None
+        :param kind: KIND_*
+        :param data: 数组（KIND_OBJECT时为list），不含表头
+        :param int_mask: KIND_NUMBER中原来是int的位置，没有int时为None
+        :param categories: KIND_STR的字符串数组
+        """
+        self.header = header
+        self.kind = kind
+        self.data = data
+        self.int_mask = int_mask
+        self.categories = categories
+
+    @classmethod
+    def from_values(cls, values):
+        """
+        :param values: parse_excel格式的一列（第0行为表头）
+        """
+        if not values:
+            return cls(None, KIND_OBJECT, [])
+
+        header, body = values[0], values[1:]
+        kind = column_kind(body)
+        if kind == KIND_NUMBER:
+            is_int = np.fromiter((type(value) is int for value in body), dtype=bool, count=len(body))
+            return cls(header, kind, np.array(body, dtype=np.float64), int_mask=is_int if is_int.any() else None)
+        if kind == KIND_INT:
+            return cls(header, kind, np.array(body, dtype=np.int64))
+        if kind == KIND_STR:
+            codes, categories = encode_categories(body)
+            return cls(header, kind, codes, categories=categories)
+        if kind == KIND_DATETIME:
+            return cls(header, kind, np.array(body, dtype='datetime64[us]'))
+        return cls(header, kind, body)
+
+    def __len__(self):
+        if self.header is None and not len(self.data):
+            return 0
+        return len(self.data) + 1
+
+    def body(self):
+        """
+        不含表头的数据（不复制）：数值、整数、日期列为NumPy数组，字符串列为编号数组（配合categories），其他为list
+        """
+        return self.data
+
+    def body_list(self, start=0, stop=None):
+        """
+        :return: 不含表头的第start ~ stop-1个值，类型与parse_excel相同
+        """
+        data = self.data[start:stop]
+        if self.kind == KIND_OBJECT:
+            return list(data)
+        if self.kind == KIND_STR:
+            return self.categories[data].tolist()
+        values = data.tolist()
+        if self.int_mask is not None:
+            for i in np.flatnonzero(self.int_mask[start:stop]).tolist():
+                values[i] = int(values[i])
+        return values
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1 and start >= 1:
+                return self.body_list(start - 1, max(stop - 1, start - 1))
+            return [self[i] for i in range(start, stop, step)]
+
+        if key < 0:
+            key += len(self)
+        if key == 0 and len(self):
+            return self.header
+        if not 0 < key < len(self):
+            raise IndexError('column index out of range')
+        return self.body_list(key - 1, key)[0]
+
+    def __iter__(self):
+        if len(self):
+            yield self.header
+            yield from self.body_list()
+
+    def tolist(self):
+        """:return: parse_excel格式的一列"""
+        return list(self)
+
+    def nbytes(self):
+        """数组占用的字节数（不含Python对象本身）"""
+        total = 0
+        for array in (self.data, self.int_mask, self.categories):
+            if isinstance(array, np.ndarray):
+                total += array.nbytes
+        return total
+
+
+class CompactSheet(Mapping):
+    __slots__ = ('columns',)
+
+    def __init__(self, columns):
+        """
+        :param columns: dict，列名 -> CompactColumn
+        """
+        self.columns = columns
+
+    def __getitem__(self, letter):
+        return self.columns[letter]
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self):
+        return len(self.columns)
+
+    def to_dict(self):
+        """:return: parse_excel格式的sheet"""
+        return {letter: column.tolist() for letter, column in self.columns.items()}
+
+
+class CompactWorkbook(Mapping):
+    __slots__ = ('sheets',)
+
+    def __init__(self, sheets):
+        """
+        :param sheets: dict，sheet名 -> CompactSheet
+        """
+        self.sheets = sheets
+
+    def __getitem__(self, sheet_name):
+        return self.sheets[sheet_name]
+
+    def __iter__(self):
+        return iter(self.sheets)
+
+    def __len__(self):
+        return len(self.sheets)
+
+    def to_dict(self):
+        """:return: parse_excel格式的dict"""
+        return {sheet_name: sheet.to_dict() for sheet_name, sheet in self.sheets.items()}
+
+
+def compact_sheet(sheet_data):
+    """
+    :param sheet_data: parse_excel格式的一个sheet，dict：列名 -> list
+    :return: CompactSheet
+    """
+    if isinstance(sheet_data, CompactSheet):
+        return sheet_data
+    return CompactSheet({letter: CompactColumn.from_values(values) for letter, values in sheet_data.items()})
+
+
+def compact_workbook(excel_data):
+    """
+    :param excel_data: parse_excel的返回值
+    :return: CompactWorkbook
+    """
+    if isinstance(excel_data, CompactWorkbook):
+        return excel_data
+    return CompactWorkbook({sheet_name: compact_sheet(sheet_data) for sheet_name, sheet_data in excel_data.items()})
+
+
+def column_from_array(header, array):
+    """
+    由NumPy数组（解析缓存中的float64/int64/timestamp列，可以是只读的内存映射）构建列，不复制
+    :return: CompactColumn，数组类型不支持时返回None
+    """
+    if array.dtype == np.float64:
+        return CompactColumn(header, KIND_NUMBER, array)
+    if array.dtype == np.int64:
+        return CompactColumn(header, KIND_INT, array)
+    if array.dtype == np.dtype('datetime64[us]'):
+        return CompactColumn(header, KIND_DATETIME, array)
+    return None
+
+
+class MetricRecord:
+    __slots__ = ('key', 'values')
+
+    def __init__(self, key, values):
+        """
+        :param key: 指标key（label_key转换后的A列标签）
+        :param values: B ~ G列的值，nan为None
+        """
+        self.key = key
+        self.values = values
+
+    def as_dict(self):
+        """:return: 写入performance等JSON的 {All_USDT: ..., All_percent: ..., ...}"""
+        return {name: value for (_, name), value in zip(METRIC_COLUMNS, self.values)}
+
+
+def metric_records(sheet_data, label_key):
+    """
+    指标sheet逐行的MetricRecord，按列一次取出，不逐个单元格查找
+    :param sheet_data: parse_excel格式或CompactSheet
+    :param label_key: 标签 -> key的函数
+    :return: 生成器，yield MetricRecord
+    """
+    labels = sheet_data['A'][1:]
+    columns = [
+        [None if str(value) == "nan" else value for value in sheet_data[letter][1:len(labels) + 1]]
+        for letter, _ in METRIC_COLUMNS
+    ]
+    for label, values in zip(labels, zip(*columns)):
+        yield MetricRecord(label_key(label), values)
@@ -1,23 +1,193 @@
-import pymysql
-from pymysql.constants import CLIENT
+"""
+配置：下面每个常量的默认值可被配置文件或环境变量覆盖（环境变量 > 配置文件 > 默认值）
+
+- 配置文件：JSON，键为常量名（数据库连接为DB_HOST、DB_PORT、DB_USER、DB_PASSWORD、DB_NAME），
+  默认读取当前目录的backtesting.json，可用环境变量BACKTESTING_CONFIG指定路径
+- 环境变量：BT_<常量名>，如 BT_INGEST_MODE=parallel、BT_DB_PASSWORD=...
+- 值无法转换成默认值的类型时抛出SettingError（ValueError），消息中包含配置名和来源
+只导入标准库（不导入pymysql），cli.py启动时可以快速读取配置
+"""
+import json
+import os
 from pathlib import Path
 
 
-# 配置数据库连接
+CONFIG_FILE = Path(os.environ.get('BACKTESTING_CONFIG', 'backtesting.json'))
+ENV_PREFIX = 'BT_'
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+
+
+def load_config_file(path=CONFIG_FILE):
+    """
+    :param path: JSON配置文件路径，不存在时返回空dict
+    :return: dict
+    """
+    if not path.exists():
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+file_settings = load_config_file()
+
+
+class SettingError(ValueError):
+    """配置值无法转换"""
+
+
+def convert_number(value, number_type):
+    """int类型的配置写了小数时（如滑点0.5）按float转换"""
+    if number_type is int:
+        if isinstance(value, float):
+            return value
+        try:
+            return int(value)
+        except ValueError:
+            return float(value)
+    return number_type(value)
+
+
+def convert_setting(value, default):
+    """
+    按默认值的类型转换配置值（环境变量都是字符串，配置文件中的列表、路径也需要转换）
+    bool：1/true/yes/on为True；tuple：逗号分隔的字符串或列表，默认值中有float时每项按float转换；Path：路径字符串
+    """
+    if value is None or default is None:
+        return value
+    if isinstance(default, bool):
+        return value.strip().lower() in TRUE_VALUES if isinstance(value, str) else bool(value)
+    if isinstance(default, tuple):
+        if isinstance(value, str):
+            value = [item.strip() for item in value.split(',') if item.strip()]
+        if any(isinstance(item, float) for item in default):
+            item_type = float
+        else:
+            item_type = type(default[0]) if default else str
+        if item_type in (int, float):
+            return tuple(convert_number(item, item_type) for item in value)
+        return tuple(item_type(item) for item in value)
+    if isinstance(default, (Path, int, float, str)):
+        return type(default)(value)
+    return value
+
+
+def setting(name, default):
+    """
+    读取一个配置：环境变量BT_<name> > 配置文件中的name > default
+    :param name: 常量名
+    :param default: 默认值，同时决定类型
+    """
+    source = f"环境变量{ENV_PREFIX}{name}"
+    value = os.environ.get(ENV_PREFIX + name)
+    if value is None:
+        source = f"配置文件{CONFIG_FILE}" if name in file_settings else "默认值"
+        value = file_settings.get(name, default)
+    try:
+        return convert_setting(value, default)
+    except (TypeError, ValueError) as e:
+        raise SettingError(f"配置{name}的值无效（{source}）: {value!r}: {e}") from None
+
+
+# 配置数据库连接（游标类型DictCursor由db_pool.connect_kwargs补上）
 db_config = {
-    'host': 'rm-uf6q5h4a7tkthf82cno.mysql.rds.aliyuncs.com',  # 公网地址
-    'port': 3306,                             # 端口
-    'user': 'db_user4',                       # 数据库账号
-    'password': 'Cangjie!user4',              # 数据库密码
-    'database': 'db_test1',                   # 数据库名
-    'charset': 'utf8mb4',                     # 字符编码
-    'client_flag': CLIENT.MULTI_STATEMENTS,   # 允许执行多条SQL语句
-    'cursorclass': pymysql.cursors.DictCursor # 返回字典格式的结果
-}
+    'host': setting('DB_HOST', 'rm-uf6q5h4a7tkthf82cno.mysql.rds.aliyuncs.com'), # 公网地址
+    'port': setting('DB_PORT', 3306),                                            # 端口
+    'user': setting('DB_USER', 'db_user4'),                                      # 数据库账号
+    'password': setting('DB_PASSWORD', 'Cangjie!user4'),                         # 数据库密码
+    'database': setting('DB_NAME', 'db_test1'),                                  # 数据库名
+    'charset': 'utf8mb4',                                                        # 字符编码
+    'client_flag': 1 << 16,                                                      # 允许执行多条SQL语句（pymysql.constants.CLIENT.MULTI_STATEMENTS）
+}                                                                                # local_infile只在BULK_LOAD_MODE为load_data时由db_pool.connect_kwargs开启
 
 
 # 回测目录
-BACKTESTING_DIR = Path("data/backtesting")
-BACKTESTING_NEW_DIR = BACKTESTING_DIR / "new"
-BACKTESTING_PROCESSED_DIR = BACKTESTING_DIR / "processed"
-BACKTESTING_BACKUP_DIR = BACKTESTING_DIR / "backup"
\ No newline at end of file
+BACKTESTING_DIR = setting('BACKTESTING_DIR', Path("data/backtesting"))
+BACKTESTING_NEW_DIR = setting('BACKTESTING_NEW_DIR', BACKTESTING_DIR / "new")
+BACKTESTING_PROCESSED_DIR = setting('BACKTESTING_PROCESSED_DIR', BACKTESTING_DIR / "processed")
+BACKTESTING_BACKUP_DIR = setting('BACKTESTING_BACKUP_DIR', BACKTESTING_DIR / "backup")
+BACKTESTING_INVALID_DIR = setting('BACKTESTING_INVALID_DIR', BACKTESTING_DIR / "invalid")
+INGEST_INDEX_PATH = setting('INGEST_INDEX_PATH', BACKTESTING_DIR / "ingest_index.sqlite") # 已写入文件的内容hash索引
+PARSED_CACHE_DIR = setting('PARSED_CACHE_DIR', BACKTESTING_DIR / "parsed_cache")          # 解析结果的列式缓存
+RUN_JOURNAL_PATH = setting('RUN_JOURNAL_PATH', BACKTESTING_DIR / "run_journal.sqlite")    # 每次写入运行中各文件的状态（--resume从中断处继续）
+
+
+# 解析结果缓存（需要pyarrow）
+PARSED_CACHE_ENABLED = setting('PARSED_CACHE_ENABLED', True)  # 写入时是否同时写缓存，重新处理时从缓存读取
+PARSED_CACHE_FORMAT = setting('PARSED_CACHE_FORMAT', 'arrow') # 'arrow'：Arrow IPC，可内存映射读取；'parquet'：zstd压缩，占用空间更小
+
+
+# 解压
+UNZIP_WORKERS = setting('UNZIP_WORKERS', 4)                 # 并行解压的zip文件数
+UNZIP_CHUNK_SIZE = setting('UNZIP_CHUNK_SIZE', 1024 * 1024) # 流式解压每次读写的字节数
+
+
+# 并行写入
+INGEST_MODE = setting('INGEST_MODE', 'sequential')                          # 'sequential'：逐个文件；'parallel'：先解压再并行写入；'pipeline'：解压、解析、写入流水线；'async'：asyncio并发事务（async_ingest.py）
+INGEST_PARSE_WORKERS = setting('INGEST_PARSE_WORKERS', os.cpu_count() or 1) # 解析excel的进程数
+INGEST_DB_WORKERS = setting('INGEST_DB_WORKERS', 4)                         # 写数据库的线程数（共用连接池）
+INGEST_COMMIT_BATCH_SIZE = setting('INGEST_COMMIT_BATCH_SIZE', 1)           # 每个事务包含的文件数，小文件多时可调大以减少commit次数
+PIPELINE_QUEUE_SIZE = setting('PIPELINE_QUEUE_SIZE', 16)                    # 流水线阶段之间队列的最大长度
+
+
+# Trade表批量写入
+BULK_LOAD_MODE = setting('BULK_LOAD_MODE', 'insert') # 'insert'：分块多行INSERT；'load_data'：LOAD DATA LOCAL INFILE（只有此时连接池的连接开启local_infile）
+BULK_INSERT_ROWS = setting('BULK_INSERT_ROWS', 1000) # insert模式下每条INSERT语句的行数，受max_allowed_packet限制
+
+
+# 维表缓存（ticker、currency、exchange、exchangeticker）
+DIMENSION_CACHE_TTL = setting('DIMENSION_CACHE_TTL', 600) # 缓存有效期（秒），过期后重新批量查询
+
+
+# 连接池与重试
+DB_POOL_SIZE = setting('DB_POOL_SIZE', 4)                 # 最大连接数
+DB_RETRY_TIMES = setting('DB_RETRY_TIMES', 3)             # 连接断开、死锁等可重试错误时，单个文件事务的最多重试次数
+DB_RETRY_BASE_DELAY = setting('DB_RETRY_BASE_DELAY', 1.0) # 第一次重试前等待的秒数，之后每次翻倍
+DB_RETRY_MAX_DELAY = setting('DB_RETRY_MAX_DELAY', 30.0)  # 单次等待的最大秒数
+
+
+# 监听new目录的常驻进程（watcher.py）
+WATCH_POLL_INTERVAL = setting('WATCH_POLL_INTERVAL', 1.0)   # 检查间隔（秒），未安装watchdog时也是扫描目录的间隔
+WATCH_SETTLE_SECONDS = setting('WATCH_SETTLE_SECONDS', 3.0) # 文件大小和修改时间多少秒不变视为上传完成
+WATCH_RETRY_SECONDS = setting('WATCH_RETRY_SECONDS', 300.0) # 写入失败的文件多少秒后重试
+
+
+# 本地分析库（analytics.py，需要duckdb）
+ANALYTICS_ENABLED = setting('ANALYTICS_ENABLED', False)                                # 写入RDS成功后是否同步写入本地DuckDB
+ANALYTICS_DB_PATH = setting('ANALYTICS_DB_PATH', BACKTESTING_DIR / "analytics.duckdb") # 本地分析库文件
+
+
+# 由List of trades重新计算指标（metrics.py）
+METRICS_BATCH_SIZE = setting('METRICS_BATCH_SIZE', 256)          # 每次向量化计算的回测数
+METRICS_RISK_FREE_RATE = setting('METRICS_RISK_FREE_RATE', 0.02) # 计算夏普、索提诺比率的年化无风险收益率
+
+
+# 手续费、滑点重算（simulate.py）
+SIMULATION_COMMISSIONS = setting('SIMULATION_COMMISSIONS', (0.0, 0.02, 0.04, 0.06, 0.08, 0.1)) # 手续费取值（成交金额的%）
+SIMULATION_SLIPPAGES = setting('SIMULATION_SLIPPAGES', (0, 1, 2, 5, 10))                       # 滑点取值（tick）
+SIMULATION_CHUNK_SCENARIOS = setting('SIMULATION_CHUNK_SCENARIOS', 256)                        # 每次向量化计算的场景数，限制内存
+
+
+# 日志与分阶段计时（instrumentation.py）
+LOG_DIR = setting('LOG_DIR', Path("logs"))
+LOG_FILE = setting('LOG_FILE', LOG_DIR / "ingest.jsonl")                                                                  # 结构化JSON日志，每行一条
+DB_LOG_FILE = setting('DB_LOG_FILE', LOG_DIR / "db" / "transactions.log")                                                 # 写入失败的文件记录（db_log）
+METRICS_REPORT_DIR = setting('METRICS_REPORT_DIR', LOG_DIR / "metrics")                                                   # 每次运行的耗时报告（.prom、.json）
+VALIDATION_REPORT_DIR = setting('VALIDATION_REPORT_DIR', LOG_DIR / "validation")                                          # 校验报告（validate.py）
+TIMING_BUCKETS = setting('TIMING_BUCKETS', (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)) # 耗时直方图分桶（秒）
+
+
+# 大文件分块写入Trade表
+STREAMING_FILE_SIZE = setting('STREAMING_FILE_SIZE', 20 * 1024 * 1024) # 超过该大小（字节）的文件不整表解析，List of trades分块读取、转换、写入
+TRADE_CHUNK_ROWS = setting('TRADE_CHUNK_ROWS', 20000)                  # 每块的交易行数
+
+
+# asyncio写入（async_ingest.py，需要aiomysql）
+ASYNC_INGEST_CONCURRENCY = setting('ASYNC_INGEST_CONCURRENCY', 16) # 同时进行的文件事务数（也是aiomysql连接池的最大连接数）
+
+
+# 重新写入（reload.py）
+INGEST_RELOAD = setting('INGEST_RELOAD', False) # 已写入过的回测（策略、交易对、回测区间、设置相同）不再新增，更新BackTesting行并只写入有变化的交易
+
+
+# 运行日志（run_journal.py）
+RUN_JOURNAL_FLUSH_ROWS = setting('RUN_JOURNAL_FLUSH_ROWS', 500) # 缓冲多少条状态后写入一次（已提交的状态在移动文件前立即写入）
@@ -0,0 +1,258 @@
+"""
+数据库连接池
+
+- 连接数上限为size，取出连接时ping检查，断开则自动重连
+- run_in_transaction：在一个连接上执行一个完整事务，连接断开、死锁等可重试错误时回滚，
+  丢弃该连接并按指数退避重试整个事务（最多retries次）
+- commit_transaction：写入事务用它提交；COMMIT已发出后连接断开时服务器可能已经提交，抛出CommitUnknownError，
+  run_in_transaction不直接重试，先用verify_commit在新连接上确认是否已提交，确认未提交才重新执行，避免重复写入
+"""
+import queue
+import random
+import threading
+import time
+from decimal import Decimal
+
+import pymysql
+import pymysql.converters
+from pymysql import Error, InterfaceError, OperationalError
+
+from config import db_config, DB_POOL_SIZE, DB_RETRY_TIMES, DB_RETRY_BASE_DELAY, DB_RETRY_MAX_DELAY, BULK_LOAD_MODE
+
+
+# 可重试的MySQL错误码
+RETRYABLE_ERROR_CODES = {
+    1205,  # Lock wait timeout exceeded
+    1213,  # Deadlock found when trying to get lock
+    2003,  # Can't connect to MySQL server
+    2006,  # MySQL server has gone away
+    2013,  # Lost connection to MySQL server during query
+    2055,  # Lost connection to MySQL server at '...', system error
+}
+
+def escape_decimal(value, mapping=None):
+    """Decimal('NaN')（excel空单元格）写入NULL，与bulk_loader.tsv_field一致"""
+    return 'NULL' if value.is_nan() else pymysql.converters.Decimal2Literal(value, mapping)
+
+
+def escape_float(value, mapping=None):
+    return 'NULL' if value != value else pymysql.converters.escape_float(value, mapping)
+
+
+# pymysql/aiomysql的conv参数：NaN转义为NULL，其他类型与默认相同
+SQL_CONVERSIONS = {**pymysql.converters.conversions, Decimal: escape_decimal, float: escape_float}
+
+
+# 连接断开的错误码（发生在COMMIT时无法确定是否已提交）
+CONNECTION_LOST_ERROR_CODES = {2006, 2013, 2055}
+
+
+class CommitUnknownError(OperationalError):
+    """COMMIT已发出但连接断开，事务是否已提交未知"""
+
+    def __init__(self, *args, result=None):
+        """
+        :param result: 事务函数本来要返回的值（如事务中分配的backtesting_id），用于确认是否已提交
+        """
+        super().__init__(*args)
+        self.result = result
+
+
+def is_connection_lost(e):
+    """
+    判断异常是否为连接断开（发生在COMMIT时无法确定是否已提交）
+    :param e: Exception
+    :return: bool
+    """
+    return is_retryable(e) and (isinstance(e, InterfaceError) or e.args[0] in CONNECTION_LOST_ERROR_CODES)
+
+
+def commit_transaction(connection, result=None):
+    """
+    提交事务；连接在提交过程中断开时抛出CommitUnknownError（其他错误原样抛出）
+    :param connection: 数据库连接实例
+    :param result: 事务函数本来要返回的值，确认是否已提交时使用
+    """
+    try:
+        connection.commit()
+    except Error as e:
+        if is_connection_lost(e):
+            raise CommitUnknownError(*e.args, result=result) from e
+        raise
+
+
+def connect_kwargs(config, local_infile=False):
+    """
+    pymysql.connect的参数：未指定游标类型时使用DictCursor（config.py不导入pymysql，在这里补上），NaN转义为NULL
+    :param config: dict
+    :param local_infile: 是否允许LOAD DATA LOCAL INFILE（只有bulk_loader的load_data模式需要，默认不开启）
+    :return: dict
+    """
+    kwargs = {'cursorclass': pymysql.cursors.DictCursor, 'conv': SQL_CONVERSIONS, **config}
+    if local_infile:
+        kwargs['local_infile'] = True
+    return kwargs
+
+
+def is_retryable(e):
+    """
+    判断异常是否可以通过重连/重试解决
+    :param e: Exception
+    :return: bool
+    """
+    if isinstance(e, InterfaceError):
+        # 连接已关闭等
+        return True
+    if isinstance(e, OperationalError):
+        return bool(e.args) and e.args[0] in RETRYABLE_ERROR_CODES
+    return False
+
+
+class ConnectionPool:
+    def __init__(self, size=DB_POOL_SIZE, retries=DB_RETRY_TIMES, base_delay=DB_RETRY_BASE_DELAY,
+                 max_delay=DB_RETRY_MAX_DELAY, config=None):
+        """
+        :param size: 最大连接数
+        :param retries: 事务最多重试次数
+        :param base_delay: 第一次重试前等待的秒数，之后每次翻倍
+        :param max_delay: 单次等待的最大秒数
+        :param config: pymysql.connect参数，默认config.db_config
+        """
+        self.size = size
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.config = config or db_config
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.created = 0
+
+    def connect(self):
+        connection = pymysql.connect(**connect_kwargs(self.config, local_infile=BULK_LOAD_MODE == 'load_data'))
+        print("成功连接到阿里云RDS数据库")
+        return connection
+
+    def acquire(self, timeout=None):
+        """
+        取出一个连接：优先复用空闲连接（ping检查），未达上限时新建，否则等待其他线程归还
+        :param timeout: 等待归还的秒数，None表示一直等待
+        :return: 连接实例
+        """
+        try:
+            connection = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                can_create = self.created < self.size
+                if can_create:
+                    self.created += 1
+            if can_create:
+                try:
+                    return self.connect()
+                except BaseException:
+                    with self.lock:
+                        self.created -= 1
+                    raise
+            connection = self.idle.get(timeout=timeout)
+
+        # 健康检查：断开则重连，重连失败则丢弃
+        try:
+            connection.ping(reconnect=True)
+        except Error:
+            self.discard(connection)
+            raise
+        return connection
+
+    def release(self, connection):
+        """归还连接"""
+        if connection.open:
+            self.idle.put(connection)
+        else:
+            self.discard(connection)
+
+    def discard(self, connection):
+        """关闭并丢弃连接（连接已断开或状态未知时）"""
+        try:
+            connection.close()
+        except Error:
+            pass
+        with self.lock:
+            self.created -= 1
+
+    def backoff(self, attempt):
+        """第attempt次重试前的等待秒数（指数退避，带随机抖动）"""
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay * random.uniform(0.5, 1)
+
+    def run_in_transaction(self, func, *args, verify_commit=None, **kwargs):
+        """
+        取一个连接执行func(connection, *args, **kwargs)，func内部负责commit（写入事务用commit_transaction）
+        可重试错误时回滚、丢弃连接并重试整个func，其他错误回滚后抛出
+        COMMIT时连接断开（CommitUnknownError）：没有verify_commit时不重试直接抛出；
+        否则在新连接上调用verify_commit(connection, result)，已提交则返回result，确认未提交才重新执行func
+        :param verify_commit: 确认事务是否已提交的函数，返回bool
+        :return: func的返回值
+        """
+        attempt = 0
+        uncertain = None # 提交结果未知的CommitUnknownError，下一次取到连接时先确认
+        while True:
+            connection = None
+            try:
+                connection = self.acquire()
+                if uncertain is not None:
+                    committed = verify_commit(connection, uncertain.result)
+                    connection.rollback()
+                    if committed:
+                        print("提交时连接断开，确认事务已提交，不再重试")
+                        self.release(connection)
+                        return uncertain.result
+                    print("提交时连接断开，确认事务未提交，重新执行")
+                    uncertain = None
+                result = func(connection, *args, **kwargs)
+            except CommitUnknownError as e:
+                if connection is not None:
+                    self.discard(connection)
+                if verify_commit is None or attempt >= self.retries:
+                    raise
+                uncertain = e
+                delay = self.backoff(attempt)
+                attempt += 1
+                print(f"提交时数据库连接异常: {e}，{delay:.1f}s后确认是否已提交")
+                time.sleep(delay)
+                continue
+            except Error as e:
+                if connection is not None:
+                    try:
+                        connection.rollback()
+                    except Error:
+                        pass
+                if not is_retryable(e) or attempt >= self.retries:
+                    if connection is not None:
+                        self.release(connection)
+                    raise
+                if connection is not None:
+                    self.discard(connection)
+                delay = self.backoff(attempt)
+                attempt += 1
+                print(f"数据库连接异常: {e}，{delay:.1f}s后第{attempt}次重试")
+                time.sleep(delay)
+                continue
+            except BaseException:
+                if connection is not None:
+                    try:
+                        connection.rollback()
+                    except Error:
+                        pass
+                    self.release(connection)
+                raise
+
+            self.release(connection)
+            return result
+
+    def close(self):
+        """关闭所有空闲连接"""
+        while True:
+            try:
+                connection = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            self.discard(connection)
@@ -0,0 +1,208 @@
+"""
+ticker、currency、exchange、exchangeticker维表的进程内缓存
+
+- 启动时（或过期后）每张表一次批量查询预热
+- 在内存中将(exchange, symbol, currency)解析为exchangeticker_id
+- 缓存未命中时先查询，仍不存在才用参数化的INSERT ... ON DUPLICATE KEY UPDATE插入
+- 本事务新插入的id先放在线程内的待提交区，commit后才对其他线程可见，rollback则丢弃
+- 查询语句和缓存逻辑（load、cached_name、cached_exchangeticker等）不涉及数据库IO，asyncio版本（async_ingest.py）共用，
+  子类只需重写warm、resolve、resolve_name、select_or_insert中的IO部分和待提交区的存放位置
+"""
+import threading
+import time
+
+from config import DIMENSION_CACHE_TTL
+
+
+# 名称维表：表名 -> 名称列
+NAME_TABLES = {
+    'ticker': 'symbol',
+    'currency': 'name',
+    'exchange': 'name',
+}
+
+EXCHANGETICKER_WARM_QUERY = "select id, ticker_id, currency_id, exchange_id from exchangeticker"
+
+EXCHANGETICKER_SELECT_QUERY = "select id from exchangeticker where ticker_id=%s and currency_id=%s and exchange_id=%s"
+
+EXCHANGETICKER_INSERT_QUERY = (
+    "insert into exchangeticker (ticker_id, currency_id, exchange_id) values (%s, %s, %s) "
+    "on duplicate key update id=LAST_INSERT_ID(id)"
+)
+
+
+def name_warm_query(table):
+    return f"select id, {NAME_TABLES[table]} as name from {table}"
+
+
+def name_select_query(table):
+    return f"select id from {table} where {NAME_TABLES[table]}=%s"
+
+
+def name_insert_query(table):
+    return f"insert into {table} ({NAME_TABLES[table]}) values (%s) on duplicate key update id=LAST_INSERT_ID(id)"
+
+
+class DimensionCache:
+    def __init__(self, ttl=DIMENSION_CACHE_TTL):
+        """
+        :param ttl: 缓存有效期（秒），过期后下次解析时重新预热；None表示不过期
+        """
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.names = {table: {} for table in NAME_TABLES}   # 表名 -> {名称: id}
+        self.exchangetickers = {}                           # (ticker_id, currency_id, exchange_id) -> id
+        self.warmed_at = None
+        self.hits = 0
+        self.misses = 0
+        self.queries = 0
+
+    def warm(self, cursor):
+        """
+        每张表一次查询，重建缓存
+        :param cursor: 数据库游标
+        """
+        name_rows = {}
+        for table in NAME_TABLES:
+            cursor.execute(name_warm_query(table))
+            name_rows[table] = cursor.fetchall()
+        cursor.execute(EXCHANGETICKER_WARM_QUERY)
+        self.load(name_rows, cursor.fetchall())
+
+    def load(self, name_rows, exchangeticker_rows):
+        """
+        用预热查询的结果重建缓存
+        :param name_rows: 表名 -> name_warm_query的fetchall()结果
+        :param exchangeticker_rows: EXCHANGETICKER_WARM_QUERY的fetchall()结果
+        """
+        names = {table: {row['name']: row['id'] for row in rows} for table, rows in name_rows.items()}
+        exchangetickers = {
+            (row['ticker_id'], row['currency_id'], row['exchange_id']): row['id'] for row in exchangeticker_rows
+        }
+        with self.lock:
+            self.names = names
+            self.exchangetickers = exchangetickers
+            self.warmed_at = time.monotonic()
+
+    def expired(self):
+        if self.warmed_at is None:
+            return True
+        return self.ttl is not None and time.monotonic() - self.warmed_at > self.ttl
+
+    def pending(self):
+        """本线程当前事务中新插入、尚未提交的id"""
+        if not hasattr(self.local, 'names'):
+            self.local.names = {table: {} for table in NAME_TABLES}
+            self.local.exchangetickers = {}
+        return self.local.names, self.local.exchangetickers
+
+    def has_pending(self):
+        pending_names, pending_exchangetickers = self.pending()
+        return bool(pending_exchangetickers) or any(pending_names.values())
+
+    def needs_warm(self):
+        """本线程有未提交的插入时不重新预热，避免把未提交的id放进共享缓存"""
+        return self.expired() and not self.has_pending()
+
+    def cached_name(self, table, name):
+        """:return: 缓存或本事务待提交区中的id，未命中返回None"""
+        pending_names, _ = self.pending()
+        return self.names[table].get(name) or pending_names[table].get(name)
+
+    def remember_name(self, table, name, row_id):
+        pending_names, _ = self.pending()
+        pending_names[table][name] = row_id
+
+    def cached_exchangeticker(self, key):
+        """
+        查缓存并计入命中/未命中次数
+        :param key: (ticker_id, currency_id, exchange_id)
+        :return: exchangeticker_id，未命中返回None
+        """
+        _, pending_exchangetickers = self.pending()
+        exchangeticker_id = self.exchangetickers.get(key) or pending_exchangetickers.get(key)
+        with self.lock:
+            if exchangeticker_id:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return exchangeticker_id
+
+    def remember_exchangeticker(self, key, exchangeticker_id):
+        _, pending_exchangetickers = self.pending()
+        pending_exchangetickers[key] = exchangeticker_id
+
+    def count_query(self):
+        with self.lock:
+            self.queries += 1
+
+    def resolve(self, cursor, exchange, symbol, currency_name):
+        """
+        解析exchangeticker_id，不存在则依次插入ticker、currency、exchange、exchangeticker
+        :param cursor: 数据库游标
+        :return: exchangeticker_id
+        """
+        if self.needs_warm():
+            self.warm(cursor)
+
+        ticker_id = self.resolve_name(cursor, 'ticker', symbol)
+        currency_id = self.resolve_name(cursor, 'currency', currency_name)
+        exchange_id = self.resolve_name(cursor, 'exchange', exchange)
+        key = (ticker_id, currency_id, exchange_id)
+
+        exchangeticker_id = self.cached_exchangeticker(key)
+        if exchangeticker_id:
+            return exchangeticker_id
+
+        exchangeticker_id = self.select_or_insert(cursor, EXCHANGETICKER_SELECT_QUERY, EXCHANGETICKER_INSERT_QUERY, key)
+        self.remember_exchangeticker(key, exchangeticker_id)
+        return exchangeticker_id
+
+    def resolve_name(self, cursor, table, name):
+        """
+        解析ticker/currency/exchange的id（未命中时查询或插入）
+        :return: id
+        """
+        row_id = self.cached_name(table, name)
+        if row_id:
+            return row_id
+
+        row_id = self.select_or_insert(cursor, name_select_query(table), name_insert_query(table), (name,))
+        self.remember_name(table, name, row_id)
+        return row_id
+
+    def select_or_insert(self, cursor, select_query, insert_query, params):
+        """先查询（可能是其他进程在预热后插入的），不存在再插入"""
+        self.count_query()
+        cursor.execute(select_query, params)
+        row = cursor.fetchone()
+        if row:
+            return row['id']
+
+        self.count_query()
+        cursor.execute(insert_query, params)
+        return cursor.lastrowid
+
+    def commit(self):
+        """事务提交后调用：本线程新插入的id写入共享缓存"""
+        pending_names, pending_exchangetickers = self.pending()
+        with self.lock:
+            for table, names in pending_names.items():
+                self.names[table].update(names)
+            self.exchangetickers.update(pending_exchangetickers)
+        self.clear_pending()
+
+    def rollback(self):
+        """事务回滚后调用：丢弃本线程新插入的id"""
+        self.clear_pending()
+
+    def clear_pending(self):
+        self.local.__dict__.clear()
+
+    def stats(self):
+        """
+        :return: dict，命中/未命中次数和未命中时发出的查询数
+        """
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'queries': self.queries}
@@ -0,0 +1,197 @@
+"""
+已写入文件的本地索引（SQLite，位于BACKTESTING_DIR下）
+
+- files：文件内容sha256 -> backtesting_id，已写入的文件在解析前跳过
+- zip_members：zip成员的(CRC, 大小) -> 解压出的文件内容sha256，成员对应的文件已写入时不再解压
+- pending_commits：事务COMMIT之前记录的(hash, backtesting_id, strategy, symbol)，提交后记录到files时删除；
+  进程在RDS提交后、记录到files之前中断时留下，下次运行按backtesting_id确认是否已提交（Backtesting.resolve_pending_commits）
+- verify：检查索引中的backtesting_id在BackTesting表中是否还存在
+"""
+import hashlib
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+
+from config import INGEST_INDEX_PATH
+
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    """
+    分块计算文件内容的sha256
+    :param path: str | Path
+    :return: str
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class IngestIndex:
+    def __init__(self, path=INGEST_INDEX_PATH):
+        """
+        :param path: SQLite文件路径
+        """
+        self.path = path
+        self.owner = uuid.uuid4().hex  # 本进程写入的待确认记录的标识，其他标识的记录来自已结束（中断）的进程
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+        self.db.executescript("""
+            create table if not exists files (
+                hash text primary key,
+                file_name text,
+                backtesting_id integer,
+                ingested_at text
+            );
+            create table if not exists zip_members (
+                crc integer,
+                size integer,
+                hash text,
+                member_name text,
+                zip_name text,
+                primary key (crc, size)
+            );
+            create table if not exists pending_commits (
+                hash text primary key,
+                file_name text,
+                backtesting_id integer,
+                strategy text,
+                symbol text,
+                owner text,
+                recorded_at text
+            );
+        """)
+
+    def lookup_file(self, file_hash):
+        """
+        :return: backtesting_id，未写入过返回None
+        """
+        with self.lock:
+            row = self.db.execute("select backtesting_id from files where hash=?", (file_hash,)).fetchone()
+        return row[0] if row else None
+
+    def record_files(self, entries):
+        """
+        记录已提交的文件（同时删除这些文件的待确认记录）
+        :param entries: [(hash, file_name, backtesting_id), ...]
+        """
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock, self.db:
+            self.db.executemany(
+                "insert or replace into files (hash, file_name, backtesting_id, ingested_at) values (?, ?, ?, ?)",
+                [(file_hash, file_name, backtesting_id, now) for file_hash, file_name, backtesting_id in entries]
+            )
+            self.db.executemany("delete from pending_commits where hash=?", [(entry[0],) for entry in entries])
+
+    def record_pending(self, entries):
+        """
+        事务COMMIT之前记录（写入SQLite后才返回），同一文件重试时覆盖之前的记录
+        :param entries: [(hash, file_name, backtesting_id, strategy, symbol), ...]
+        """
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock, self.db:
+            self.db.executemany(
+                "insert or replace into pending_commits (hash, file_name, backtesting_id, strategy, symbol, owner, recorded_at) "
+                "values (?, ?, ?, ?, ?, ?, ?)",
+                [entry + (self.owner, now) for entry in map(tuple, entries)]
+            )
+
+    def stale_pending(self):
+        """
+        其他（已中断的）进程留下的待确认记录，本进程正在进行的事务的记录不包括在内
+        :return: [(hash, file_name, backtesting_id, strategy, symbol), ...]
+        """
+        with self.lock:
+            return self.db.execute(
+                "select hash, file_name, backtesting_id, strategy, symbol from pending_commits where owner != ?",
+                (self.owner,)
+            ).fetchall()
+
+    def discard_pending(self, hashes):
+        """删除待确认记录（确认未提交，文件重新写入）"""
+        with self.lock, self.db:
+            self.db.executemany("delete from pending_commits where hash=?", [(file_hash,) for file_hash in hashes])
+
+    def is_member_ingested(self, crc, size):
+        """
+        zip成员解压出的文件是否已写入数据库
+        :param crc: ZipInfo.CRC
+        :param size: ZipInfo.file_size
+        :return: bool
+        """
+        with self.lock:
+            row = self.db.execute(
+                "select 1 from zip_members m join files f on f.hash = m.hash where m.crc=? and m.size=?",
+                (crc, size)
+            ).fetchone()
+        return row is not None
+
+    def record_member(self, crc, size, file_hash, member_name, zip_name):
+        """记录zip成员与解压出的文件内容hash的对应关系"""
+        with self.lock, self.db:
+            self.db.execute(
+                "insert or replace into zip_members (crc, size, hash, member_name, zip_name) values (?, ?, ?, ?, ?)",
+                (crc, size, file_hash, member_name, zip_name)
+            )
+
+    def verify(self, cursor, prune=False, chunk_size=1000):
+        """
+        检查索引中的backtesting_id是否仍在BackTesting表中
+        :param cursor: 数据库游标
+        :param prune: 是否从索引中删除不存在的记录（删除后这些文件会被重新写入）
+        :param chunk_size: 每次查询的id数
+        :return: list，BackTesting表中已不存在的(hash, file_name, backtesting_id)
+        """
+        with self.lock:
+            entries = self.db.execute("select hash, file_name, backtesting_id from files").fetchall()
+
+        missing = []
+        for start in range(0, len(entries), chunk_size):
+            chunk = entries[start:start + chunk_size]
+            ids = [entry[2] for entry in chunk]
+            cursor.execute(
+                f"select id from BackTesting where id in ({', '.join(['%s'] * len(ids))})", ids
+            )
+            existing = {row['id'] for row in cursor.fetchall()}
+            missing.extend(entry for entry in chunk if entry[2] not in existing)
+
+        if prune and missing:
+            with self.lock, self.db:
+                self.db.executemany("delete from files where hash=?", [(entry[0],) for entry in missing])
+        return missing
+
+    def stats(self):
+        """
+        :return: dict，已记录的文件数、zip成员数、待确认的提交数、最后一次写入时间
+        """
+        with self.lock:
+            files, last_ingested_at = self.db.execute("select count(*), max(ingested_at) from files").fetchone()
+            members = self.db.execute("select count(*) from zip_members").fetchone()[0]
+            pending = self.db.execute("select count(*) from pending_commits").fetchone()[0]
+        return {'files': files, 'zip_members': members, 'pending_commits': pending, 'last_ingested_at': last_ingested_at}
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+_ingest_index = None
+_ingest_index_lock = threading.Lock()
+
+
+def get_ingest_index():
+    """
+    进程内共享的索引实例（首次使用时打开）
+    :return: IngestIndex
+    """
+    global _ingest_index
+    with _ingest_index_lock:
+        if _ingest_index is None:
+            INGEST_INDEX_PATH.parent.mkdir(parents=True, exist_ok=True)
+            _ingest_index = IngestIndex()
+        return _ingest_index
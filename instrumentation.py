@@ -0,0 +1,274 @@
+"""
+结构化日志与分阶段计时
+
+- get_logger：JSON日志（每行一个JSON），日志记录先放入队列，由后台线程写文件，不阻塞写入线程
+- span / timed：计时上下文管理器和装饰器，结束时写一条span日志并记入该阶段的耗时直方图
+- run_with_metrics / merge_metrics：进程池中执行的函数（如解析）把子进程中的计时带回主进程
+- prometheus_text / json_report / write_metrics_report：导出各阶段耗时直方图（Prometheus文本格式或JSON），找出限制吞吐量的阶段
+"""
+import json
+import logging
+import logging.handlers
+import multiprocessing.util
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+from config import LOG_FILE, METRICS_REPORT_DIR, TIMING_BUCKETS
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'event': record.getMessage(),
+            'pid': record.process,
+            'thread': record.threadName,
+        }
+        entry.update(getattr(record, 'fields', {}))
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+_logger = None
+_logger_pid = None
+_logger_lock = threading.Lock()
+
+
+def get_logger():
+    """
+    进程内共享的JSON日志（每个进程各自启动后台写线程，追加写同一个文件）
+    :return: logging.Logger
+    """
+    global _logger, _logger_pid
+    with _logger_lock:
+        if _logger is None or _logger_pid != os.getpid():
+            LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
+            file_handler = logging.FileHandler(LOG_FILE, encoding='utf-8')
+            file_handler.setFormatter(JsonFormatter())
+
+            log_queue = queue.SimpleQueue()
+            listener = logging.handlers.QueueListener(log_queue, file_handler)
+            listener.start()
+            # 退出时写完队列中的日志（进程池的子进程不执行atexit，但会执行multiprocessing的finalizer）
+            multiprocessing.util.Finalize(None, listener.stop, exitpriority=10)
+
+            logger = logging.getLogger(f'backtesting.{os.getpid()}')
+            logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            _logger, _logger_pid = logger, os.getpid()
+        return _logger
+
+
+def log_event(event, level=logging.INFO, **fields):
+    """
+    写一条结构化日志
+    :param event: 事件名
+    :param fields: 附加字段
+    """
+    get_logger().log(level, event, extra={'fields': fields})
+
+
+class Histogram:
+    def __init__(self, buckets=TIMING_BUCKETS):
+        """
+        累积分桶的耗时直方图（与Prometheus histogram相同的le分桶）
+        :param buckets: 各桶上界（秒），升序
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1) # 最后一个为+Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def merge(self, other):
+        for i, count in enumerate(other['counts']):
+            self.counts[i] += count
+        self.count += other['count']
+        self.sum += other['sum']
+
+    def snapshot(self):
+        return {'counts': list(self.counts), 'count': self.count, 'sum': self.sum}
+
+    def quantile(self, q):
+        """
+        由分桶估计分位数（桶内线性插值，与Prometheus的histogram_quantile相同）
+        :return: 秒，没有数据返回None
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        lower = 0.0
+        for i, count in enumerate(self.counts):
+            upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+            if count and cumulative + count >= rank:
+                if i == len(self.buckets):
+                    return upper
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = upper
+        return self.buckets[-1]
+
+
+class TimingRegistry:
+    def __init__(self):
+        """各阶段的耗时直方图，key为(阶段名, 粒度)，粒度为'file'（单个文件/单次调用）或'run'（整次运行）"""
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def observe(self, name, seconds, scope='file'):
+        with self.lock:
+            histogram = self.histograms.get((name, scope))
+            if histogram is None:
+                histogram = self.histograms[(name, scope)] = Histogram()
+            histogram.observe(seconds)
+
+    def drain(self):
+        """
+        取出并清空所有直方图（子进程把计时带回主进程时使用）
+        :return: list，[(阶段名, 粒度, snapshot), ...]
+        """
+        with self.lock:
+            snapshots = [(name, scope, histogram.snapshot()) for (name, scope), histogram in self.histograms.items()]
+            self.histograms = {}
+        return snapshots
+
+    def merge(self, snapshots):
+        with self.lock:
+            for name, scope, snapshot in snapshots:
+                histogram = self.histograms.get((name, scope))
+                if histogram is None:
+                    histogram = self.histograms[(name, scope)] = Histogram()
+                histogram.merge(snapshot)
+
+    def items(self):
+        with self.lock:
+            return sorted(self.histograms.items())
+
+
+registry = TimingRegistry()
+
+
+@contextmanager
+def span(name, scope='file', **fields):
+    """
+    计时一个阶段：结束时（包括异常退出）写一条span日志并记入直方图
+    :param name: 阶段名
+    :param scope: 'file' 或 'run'
+    :param fields: 写入日志的附加字段（如文件名、行数）
+    """
+    start = time.perf_counter()
+    status = 'ok'
+    try:
+        yield fields
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        registry.observe(name, seconds, scope)
+        log_event('span', name=name, scope=scope, status=status, duration_ms=round(seconds * 1000, 3), **fields)
+
+
+def timed(name, scope='file'):
+    """span的装饰器形式"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, scope):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def run_with_metrics(func, *args):
+    """
+    在进程池中执行func，并把子进程中记录的计时一起返回
+    :return: (func的返回值, 计时snapshot)，主进程用merge_metrics取出返回值
+    """
+    registry.drain()
+    result = func(*args)
+    return result, registry.drain()
+
+
+def merge_metrics(result_with_metrics):
+    """
+    合并run_with_metrics带回的计时
+    :return: func的返回值
+    """
+    result, snapshots = result_with_metrics
+    registry.merge(snapshots)
+    return result
+
+
+def prometheus_text(prefix='backtesting_stage_seconds'):
+    """
+    :return: Prometheus文本格式的所有直方图
+    """
+    lines = [f"# HELP {prefix} Time spent in each ingest stage.", f"# TYPE {prefix} histogram"]
+    for (name, scope), histogram in registry.items():
+        labels = f'stage="{name}",scope="{scope}"'
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f'{prefix}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{prefix}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f'{prefix}_sum{{{labels}}} {histogram.sum}')
+        lines.append(f'{prefix}_count{{{labels}}} {histogram.count}')
+    return '\n'.join(lines) + '\n'
+
+
+def json_report():
+    """
+    :return: dict，'阶段名/粒度' -> 次数、总耗时、平均、p50、p95、p99（秒）及分桶
+    """
+    report = {}
+    for (name, scope), histogram in registry.items():
+        report[f'{name}/{scope}'] = {
+            'count': histogram.count,
+            'sum_seconds': histogram.sum,
+            'mean_seconds': histogram.sum / histogram.count if histogram.count else None,
+            'p50_seconds': histogram.quantile(0.5),
+            'p95_seconds': histogram.quantile(0.95),
+            'p99_seconds': histogram.quantile(0.99),
+            'buckets': dict(zip([str(bound) for bound in histogram.buckets] + ['+Inf'], histogram.counts)),
+        }
+    return report
+
+
+def write_metrics_report(run_name):
+    """
+    写出本次运行的Prometheus文本和JSON报告，并打印各阶段耗时
+    :param run_name: 运行名称（用于文件名）
+    :return: (prom文件路径, json文件路径)
+    """
+    METRICS_REPORT_DIR.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    prom_path = METRICS_REPORT_DIR / f"{run_name}_{stamp}.prom"
+    json_path = METRICS_REPORT_DIR / f"{run_name}_{stamp}.json"
+
+    report = json_report()
+    prom_path.write_text(prometheus_text(), encoding='utf-8')
+    json_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+
+    print("===== 各阶段耗时 =====")
+    for key, stats in sorted(report.items(), key=lambda item: -item[1]['sum_seconds']):
+        print(f"{key:<32} {stats['count']:>6} 次，总 {stats['sum_seconds']:.2f}s，平均 {stats['mean_seconds'] * 1000:.1f}ms，"
+              f"p95 {stats['p95_seconds'] * 1000:.1f}ms")
+    print(f"耗时报告: {prom_path}、{json_path}")
+    return prom_path, json_path
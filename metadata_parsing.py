@@ -0,0 +1,128 @@
+"""
+解析回测excel的表头元数据：指标标签、日期、strategy、exchange、symbol
+
+- label_key：A列指标标签 -> json key（按标签缓存，同一标签在所有文件中只转换一次）
+- DateParser：每个文件一个实例，第一次解析时确定日期格式并记住，之后先用该格式，失败才依次尝试其他格式
+- strategy_from_file_name：文件名中最后一个"_"之前的部分
+- split_symbol：Properties中的Symbol（如 BINANCE:BTCUSDT）拆成exchange和symbol，只去掉末尾的currency（按symbol缓存）
+    原来用symbol.strip(currency_name)，strip按字符集合去掉两端的字符，
+    如 BINANCE:DOTUSDT 得到 DO、TSX:...开头的T、S也会被去掉，错误的symbol会插入多余的ticker
+"""
+import re
+from datetime import datetime
+from functools import lru_cache
+
+
+# Properties中日期的格式，按出现频率排序
+DATE_FORMATS = (
+    "%b %d, %Y, %H:%M",  # Oct 10, 2022, 12:00
+    "%Y-%m-%d %H:%M:%S",  # 2022-10-10 12:00:00
+    "%m/%d/%Y %H:%M"  # 10/10/2022 12:00
+)
+
+# Trading range / Backtesting range的分隔符
+DATE_RANGE_SEPARATOR = "—"
+
+# 文件名：strategy_后缀（后缀中不含"_"）
+FILE_NAME_PATTERN = re.compile(r'^(?P<strategy>.+)_[^_]*$', re.S)
+
+# Symbol：exchange:symbol
+SYMBOL_PATTERN = re.compile(r'^\s*(?P<exchange>[^:\s]+):(?P<symbol>\S+?)\s*$')
+
+# 标签中需要替换的字符，顺序与原来的replace链一致
+LABEL_REPLACEMENTS = ((' & ', '_and_'), (' ', '_'), ('&', '_and_'), ('/', '_'), ('%', 'percent'))
+
+
+@lru_cache(maxsize=None)
+def label_key(label):
+    """
+    A列指标标签 -> json key，如 Net Profit -> net_profit、Avg # Bars in Trades -> avg_#_bars_in_trades
+    :param label: str
+    :return: str
+    """
+    key = label.lower()
+    for old, new in LABEL_REPLACEMENTS:
+        key = key.replace(old, new)
+    return key
+
+
+class DateParser:
+    """
+    一个文件的日期解析器：记住上一次成功的格式，同一文件中的日期通常格式相同，避免每次都从第一个格式开始试
+    """
+
+    def __init__(self, formats=DATE_FORMATS):
+        self.formats = formats
+        self.format = None
+
+    def parse(self, date_str):
+        """
+        :param date_str: str
+        :return: datetime
+        """
+        date_str = date_str.strip()
+        if self.format:
+            try:
+                return datetime.strptime(date_str, self.format)
+            except ValueError:
+                pass
+        for fmt in self.formats:
+            if fmt == self.format:
+                continue
+            try:
+                value = datetime.strptime(date_str, fmt)
+            except ValueError:
+                continue
+            self.format = fmt
+            return value
+        raise ValueError(f"Cannot parse date: {date_str}")
+
+    def parse_range(self, date_str):
+        """
+        解析 "开始 — 结束"
+        :param date_str: str
+        :return: (开始, 结束)，不是日期范围时为(None, None)
+        """
+        if not date_str or not isinstance(date_str, str):
+            return None, None
+        parts = date_str.split(DATE_RANGE_SEPARATOR)
+        if len(parts) == 2:
+            return self.parse(parts[0]), self.parse(parts[1])
+        return None, None
+
+
+def strategy_from_file_name(file_name):
+    """
+    :param file_name: str，如 MACD Cross_BINANCE_BTCUSDT_2024-01-01.xlsx
+    :return: str，文件名中最后一个"_"之前的部分；没有"_"时为去掉扩展名的文件名
+    """
+    match = FILE_NAME_PATTERN.match(file_name)
+    if match:
+        return match.group('strategy')
+    return file_name.rsplit('.', 1)[0]
+
+
+@lru_cache(maxsize=None)
+def currency_suffix_pattern(currency_name):
+    """:return: 匹配symbol末尾currency的正则（每个currency编译一次）"""
+    return re.compile(rf'^(?P<base>.+?){re.escape(currency_name)}$')
+
+
+@lru_cache(maxsize=4096)
+def split_symbol(symbol, currency_name):
+    """
+    拆分exchange和symbol，symbol只去掉末尾的currency（symbol与currency相同时保留），按(symbol, currency)缓存
+    如 (BINANCE:BTCUSDT, USDT) -> (BINANCE, BTC)，(BINANCE:BTCUSDT.P, USDT) -> (BINANCE, BTCUSDT.P)
+    :param symbol: str
+    :param currency_name: str
+    :return: (exchange, symbol)
+    """
+    match = SYMBOL_PATTERN.match(symbol or '')
+    if not match:
+        raise ValueError(f"Cannot parse symbol: {symbol}")
+    exchange, symbol = match.group('exchange', 'symbol')
+    if currency_name:
+        base = currency_suffix_pattern(currency_name).match(symbol)
+        if base:
+            symbol = base.group('base')
+    return exchange, symbol
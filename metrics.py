@@ -0,0 +1,391 @@
+"""
+由List of trades重新计算绩效指标（NumPy向量化，一次处理一批回测）
+
+- build_trade_arrays：把多个回测的平仓记录排成 (回测数, 最大交易数) 的补齐矩阵
+- compute_metrics：一次算出所有回测 all/long/short 的净利润、毛利润/亏损、盈利因子、胜率、平均/最大盈亏，
+  以及（仅all）最大回撤、最大涨幅、按月收益计算的夏普和索提诺比率
+- check_against_export：与导出的Performance、Trades analysis、Risk performance ratios比较，返回不一致的指标
+- check_fixtures：与benchmarks/metrics_fixtures.json中手算的期望值比较（合成导出文件的汇总表由同样的公式生成，
+  只用它校验是循环论证，公式本身的正确性由手算基准保证）
+只使用每笔交易的平仓行（Exit ...），累计盈亏由单笔盈亏重新累加，修改单笔盈亏后（如手续费、滑点假设）可直接重算
+用法：python metrics.py  （对processed目录中的文件做自检）
+"""
+import json
+import math
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from config import METRICS_BATCH_SIZE, METRICS_RISK_FREE_RATE
+from schema import BACKTESTING_FIELDS, TRADE_FIELDS
+
+
+DIRECTIONS = ('all', 'long', 'short')
+
+# 导出表中各方向对应的列（build_sheet_data中的列名）
+DIRECTION_COLUMNS = {'all': 'All', 'long': 'Long', 'short': 'Short'}
+
+# trade行（不含backtesting_id）中用到的字段位置
+TRADE_ID_INDEX = TRADE_FIELDS.index('trade_id') - 1
+TRADE_TYPE_INDEX = TRADE_FIELDS.index('trade_type') - 1
+EXEC_TIME_INDEX = TRADE_FIELDS.index('exec_time') - 1
+PNL_INDEX = TRADE_FIELDS.index('pnl_absolute') - 1
+RUNUP_INDEX = TRADE_FIELDS.index('runup_absolute') - 1
+DRAWDOWN_INDEX = TRADE_FIELDS.index('drawdown_absolute') - 1
+
+# backtesting行（不含ticker_id）中用到的字段位置
+PERFORMANCE_INDEX = BACKTESTING_FIELDS.index('performance') - 1
+TRADES_ANALYSIS_INDEX = BACKTESTING_FIELDS.index('trades_analysis') - 1
+RISK_PERFORMANCE_INDEX = BACKTESTING_FIELDS.index('risk_performance_ratios') - 1
+INITIAL_CAPITAL_INDEX = BACKTESTING_FIELDS.index('initial_capital') - 1
+
+# 计算出的指标 -> (所在sheet字段位置, 导出表中可能的key)，不同版本的导出行名略有不同
+EXPORT_METRICS = {
+    'net_profit': (PERFORMANCE_INDEX, ('net_profit',)),
+    'gross_profit': (PERFORMANCE_INDEX, ('gross_profit',)),
+    'gross_loss': (PERFORMANCE_INDEX, ('gross_loss',)),
+    'max_drawdown': (PERFORMANCE_INDEX, ('max_equity_drawdown', 'max_drawdown')),
+    'max_runup': (PERFORMANCE_INDEX, ('max_equity_run-up', 'max_run-up')),
+    'total_closed_trades': (TRADES_ANALYSIS_INDEX, ('total_closed_trades', 'total_trades')),
+    'winning_trades': (TRADES_ANALYSIS_INDEX, ('number_winning_trades', 'winning_trades')),
+    'losing_trades': (TRADES_ANALYSIS_INDEX, ('number_losing_trades', 'losing_trades')),
+    'percent_profitable': (TRADES_ANALYSIS_INDEX, ('percent_profitable',)),
+    'avg_trade': (TRADES_ANALYSIS_INDEX, ('avg_trade', 'avg_p_and_l')),
+    'avg_winning_trade': (TRADES_ANALYSIS_INDEX, ('avg_winning_trade',)),
+    'avg_losing_trade': (TRADES_ANALYSIS_INDEX, ('avg_losing_trade',)),
+    'largest_winning_trade': (TRADES_ANALYSIS_INDEX, ('largest_winning_trade',)),
+    'largest_losing_trade': (TRADES_ANALYSIS_INDEX, ('largest_losing_trade',)),
+    'profit_factor': (RISK_PERFORMANCE_INDEX, ('profit_factor',)),
+    'sharpe_ratio': (RISK_PERFORMANCE_INDEX, ('sharpe_ratio',)),
+    'sortino_ratio': (RISK_PERFORMANCE_INDEX, ('sortino_ratio',)),
+}
+
+# 手算的指标基准
+METRICS_FIXTURES_PATH = Path(__file__).parent / 'benchmarks' / 'metrics_fixtures.json'
+
+# 导出表中有的版本记为负数、有的记为正数的指标，比较绝对值
+ABSOLUTE_METRICS = {'gross_loss', 'avg_losing_trade', 'largest_losing_trade', 'max_drawdown'}
+
+
+def exit_rows(trade_rows):
+    """
+    :param trade_rows: build_trade_rows返回的trade行
+    :return: 平仓行（每笔交易一行），按交易编号升序（导出文件中可能是倒序）
+    """
+    exits = [row for row in trade_rows if str(row[TRADE_TYPE_INDEX]).lower().startswith('exit')]
+    return sorted(exits, key=lambda row: row[TRADE_ID_INDEX])
+
+
+def build_trade_arrays(trade_rows_list):
+    """
+    把一批回测的平仓记录排成补齐的二维数组（每行一个回测，不足的位置valid为False，数值为0）
+    :param trade_rows_list: [trade_rows, ...]
+    :return: dict，pnl、runup、drawdown为float64，is_long、valid为bool，exit_month为datetime64[M]，均为 (回测数, 最大交易数)
+    """
+    exits = [exit_rows(trade_rows) for trade_rows in trade_rows_list]
+    lengths = np.array([len(rows) for rows in exits], dtype=np.int64)
+    flat = [row for rows in exits for row in rows]
+
+    shape = (len(exits), int(lengths.max()) if len(exits) else 0)
+    valid = np.arange(shape[1]) < lengths[:, None]
+
+    def padded(values, dtype, fill):
+        array = np.full(shape, fill, dtype=dtype)
+        array[valid] = np.asarray(values, dtype=dtype) if values else np.empty(0, dtype=dtype)
+        return array
+
+    return {
+        'pnl': padded([float(row[PNL_INDEX]) for row in flat], np.float64, 0.0),
+        'runup': padded([abs(float(row[RUNUP_INDEX])) for row in flat], np.float64, 0.0),
+        'drawdown': padded([abs(float(row[DRAWDOWN_INDEX])) for row in flat], np.float64, 0.0),
+        'is_long': padded(['long' in str(row[TRADE_TYPE_INDEX]).lower() for row in flat], bool, False),
+        'exit_month': padded([np.datetime64(row[EXEC_TIME_INDEX], 'M') for row in flat], 'datetime64[M]',
+                             np.datetime64('NaT')),
+        'valid': valid,
+    }
+
+
+def safe_divide(numerator, denominator):
+    """逐元素相除，分母为0时为NaN"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator != 0, numerator / np.where(denominator != 0, denominator, 1), np.nan)
+
+
+def trade_statistics(pnl, mask):
+    """
+    按方向统计的指标
+    :param pnl: (回测数, 最大交易数)
+    :param mask: 参与统计的交易
+    :return: dict，指标 -> (回测数,)
+    """
+    wins = mask & (pnl > 0)
+    losses = mask & (pnl < 0)
+    total = mask.sum(axis=1)
+    winning = wins.sum(axis=1)
+    losing = losses.sum(axis=1)
+    gross_profit = np.where(wins, pnl, 0.0).sum(axis=1)
+    gross_loss = -np.where(losses, pnl, 0.0).sum(axis=1)
+    net_profit = np.where(mask, pnl, 0.0).sum(axis=1)
+    return {
+        'net_profit': net_profit,
+        'gross_profit': gross_profit,
+        'gross_loss': gross_loss,
+        'profit_factor': safe_divide(gross_profit, gross_loss),
+        'total_closed_trades': total,
+        'winning_trades': winning,
+        'losing_trades': losing,
+        'percent_profitable': safe_divide(winning * 100.0, total),
+        'avg_trade': safe_divide(net_profit, total),
+        'avg_winning_trade': safe_divide(gross_profit, winning),
+        'avg_losing_trade': safe_divide(-gross_loss, losing),
+        'largest_winning_trade': np.where(winning > 0, np.where(wins, pnl, -np.inf).max(axis=1, initial=-np.inf), np.nan),
+        'largest_losing_trade': np.where(losing > 0, np.where(losses, pnl, np.inf).min(axis=1, initial=np.inf), np.nan),
+    }
+
+
+def equity_statistics(arrays):
+    """
+    基于权益曲线的指标（所有交易）：最大回撤、最大涨幅
+    交易中的权益高点为 平仓前权益+run-up，低点为 平仓前权益-drawdown
+    :return: dict，指标 -> (回测数,)
+    """
+    pnl, runup, drawdown = arrays['pnl'], arrays['runup'], arrays['drawdown']
+    closed = np.cumsum(pnl, axis=1)
+    before = closed - pnl
+    high = np.maximum(before + runup, closed)
+    low = np.minimum(before - drawdown, closed)
+
+    # 本笔交易之前（含初始资金，即0）的最高点、最低点
+    zeros = np.zeros((pnl.shape[0], 1))
+    peak = np.maximum.accumulate(np.concatenate([zeros, high[:, :-1]], axis=1), axis=1)
+    trough = np.minimum.accumulate(np.concatenate([zeros, low[:, :-1]], axis=1), axis=1)
+    peak = np.maximum(peak, 0.0)
+    trough = np.minimum(trough, 0.0)
+
+    valid = arrays['valid']
+    return {
+        'max_drawdown': np.where(valid, peak - low, 0.0).max(axis=1, initial=0.0),
+        'max_runup': np.where(valid, high - trough, 0.0).max(axis=1, initial=0.0),
+    }
+
+
+def ratio_statistics(arrays, initial_capitals, risk_free_rate=METRICS_RISK_FREE_RATE):
+    """
+    按月收益计算夏普和索提诺比率（所有交易）
+    月收益 = 当月平仓盈亏 / 月初权益，统计第一笔到最后一笔平仓之间的所有月份（无交易的月份收益为0）
+    夏普 = (月均收益 - 月无风险收益) / 月收益标准差，索提诺的分母只计低于无风险收益的部分
+    :param initial_capitals: (回测数,)
+    :param risk_free_rate: 年化无风险收益率
+    :return: dict，指标 -> (回测数,)
+    """
+    valid = arrays['valid']
+    count = valid.shape[0]
+    has_trades = valid.any(axis=1)
+    if not count or not valid.shape[1]:
+        return {'sharpe_ratio': np.full(count, np.nan), 'sortino_ratio': np.full(count, np.nan)}
+
+    months = arrays['exit_month'].astype(np.int64)
+    first = np.where(valid, months, np.iinfo(np.int64).max).min(axis=1)
+    last = np.where(valid, months, np.iinfo(np.int64).min).max(axis=1)
+    first = np.where(has_trades, first, 0)
+    span = np.where(has_trades, last - first + 1, 0)
+
+    # 每个回测的月度盈亏，一次scatter完成
+    offsets = np.where(valid, months - first[:, None], 0)
+    monthly_pnl = np.zeros((count, int(span.max())))
+    rows = np.broadcast_to(np.arange(count)[:, None], valid.shape)
+    np.add.at(monthly_pnl, (rows[valid], offsets[valid]), arrays['pnl'][valid])
+
+    month_valid = np.arange(monthly_pnl.shape[1]) < span[:, None]
+    start_equity = np.asarray(initial_capitals, dtype=np.float64)[:, None] + np.cumsum(monthly_pnl, axis=1) - monthly_pnl
+    returns = np.where(month_valid, safe_divide(monthly_pnl, start_equity), 0.0)
+
+    monthly_risk_free = risk_free_rate / 12
+    excess = np.where(month_valid, returns - monthly_risk_free, 0.0)
+    mean_excess = safe_divide(excess.sum(axis=1), span)
+    deviation = np.where(month_valid, returns - safe_divide(returns.sum(axis=1), span)[:, None], 0.0)
+    std = np.sqrt(safe_divide((deviation ** 2).sum(axis=1), span))
+    downside = np.sqrt(safe_divide((np.minimum(excess, 0.0) ** 2).sum(axis=1), span))
+    return {
+        'sharpe_ratio': safe_divide(mean_excess, std),
+        'sortino_ratio': safe_divide(mean_excess, downside),
+    }
+
+
+def compute_metrics(trade_rows_list, initial_capitals, arrays=None, risk_free_rate=METRICS_RISK_FREE_RATE):
+    """
+    一次计算一批回测的指标
+    :param trade_rows_list: [trade_rows, ...]
+    :param initial_capitals: 每个回测的初始资金
+    :param arrays: 已构建好的build_trade_arrays结果（传入时忽略trade_rows_list，可修改其中的pnl后重算）
+    :param risk_free_rate: 年化无风险收益率
+    :return: dict，方向 -> 指标 -> (回测数,)；权益曲线和比率指标只有'all'
+    """
+    if arrays is None:
+        arrays = build_trade_arrays(trade_rows_list)
+    valid = arrays['valid']
+    masks = {'all': valid, 'long': valid & arrays['is_long'], 'short': valid & ~arrays['is_long']}
+
+    results = {direction: trade_statistics(arrays['pnl'], mask) for direction, mask in masks.items()}
+    results['all'].update(equity_statistics(arrays))
+    results['all'].update(ratio_statistics(arrays, initial_capitals, risk_free_rate))
+    return results
+
+
+def metrics_for(results, index):
+    """
+    取出单个回测的指标
+    :return: dict，方向 -> 指标 -> float
+    """
+    return {
+        direction: {name: float(values[index]) for name, values in metrics.items()}
+        for direction, metrics in results.items()
+    }
+
+
+def export_value(sheet_data, keys, direction):
+    """
+    从导出表中取指标值（先取金额列，没有时取百分比列）
+    :return: float，没有该指标返回None
+    """
+    for key in keys:
+        if key not in sheet_data:
+            continue
+        column = DIRECTION_COLUMNS[direction]
+        for value in (sheet_data[key].get(f'{column}_USDT'), sheet_data[key].get(f'{column}_percent')):
+            if value is None:
+                continue
+            try:
+                return float(str(value).replace(',', '').rstrip('%'))
+            except ValueError:
+                continue
+    return None
+
+
+def check_against_export(backtesting_record, metrics, rel_tol=1e-3, abs_tol=0.01):
+    """
+    与导出的汇总表比较
+    :param backtesting_record: build_backtesting_record的返回值
+    :param metrics: metrics_for的返回值
+    :return: (比较的指标数, [(指标, 方向, 导出值, 计算值), ...] 不一致的指标)
+    """
+    backtesting_row = backtesting_record[3]
+    sheets = {}
+    checked = 0
+    mismatches = []
+    for name, (sheet_index, keys) in EXPORT_METRICS.items():
+        if sheet_index not in sheets:
+            sheets[sheet_index] = json.loads(backtesting_row[sheet_index])
+        for direction in DIRECTIONS:
+            if name not in metrics[direction]:
+                continue
+            expected = export_value(sheets[sheet_index], keys, direction)
+            actual = metrics[direction][name]
+            if expected is None or math.isnan(actual):
+                continue
+            if name in ABSOLUTE_METRICS:
+                expected, actual = abs(expected), abs(actual)
+            checked += 1
+            if not math.isclose(expected, actual, rel_tol=rel_tol, abs_tol=abs_tol):
+                mismatches.append((name, direction, expected, actual))
+    return checked, mismatches
+
+
+def fixture_trade_rows(trades):
+    """
+    基准用例中的交易转成build_trade_rows格式的trade行（只填计算用到的字段）
+    :param trades: [[交易编号, 类型, 时间, 盈亏, run-up, drawdown], ...]
+    """
+    rows = []
+    for trade_id, trade_type, exec_time, pnl, runup, drawdown in trades:
+        row = [None] * (len(TRADE_FIELDS) - 1)
+        row[TRADE_ID_INDEX] = trade_id
+        row[TRADE_TYPE_INDEX] = trade_type.lower()
+        row[EXEC_TIME_INDEX] = datetime.strptime(exec_time, "%Y-%m-%d %H:%M:%S")
+        row[PNL_INDEX], row[RUNUP_INDEX], row[DRAWDOWN_INDEX] = pnl, runup, drawdown
+        rows.append(tuple(row))
+    return rows
+
+
+def check_fixtures(path=METRICS_FIXTURES_PATH, rel_tol=1e-8, abs_tol=1e-9):
+    """
+    与手算的基准比较（期望值为null的指标应为NaN）
+    :param path: 基准文件
+    :return: (比较的指标数, {用例名: [(指标, 方向, 期望值, 计算值), ...]})
+    """
+    with open(path, encoding='utf-8') as f:
+        cases = json.load(f)['cases']
+
+    checked = 0
+    report = {}
+    for case in cases:
+        results = compute_metrics(
+            [fixture_trade_rows(case['trades'])], [case['initial_capital']], risk_free_rate=case['risk_free_rate']
+        )
+        metrics = metrics_for(results, 0)
+        mismatches = []
+        for direction, expected_metrics in case['expected'].items():
+            for name, expected in expected_metrics.items():
+                actual = metrics[direction][name]
+                checked += 1
+                if expected is None:
+                    if not math.isnan(actual):
+                        mismatches.append((name, direction, expected, actual))
+                elif not math.isclose(expected, actual, rel_tol=rel_tol, abs_tol=abs_tol):
+                    mismatches.append((name, direction, expected, actual))
+        if mismatches:
+            report[case['name']] = mismatches
+    return checked, report
+
+
+def self_check(items, batch_size=METRICS_BATCH_SIZE, fixtures_path=METRICS_FIXTURES_PATH):
+    """
+    先与手算的基准比较，再对一批回测重新计算指标并与导出值比较，打印汇总
+    :param items: 可迭代的 (名称, backtesting_record, trade_rows)
+    :param batch_size: 每次向量化计算的回测数
+    :param fixtures_path: 手算的基准文件，None表示不比较
+    :return: dict，名称 -> 不一致的指标列表（基准用例的名称前加"fixture:"）
+    """
+    report = {}
+    checked = 0
+    if fixtures_path is not None:
+        checked, fixture_report = check_fixtures(fixtures_path)
+        report.update((f"fixture:{name}", mismatches) for name, mismatches in fixture_report.items())
+        print(f"手算基准：比较 {checked} 个指标，{sum(map(len, fixture_report.values()))} 个不一致")
+
+    def run_batch(batch):
+        nonlocal checked
+        results = compute_metrics(
+            [trade_rows for _, _, trade_rows in batch],
+            [record[3][INITIAL_CAPITAL_INDEX] for _, record, _ in batch]
+        )
+        for index, (name, record, _) in enumerate(batch):
+            count, mismatches = check_against_export(record, metrics_for(results, index))
+            checked += count
+            if mismatches:
+                report[name] = mismatches
+
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            run_batch(batch)
+            batch = []
+    if batch:
+        run_batch(batch)
+
+    for name, mismatches in report.items():
+        print(f"指标不一致: {name}")
+        for metric, direction, expected, actual in mismatches:
+            print(f"  {metric}[{direction}] 期望值 {expected}，计算值 {actual:.6g}")
+    print(f"共比较 {checked} 个指标，{sum(map(len, report.values()))} 个不一致")
+    return report
+
+
+if __name__ == "__main__":
+    from Backtesting import reprocess_processed_files
+    self_check(
+        (file_path.name, backtesting_record, trade_rows)
+        for file_path, _, backtesting_record, trade_rows, _ in reprocess_processed_files()
+    )
@@ -0,0 +1,257 @@
+"""
+解析结果的列式缓存（Arrow IPC或Parquet，按文件内容sha256存放）
+
+每个工作簿一个目录：PARSED_CACHE_DIR/<hash前2位>/<hash>/<sheet序号>.arrow|.parquet
+- 每个sheet一张表，列名为A、B、C...，第0行（表头）以JSON存在schema元数据中
+- 同一类型的列直接存成float64/int64/string/timestamp/bool；类型混杂的列存成struct(kind, f, i, s, t)
+- 读取时Arrow IPC用内存映射，还原成与parse_excel相同的 {sheet: {列名: list}}，值的类型也一致；
+  compact=True时还原成CompactWorkbook，数值、日期列直接引用映射的buffer（不复制）
+未安装pyarrow时缓存不可用，直接读xlsx
+"""
+import json
+import math
+import os
+import shutil
+from datetime import datetime
+
+from config import PARSED_CACHE_DIR, PARSED_CACHE_FORMAT
+from compact_workbook import CompactColumn, CompactSheet, CompactWorkbook, KIND_NUMBER, KIND_INT, KIND_DATETIME, \
+    column_from_array
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+# 混杂列中每个值的类型（与compact_workbook的列类型KIND_*不同）
+CELL_KIND_NAN, CELL_KIND_FLOAT, CELL_KIND_INT, CELL_KIND_STR, CELL_KIND_DATETIME, CELL_KIND_BOOL = range(6)
+
+HEADER_METADATA_KEY = b'header'
+SHEET_METADATA_KEY = b'sheet'
+
+
+def cache_available():
+    return pa is not None
+
+
+def cache_dir(file_hash):
+    return PARSED_CACHE_DIR / file_hash[:2] / file_hash
+
+
+def value_kind(value):
+    if isinstance(value, bool):
+        return CELL_KIND_BOOL
+    if isinstance(value, float):
+        return CELL_KIND_NAN if math.isnan(value) else CELL_KIND_FLOAT
+    if isinstance(value, int):
+        return CELL_KIND_INT
+    if isinstance(value, str):
+        return CELL_KIND_STR
+    if isinstance(value, datetime):
+        return CELL_KIND_DATETIME
+    raise TypeError(f"Unsupported cell type: {type(value)}")
+
+
+def encode_value(value):
+    """表头单元格 -> 可JSON序列化的[kind, value]"""
+    kind = value_kind(value)
+    if kind == CELL_KIND_NAN:
+        return [kind, None]
+    if kind == CELL_KIND_DATETIME:
+        return [kind, value.isoformat()]
+    return [kind, value]
+
+
+def decode_value(encoded):
+    kind, value = encoded
+    if kind == CELL_KIND_NAN:
+        return float('nan')
+    if kind == CELL_KIND_DATETIME:
+        return datetime.fromisoformat(value)
+    return value
+
+
+def encode_column(values):
+    """
+    一列（不含表头）转成Arrow数组
+    :param values: list
+    :return: pyarrow.Array
+    """
+    kinds = set(map(value_kind, values))
+    # float列中的nan直接存成NaN
+    if kinds <= {CELL_KIND_FLOAT, CELL_KIND_NAN}:
+        return pa.array(values, type=pa.float64())
+    if len(kinds) == 1:
+        kind = next(iter(kinds))
+        arrow_type = {
+            CELL_KIND_INT: pa.int64(), CELL_KIND_STR: pa.string(), CELL_KIND_DATETIME: pa.timestamp('us'), CELL_KIND_BOOL: pa.bool_()
+        }[kind]
+        return pa.array(values, type=arrow_type)
+
+    # 类型混杂：每个值记录kind，值放在对应类型的字段中
+    fields = {'kind': [], 'f': [], 'i': [], 's': [], 't': []}
+    for value in values:
+        kind = value_kind(value)
+        fields['kind'].append(kind)
+        fields['f'].append(value if kind == CELL_KIND_FLOAT else None)
+        fields['i'].append(int(value) if kind in (CELL_KIND_INT, CELL_KIND_BOOL) else None)
+        fields['s'].append(value if kind == CELL_KIND_STR else None)
+        fields['t'].append(value if kind == CELL_KIND_DATETIME else None)
+    return pa.StructArray.from_arrays(
+        [pa.array(fields['kind'], pa.int8()), pa.array(fields['f'], pa.float64()), pa.array(fields['i'], pa.int64()),
+         pa.array(fields['s'], pa.string()), pa.array(fields['t'], pa.timestamp('us'))],
+        names=['kind', 'f', 'i', 's', 't']
+    )
+
+
+def decode_column(column):
+    """
+    Arrow列还原成Python list
+    :param column: pyarrow.ChunkedArray | pyarrow.Array
+    :return: list
+    """
+    if not pa.types.is_struct(column.type):
+        return column.to_pylist()
+
+    if isinstance(column, pa.ChunkedArray):
+        column = column.combine_chunks()
+    kinds = column.field('kind').to_pylist()
+    fields = {name: column.field(name).to_pylist() for name in ('f', 'i', 's', 't')}
+    values = []
+    for row, kind in enumerate(kinds):
+        if kind == CELL_KIND_NAN:
+            values.append(float('nan'))
+        elif kind == CELL_KIND_FLOAT:
+            values.append(fields['f'][row])
+        elif kind == CELL_KIND_INT:
+            values.append(fields['i'][row])
+        elif kind == CELL_KIND_BOOL:
+            values.append(bool(fields['i'][row]))
+        elif kind == CELL_KIND_STR:
+            values.append(fields['s'][row])
+        else:
+            values.append(fields['t'][row])
+    return values
+
+
+def encode_compact_column(column):
+    """
+    一列（不含表头）转成Arrow数组，CompactColumn的数值、日期数组直接转换，不经过Python对象
+    :param column: list | CompactColumn
+    :return: pyarrow.Array
+    """
+    if isinstance(column, CompactColumn) and len(column) > 1 and (
+            column.kind in (KIND_INT, KIND_DATETIME) or column.kind == KIND_NUMBER and column.int_mask is None):
+        return pa.array(column.body())
+    return encode_column(column[1:])
+
+
+def encode_sheet(sheet_name, sheet_data):
+    """
+    parse_excel得到的一个sheet（dict或CompactSheet） -> pyarrow.Table（表头放在schema元数据中）
+    """
+    letters = list(sheet_data)
+    header = [encode_value(sheet_data[letter][0]) for letter in letters] if letters and len(sheet_data[letters[0]]) else []
+    arrays = [encode_compact_column(sheet_data[letter]) for letter in letters]
+    table = pa.Table.from_arrays(arrays, names=letters)
+    return table.replace_schema_metadata({
+        SHEET_METADATA_KEY: sheet_name.encode('utf-8'),
+        HEADER_METADATA_KEY: json.dumps(header, ensure_ascii=False).encode('utf-8'),
+    })
+
+
+def decode_sheet(table):
+    """
+    pyarrow.Table -> (sheet名, {列名: list})
+    """
+    metadata = table.schema.metadata
+    sheet_name = metadata[SHEET_METADATA_KEY].decode('utf-8')
+    header = [decode_value(value) for value in json.loads(metadata[HEADER_METADATA_KEY])]
+    sheet_data = {}
+    for i, letter in enumerate(table.column_names):
+        sheet_data[letter] = ([header[i]] if header else []) + decode_column(table.column(letter))
+    return sheet_name, sheet_data
+
+
+def decode_sheet_compact(table):
+    """
+    pyarrow.Table -> (sheet名, CompactSheet)，float64/int64/timestamp列不复制
+    """
+    metadata = table.schema.metadata
+    sheet_name = metadata[SHEET_METADATA_KEY].decode('utf-8')
+    header = [decode_value(value) for value in json.loads(metadata[HEADER_METADATA_KEY])]
+    columns = {}
+    for i, letter in enumerate(table.column_names):
+        column_header = header[i] if header else None
+        column = table.column(letter)
+        compact_column = None
+        if column.num_chunks == 1 and column.null_count == 0 and not pa.types.is_struct(column.type):
+            try:
+                compact_column = column_from_array(column_header, column.chunk(0).to_numpy(zero_copy_only=True))
+            except pa.ArrowInvalid:
+                compact_column = None
+        if compact_column is None:
+            compact_column = CompactColumn.from_values(([column_header] if header else []) + decode_column(column))
+        columns[letter] = compact_column
+    return sheet_name, CompactSheet(columns)
+
+
+def write_parsed_cache(file_hash, excel_data, file_format=PARSED_CACHE_FORMAT):
+    """
+    写入缓存（先写临时目录再改名，避免读到写了一半的缓存）
+    :param file_hash: 文件内容sha256
+    :param excel_data: parse_excel的返回值
+    :param file_format: 'arrow' 或 'parquet'
+    """
+    if pa is None:
+        return
+
+    target_dir = cache_dir(file_hash)
+    if target_dir.exists():
+        return
+    tmp_dir = target_dir.with_name(f"{file_hash}.tmp{os.getpid()}")
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        for i, (sheet_name, sheet_data) in enumerate(excel_data.items()):
+            table = encode_sheet(sheet_name, sheet_data)
+            if file_format == 'parquet':
+                pq.write_table(table, tmp_dir / f"{i}.parquet", compression='zstd')
+            else:
+                with pa.OSFile(str(tmp_dir / f"{i}.arrow"), 'wb') as sink:
+                    with pa.ipc.new_file(sink, table.schema) as writer:
+                        writer.write_table(table)
+        os.rename(tmp_dir, target_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        # 改名失败是因为其他进程已写入同一缓存
+        if not target_dir.exists():
+            raise
+
+
+def read_parsed_cache(file_hash, compact=False):
+    """
+    读取缓存
+    :param file_hash: 文件内容sha256
+    :param compact: 是否返回CompactWorkbook
+    :return: 与parse_excel相同格式的dict（或CompactWorkbook），没有缓存返回None
+    """
+    if pa is None:
+        return None
+
+    target_dir = cache_dir(file_hash)
+    if not target_dir.exists():
+        return None
+
+    excel_data = {}
+    for path in sorted(target_dir.iterdir(), key=lambda p: int(p.stem)):
+        if path.suffix == '.parquet':
+            table = pq.read_table(path, memory_map=True)
+        else:
+            # 表中的buffer直接引用映射的内存，不复制
+            table = pa.ipc.open_file(pa.memory_map(str(path), 'r')).read_all()
+        sheet_name, sheet_data = decode_sheet_compact(table) if compact else decode_sheet(table)
+        excel_data[sheet_name] = sheet_data
+    return CompactWorkbook(excel_data) if compact else excel_data
@@ -0,0 +1,292 @@
+"""
+解压 -> 解析 -> 写入 三阶段流水线
+
+- extract：线程池逐个解压zip，每解压出一个文件就放入解析队列（new目录中已有的Excel文件最先放入）
+- parse：解析线程把文件交给进程池解析，结果放入写入队列
+- load：写线程共用连接池，每INGEST_COMMIT_BATCH_SIZE个文件一个事务提交后移动文件
+阶段之间是有界队列，下游处理不过来时上游阻塞，内存占用不随文件数增长
+单个文件出错时记录到db_log并跳过（文件留在new目录）；某个阶段的线程意外退出时通知其他阶段退出，不会阻塞在队列上
+结束时打印各阶段的吞吐量、忙碌时间和队列深度
+"""
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+from config import *
+from utils import iter_unzip_file, backup_zip, db_log
+from db_pool import ConnectionPool
+from instrumentation import timed, run_with_metrics, merge_metrics
+from run_journal import journal_record
+from Backtesting import list_backtesting_files, skip_ingested_files, parse_backtesting_file, \
+    write_and_move_batch, print_dimension_cache_stats, is_streaming_file, streaming_item
+
+
+# 队列结束标记
+STOP = object()
+
+# 阻塞在队列上时检查是否需要退出的间隔（秒）
+QUEUE_POLL_SECONDS = 0.5
+
+
+class StageMetrics:
+    def __init__(self, name):
+        """
+        单个阶段的统计：处理的文件数、行/字节数、忙碌时间、首次开始和最后结束时间
+        :param name: 阶段名
+        """
+        self.name = name
+        self.lock = threading.Lock()
+        self.items = 0
+        self.units = 0
+        self.busy = 0.0
+        self.first_start = None
+        self.last_end = None
+
+    def record(self, start, items=1, units=0):
+        """
+        记录一次处理
+        :param start: 开始时间（time.perf_counter()）
+        :param items: 文件数
+        :param units: 行数或字节数
+        """
+        end = time.perf_counter()
+        with self.lock:
+            self.items += items
+            self.units += units
+            self.busy += end - start
+            if self.first_start is None or start < self.first_start:
+                self.first_start = start
+            if self.last_end is None or end > self.last_end:
+                self.last_end = end
+
+    def summary(self):
+        with self.lock:
+            active = (self.last_end - self.first_start) if self.first_start is not None else 0.0
+            return {
+                'items': self.items,
+                'units': self.units,
+                'busy_seconds': self.busy,
+                'active_seconds': active,
+                'items_per_second': self.items / active if active else 0.0,
+                'units_per_second': self.units / active if active else 0.0,
+            }
+
+
+class QueueMonitor:
+    def __init__(self, queues, interval=0.5):
+        """
+        后台线程定时采样各队列深度
+        :param queues: dict，队列名 -> queue.Queue
+        :param interval: 采样间隔（秒）
+        """
+        self.queues = queues
+        self.interval = interval
+        self.samples = {name: [] for name in queues}
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            for name, q in self.queues.items():
+                self.samples[name].append(q.qsize())
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def summary(self):
+        return {
+            name: {
+                'max': max(samples, default=0),
+                'mean': sum(samples) / len(samples) if samples else 0.0,
+                'maxsize': self.queues[name].maxsize,
+            }
+            for name, samples in self.samples.items()
+        }
+
+
+@timed('run_pipeline', scope='run')
+def run_pipeline(parse_workers=INGEST_PARSE_WORKERS, db_workers=INGEST_DB_WORKERS, unzip_workers=UNZIP_WORKERS,
+                 batch_size=INGEST_COMMIT_BATCH_SIZE, queue_size=PIPELINE_QUEUE_SIZE):
+    """
+    流水线方式解压、解析、写入BACKTESTING_NEW_DIR中的所有zip和Excel文件
+    :param parse_workers: 解析进程数
+    :param db_workers: 写数据库线程数
+    :param unzip_workers: 并行解压的zip文件数
+    :param batch_size: 每个事务包含的文件数
+    :param queue_size: 阶段之间队列的最大长度
+    :return: dict，各阶段和队列的统计
+    """
+    print("===== 开始run_pipeline =====")
+
+    if not BACKTESTING_NEW_DIR.exists():
+        print("警告：文件目录不存在")
+        return None
+    BACKTESTING_PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
+
+    # 先列出已有的文件，避免和解压出的文件重复
+    existing_files = list_backtesting_files()
+    zip_file_list = list(BACKTESTING_NEW_DIR.glob('*.zip'))
+
+    parse_queue = queue.Queue(maxsize=queue_size)
+    load_queue = queue.Queue(maxsize=queue_size)
+    metrics = {name: StageMetrics(name) for name in ('extract', 'parse', 'load')}
+    monitor = QueueMonitor({'parse_queue': parse_queue, 'load_queue': load_queue})
+
+    # 某个阶段的线程意外退出时置位，其他阶段不再阻塞在put/get上，尽快退出
+    shutdown = threading.Event()
+
+    def put(q, item):
+        """队列满时阻塞，直到放入或shutdown；:return: 是否放入"""
+        while not shutdown.is_set():
+            try:
+                q.put(item, timeout=QUEUE_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q):
+        """:return: 队列中的元素，shutdown时返回STOP"""
+        while not shutdown.is_set():
+            try:
+                return q.get(timeout=QUEUE_POLL_SECONDS)
+            except queue.Empty:
+                continue
+        return STOP
+
+    def log_failure(stage, name, e):
+        print(f"[{stage}] 处理 {name} 时出错: {type(e).__name__}: {e}")
+        db_log(f"Pipeline {stage} failed for {name}: {type(e).__name__}: {e}")
+
+    def run_stage(stage, target, *args):
+        """线程入口：单个文件的错误在各阶段内部处理，这里只兜底，线程退出前通知其他阶段"""
+        try:
+            target(*args)
+        except BaseException as e:
+            log_failure(stage, threading.current_thread().name, e)
+            shutdown.set()
+
+    def extract_zip(zip_file):
+        start = time.perf_counter()
+        try:
+            for output_path, size in iter_unzip_file(zip_file):
+                metrics['extract'].record(start, units=size)
+                if not put(parse_queue, Path(output_path)): # 队列满时阻塞
+                    return
+                start = time.perf_counter()
+        except Exception as e:
+            print(f"处理文件 {zip_file} 时出错: ", type(e), e)
+            return
+        backup_zip(zip_file)
+
+    def extract_stage():
+        for file_path in existing_files:
+            if not put(parse_queue, file_path):
+                return
+        with ThreadPoolExecutor(max_workers=unzip_workers) as unzip_pool:
+            list(unzip_pool.map(extract_zip, zip_file_list))
+        for _ in range(parse_workers):
+            put(parse_queue, STOP)
+
+    def parse_file(parse_pool, file_path):
+        start = time.perf_counter()
+        # 已写入过的文件不解析
+        pending = skip_ingested_files([file_path])
+        if not pending:
+            return
+        # 大文件不整表解析，由写线程分块写入
+        if is_streaming_file(file_path):
+            put(load_queue, streaming_item(*pending[0]))
+            return
+        parsed = merge_metrics(parse_pool.submit(run_with_metrics, parse_backtesting_file, file_path, pending[0][1]).result())
+        metrics['parse'].record(start, units=len(parsed[1]))
+        put(load_queue, pending[0] + parsed) # 队列满时阻塞
+
+    def parse_worker(parse_pool):
+        while True:
+            file_path = get(parse_queue)
+            if file_path is STOP:
+                return
+            try:
+                parse_file(parse_pool, file_path)
+            except Exception as e:
+                # 文件消失、索引读写失败、解析失败等只跳过该文件，文件留在new目录下次重试
+                log_failure('parse', file_path.name, e)
+                journal_record(file_path.name, 'failed')
+
+    def load_worker(pool):
+        stopped = False
+        while not stopped:
+            item = get(load_queue)
+            if item is STOP:
+                return
+            # 队列中已有的文件凑成一批一起提交
+            batch = [item]
+            while len(batch) < batch_size:
+                try:
+                    item = load_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is STOP:
+                    stopped = True
+                    break
+                batch.append(item)
+            start = time.perf_counter()
+            try:
+                files_done, rows_done = write_and_move_batch(pool, batch)
+            except Exception as e:
+                # write_and_move_batch只处理pymysql的Error，其他错误（索引、数据、移动文件）跳过这一批
+                log_failure('load', ', '.join(item[0].name for item in batch), e)
+                for item in batch:
+                    journal_record(item[0].name, 'failed')
+                continue
+            metrics['load'].record(start, items=files_done, units=rows_done)
+
+    start_time = time.perf_counter()
+    pool = ConnectionPool(size=db_workers)
+    monitor.start()
+
+    with ProcessPoolExecutor(max_workers=parse_workers) as parse_pool:
+        extract_thread = threading.Thread(target=run_stage, args=('extract', extract_stage))
+        parse_threads = [
+            threading.Thread(target=run_stage, args=('parse', parse_worker, parse_pool)) for _ in range(parse_workers)
+        ]
+        load_threads = [threading.Thread(target=run_stage, args=('load', load_worker, pool)) for _ in range(db_workers)]
+        for thread in [extract_thread] + parse_threads + load_threads:
+            thread.start()
+
+        extract_thread.join()
+        for thread in parse_threads:
+            thread.join()
+        for _ in range(db_workers):
+            put(load_queue, STOP)
+        for thread in load_threads:
+            thread.join()
+
+    if shutdown.is_set():
+        print("警告：流水线有阶段异常退出，未处理的文件留在new目录")
+    monitor.stop()
+    pool.close()
+    elapsed = time.perf_counter() - start_time
+
+    stage_summary = {name: stage.summary() for name, stage in metrics.items()}
+    queue_summary = monitor.summary()
+
+    units = {'extract': 'MB', 'parse': '行', 'load': '行'}
+    for name, summary in stage_summary.items():
+        stage_units = summary['units'] / 2**20 if name == 'extract' else summary['units']
+        print(f"[{name}] {summary['items']} 个文件，{stage_units:.0f} {units[name]}，"
+              f"忙碌 {summary['busy_seconds']:.2f}s，活跃 {summary['active_seconds']:.2f}s，"
+              f"{summary['items_per_second']:.2f} 文件/s")
+    for name, summary in queue_summary.items():
+        print(f"[{name}] 深度 最大 {summary['max']}/{summary['maxsize']}，平均 {summary['mean']:.1f}")
+    print(f"流水线总耗时 {elapsed:.2f}s")
+    print_dimension_cache_stats()
+
+    return {'stages': stage_summary, 'queues': queue_summary, 'elapsed_seconds': elapsed}
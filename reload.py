@@ -0,0 +1,254 @@
+"""
+重新写入模式（INGEST_RELOAD）：同一回测重新导出（修正了交易）后再次写入时，不新增BackTesting行，而是就地更新
+
+- 同一回测的判断键：(strategy, exchangeticker_id, backtesting_range_start, backtesting_range_end, 设置hash)
+  设置hash由BACKTESTING_SETTINGS_FIELDS各字段规范化后计算，写入方和已存储的行用同一函数计算，不需要给BackTesting表加列
+  建议索引：CREATE INDEX idx_backtesting_reload ON BackTesting (strategy, ticker_id, backtesting_range_start)
+- find_backtesting：按判断键查已存储的回测（FOR UPDATE锁住该行，并发写入同一回测时串行化）
+- update_backtesting：更新BackTesting行（指标JSON、交易区间等可能随交易变化）
+- diff_trades：按(trade_id, trade_type)对比已存储和新的trade行，得到要新增的行和要删除的id
+  修改过的行 = 删除旧行 + 新增新行，新增仍走bulk_insert_trades批量写入，
+  删除是一条 DELETE ... WHERE backtesting_id = %s AND id IN (...)（id数不超过该回测的交易数）
+都不提交事务，由调用方commit
+"""
+import hashlib
+import json
+from datetime import date, datetime
+from decimal import Context, Decimal, ROUND_HALF_UP
+from numbers import Number
+
+from schema import BACKTESTING_FIELDS, BACKTESTING_SETTINGS_FIELDS, TRADE_FIELDS
+
+
+# backtesting行（不含ticker_id）中设置字段的位置
+SETTINGS_INDEXES = tuple(BACKTESTING_FIELDS.index(field) - 1 for field in BACKTESTING_SETTINGS_FIELDS)
+STRATEGY_INDEX = BACKTESTING_FIELDS.index('strategy') - 1
+RANGE_START_INDEX = BACKTESTING_FIELDS.index('backtesting_range_start') - 1
+RANGE_END_INDEX = BACKTESTING_FIELDS.index('backtesting_range_end') - 1
+SYMBOL_INDEX = BACKTESTING_FIELDS.index('symbol') - 1
+
+# 已存储的trade行（不含backtesting_id）中判断是否为同一笔交易的字段位置
+TRADE_KEY_INDEXES = (TRADE_FIELDS.index('trade_id') - 1, TRADE_FIELDS.index('trade_type') - 1)
+
+# Decimal比较用的精度，与全局上下文（trade_rows设置的精度）无关
+DECIMAL_CONTEXT = Context(prec=38, rounding=ROUND_HALF_UP)
+
+FIND_BACKTESTING_QUERY = f"""
+select id, {', '.join(BACKTESTING_SETTINGS_FIELDS)} from BackTesting
+where strategy = %s and ticker_id = %s and backtesting_range_start <=> %s and backtesting_range_end <=> %s
+order by id desc for update
+"""
+
+BACKTESTING_UPDATE_QUERY = f"""
+UPDATE BackTesting SET {', '.join(f'{field} = %s' for field in BACKTESTING_FIELDS[1:])} WHERE id = %s
+"""
+
+FETCH_TRADES_QUERY = f"select id, {', '.join(TRADE_FIELDS[1:])} from Trade where backtesting_id = %s"
+
+DELETE_ALL_TRADES_QUERY = "DELETE FROM Trade WHERE backtesting_id = %s"
+
+
+def committed_backtesting_query(backtesting_ids):
+    """:return: 按id查BackTesting行的strategy、symbol的语句（确认提交结果用）"""
+    return f"select id, strategy, symbol from BackTesting where id in ({', '.join(['%s'] * len(backtesting_ids))})"
+
+
+def backtesting_committed(stored_rows, backtesting_ids, backtesting_records):
+    """
+    事务中分配的backtesting_id都已存储且strategy、symbol一致
+    （InnoDB回滚后不复用自增id；服务器重启后自增值可能被重新分配，所以同时比较strategy、symbol）
+    :param stored_rows: committed_backtesting_query的fetchall()结果（DictCursor）
+    :param backtesting_ids: 事务中分配的backtesting_id
+    :param backtesting_records: 对应的build_backtesting_record返回值
+    :return: bool
+    """
+    stored = {row['id']: (row['strategy'], row['symbol']) for row in stored_rows}
+    return all(
+        stored.get(backtesting_id) == (row[STRATEGY_INDEX], row[SYMBOL_INDEX])
+        for backtesting_id, (_, _, _, row) in zip(backtesting_ids, backtesting_records)
+    )
+
+
+def normalize_setting(value):
+    """
+    设置字段规范化：数值统一为10位有效数字的字符串（DOUBLE列取回的float与excel中的int/float一致），
+    日期为isoformat，字符串去掉两端空白
+    """
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, Number):
+        return format(float(value), '.10g')
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value).strip()
+
+
+def settings_hash(values):
+    """
+    :param values: BACKTESTING_SETTINGS_FIELDS顺序的设置值
+    :return: str，sha256
+    """
+    payload = json.dumps([normalize_setting(value) for value in values], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def row_settings_hash(backtesting_row):
+    """:param backtesting_row: build_backtesting_record返回的backtesting行（不含ticker_id）"""
+    return settings_hash(backtesting_row[index] for index in SETTINGS_INDEXES)
+
+
+def find_backtesting_params(ticker_id, backtesting_row):
+    """:return: FIND_BACKTESTING_QUERY的参数"""
+    return (
+        backtesting_row[STRATEGY_INDEX], ticker_id,
+        backtesting_row[RANGE_START_INDEX], backtesting_row[RANGE_END_INDEX]
+    )
+
+
+def match_backtesting(stored_rows, backtesting_row):
+    """
+    从FIND_BACKTESTING_QUERY查出的行中选出设置hash相同的回测，有多条时取最新一条
+    :param stored_rows: fetchall()的结果（DictCursor）
+    :param backtesting_row: build_backtesting_record返回的backtesting行（不含ticker_id）
+    :return: backtesting_id，不存在返回None
+    """
+    expected = row_settings_hash(backtesting_row)
+    matches = [
+        row['id'] for row in stored_rows
+        if settings_hash(row[field] for field in BACKTESTING_SETTINGS_FIELDS) == expected
+    ]
+    if len(matches) > 1:
+        print(f"警告：BackTesting表中有 {len(matches)} 条相同的回测（id {matches}），只更新最新的 {matches[0]}")
+    return matches[0] if matches else None
+
+
+def find_backtesting(cursor, ticker_id, backtesting_row):
+    """
+    查已存储的同一回测（判断键相同）
+    :param cursor: 数据库游标（DictCursor）
+    :param ticker_id: exchangeticker_id
+    :param backtesting_row: build_backtesting_record返回的backtesting行（不含ticker_id）
+    :return: backtesting_id，不存在返回None
+    """
+    cursor.execute(FIND_BACKTESTING_QUERY, find_backtesting_params(ticker_id, backtesting_row))
+    return match_backtesting(cursor.fetchall(), backtesting_row)
+
+
+def update_backtesting_params(backtesting_id, ticker_id, backtesting_row):
+    """:return: BACKTESTING_UPDATE_QUERY的参数"""
+    return (ticker_id,) + tuple(backtesting_row) + (backtesting_id,)
+
+
+def update_backtesting(cursor, backtesting_id, ticker_id, backtesting_row):
+    """
+    用新的backtesting行覆盖已存储的行
+    :param cursor: 数据库游标
+    :param backtesting_id: int
+    :param ticker_id: exchangeticker_id
+    :param backtesting_row: build_backtesting_record返回的backtesting行（不含ticker_id）
+    """
+    cursor.execute(BACKTESTING_UPDATE_QUERY, update_backtesting_params(backtesting_id, ticker_id, backtesting_row))
+
+
+def stored_trades(rows):
+    """
+    :param rows: FETCH_TRADES_QUERY的fetchall()结果（DictCursor）
+    :return: [(Trade.id, trade行), ...]，trade行与build_trade_rows的行字段相同
+    """
+    return [(row['id'], tuple(row[field] for field in TRADE_FIELDS[1:])) for row in rows]
+
+
+def fetch_trades(cursor, backtesting_id):
+    """:return: stored_trades的返回值"""
+    cursor.execute(FETCH_TRADES_QUERY, (backtesting_id,))
+    return stored_trades(cursor.fetchall())
+
+
+def blank_value(value):
+    """:return: 空单元格写入后的值（NaN写入为NULL，见db_pool.SQL_CONVERSIONS）"""
+    if isinstance(value, (Decimal, float)) and value != value:
+        return None
+    return value
+
+
+def same_value(stored, incoming):
+    """
+    已存储的值与新值是否相同：DECIMAL列按存储的小数位数四舍五入后比较，DOUBLE列按float比较，
+    NaN（excel中的空单元格）与NULL相同
+    """
+    stored, incoming = blank_value(stored), blank_value(incoming)
+    if stored is None or incoming is None:
+        return stored is incoming
+    if isinstance(stored, Decimal):
+        try:
+            return DECIMAL_CONTEXT.quantize(Decimal(str(incoming)), stored) == stored
+        except ArithmeticError:
+            return False
+    if isinstance(stored, float):
+        return float(incoming) == stored
+    return stored == incoming
+
+
+def same_trade(stored_row, incoming_row):
+    return len(stored_row) == len(incoming_row) and all(map(same_value, stored_row, incoming_row))
+
+
+def trade_key(row):
+    trade_id, trade_type = (row[index] for index in TRADE_KEY_INDEXES)
+    return int(trade_id), str(trade_type).lower()
+
+
+def diff_trades(stored_rows, incoming_rows):
+    """
+    对比已存储和新的trade行
+    :param stored_rows: fetch_trades的返回值
+    :param incoming_rows: build_trade_rows返回的trade行
+    :return: (要新增的trade行, 要删除的Trade.id, 不变的行数, {'added': 新增, 'changed': 修改, 'removed': 删除})
+    """
+    stored_by_key = {}
+    duplicate_ids = []
+    for trade_id, row in stored_rows:
+        key = trade_key(row)
+        if key in stored_by_key:
+            duplicate_ids.append(trade_id)  # 同一笔交易存了多行（之前重复写入），多余的删除
+        else:
+            stored_by_key[key] = (trade_id, row)
+
+    insert_rows, delete_ids = [], list(duplicate_ids)
+    unchanged = added = changed = 0
+    for row in incoming_rows:
+        stored = stored_by_key.pop(trade_key(row), None)
+        if stored is None:
+            insert_rows.append(row)
+            added += 1
+        elif same_trade(stored[1], row):
+            unchanged += 1
+        else:
+            insert_rows.append(row)
+            delete_ids.append(stored[0])
+            changed += 1
+
+    removed = len(stored_by_key) + len(duplicate_ids)
+    delete_ids.extend(trade_id for trade_id, _ in stored_by_key.values())
+    return insert_rows, delete_ids, unchanged, {'added': added, 'changed': changed, 'removed': removed}
+
+
+def delete_trades_query(backtesting_id, trade_ids):
+    """
+    按Trade.id删除一个回测中的trade行，一条语句
+    :return: (语句, 参数)
+    """
+    placeholders = ', '.join(['%s'] * len(trade_ids))
+    return f"DELETE FROM Trade WHERE backtesting_id = %s AND id IN ({placeholders})", [backtesting_id, *trade_ids]
+
+
+def delete_trades(cursor, backtesting_id, trade_ids):
+    """:return: 删除的行数"""
+    if not trade_ids:
+        return 0
+    return cursor.execute(*delete_trades_query(backtesting_id, trade_ids))
+
+
+def delete_all_trades(cursor, backtesting_id):
+    """删除一个回测的全部trade行（分块写入的大文件不逐行对比，整体重写）"""
+    return cursor.execute(DELETE_ALL_TRADES_QUERY, (backtesting_id,))
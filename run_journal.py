@@ -0,0 +1,227 @@
+"""
+写入运行日志（SQLite，位于BACKTESTING_DIR下）：记录每次运行中每个文件的状态，进程中断后可以从中断处继续
+
+- runs：每次运行一行（模式、开始/结束时间、结果），结束时间为空表示运行中断
+- run_files：(run_id, 文件名) -> 状态、内容hash、backtesting_id
+  状态依次为 discovered（待写入）-> parsed（已解析）-> committed（已提交，记录backtesting_id）-> moved（已移动到processed）
+  写入失败为failed
+- 状态先放在内存缓冲区，每RUN_JOURNAL_FLUSH_ROWS条批量写入一次；committed在移动文件之前立即写入，
+  保证"已提交未移动"的文件在中断后能被找到，其他状态丢失只会导致该文件重新解析
+- --resume（cli.py ingest --resume）：重新打开最近一次中断的运行，committed的文件不连接数据库直接移动，
+  其余未完成的文件重新写入；提交成功但还没来得及记录committed的文件由写入索引的待确认提交确认（ingest_index.py），
+  按已写入跳过并移动，不会再写一次
+"""
+import sqlite3
+import threading
+from datetime import datetime
+
+from config import RUN_JOURNAL_PATH, RUN_JOURNAL_FLUSH_ROWS
+
+
+STATES = ('discovered', 'parsed', 'committed', 'moved', 'failed')
+
+# 已完成的状态
+FINISHED_STATES = ('committed', 'moved')
+
+
+def now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class RunJournal:
+    def __init__(self, path=RUN_JOURNAL_PATH, flush_rows=RUN_JOURNAL_FLUSH_ROWS):
+        """
+        :param path: SQLite文件路径
+        :param flush_rows: 缓冲多少条状态后写入一次
+        """
+        self.path = path
+        self.flush_rows = flush_rows
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.run_id = None
+        self.db = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+        self.db.execute("pragma journal_mode=wal")
+        self.db.execute("pragma synchronous=normal")
+        self.db.executescript("""
+            create table if not exists runs (
+                id integer primary key autoincrement,
+                mode text,
+                started_at text,
+                finished_at text,
+                success integer
+            );
+            create table if not exists run_files (
+                run_id integer,
+                file_name text,
+                file_hash text,
+                state text,
+                backtesting_id integer,
+                updated_at text,
+                primary key (run_id, file_name)
+            );
+        """)
+
+    def start(self, mode):
+        """
+        开始新的运行
+        :param mode: 写入方式（INGEST_MODE）
+        :return: run_id
+        """
+        with self.lock, self.db:
+            self.run_id = self.db.execute(
+                "insert into runs (mode, started_at) values (?, ?)", (mode, now())
+            ).lastrowid
+        return self.run_id
+
+    def last_unfinished_run(self):
+        """
+        :return: (run_id, mode, started_at)，没有中断的运行返回None
+        """
+        with self.lock:
+            return self.db.execute(
+                "select id, mode, started_at from runs where finished_at is null order by id desc limit 1"
+            ).fetchone()
+
+    def reopen(self, run_id):
+        """继续写入已有的运行"""
+        self.run_id = run_id
+
+    def record(self, file_name, state, file_hash=None, backtesting_id=None, flush=False):
+        """
+        记录文件状态（先放入缓冲区）
+        :param file_name: 文件名
+        :param state: STATES之一
+        :param file_hash: 文件内容sha256，None时保留原有的值
+        :param backtesting_id: committed时的backtesting_id，None时保留原有的值
+        :param flush: 是否立即写入
+        """
+        self.record_many([(file_name, file_hash, backtesting_id)], state, flush)
+
+    def record_many(self, entries, state, flush=False):
+        """
+        :param entries: [(file_name, file_hash, backtesting_id), ...]
+        :param state: STATES之一
+        :param flush: 是否立即写入
+        """
+        updated_at = now()
+        with self.lock:
+            self.buffer.extend(
+                (self.run_id, file_name, file_hash, state, backtesting_id, updated_at)
+                for file_name, file_hash, backtesting_id in entries
+            )
+            if flush or len(self.buffer) >= self.flush_rows:
+                self.write_buffer()
+
+    def flush(self):
+        with self.lock:
+            self.write_buffer()
+
+    def write_buffer(self):
+        """缓冲区中的状态一个事务写入（调用方持有self.lock）"""
+        if not self.buffer:
+            return
+        with self.db:
+            self.db.executemany("""
+                insert into run_files (run_id, file_name, file_hash, state, backtesting_id, updated_at)
+                values (?, ?, ?, ?, ?, ?)
+                on conflict (run_id, file_name) do update set
+                    state = excluded.state,
+                    file_hash = coalesce(excluded.file_hash, run_files.file_hash),
+                    backtesting_id = coalesce(excluded.backtesting_id, run_files.backtesting_id),
+                    updated_at = excluded.updated_at
+            """, self.buffer)
+        self.buffer = []
+
+    def files(self, states=STATES):
+        """
+        :param states: 要查询的状态
+        :return: [(file_name, file_hash, state, backtesting_id), ...]
+        """
+        with self.lock:
+            self.write_buffer()
+            return self.db.execute(
+                f"select file_name, file_hash, state, backtesting_id from run_files "
+                f"where run_id = ? and state in ({', '.join(['?'] * len(states))}) order by file_name",
+                (self.run_id,) + tuple(states)
+            ).fetchall()
+
+    def summary(self):
+        """
+        :return: dict，状态 -> 文件数
+        """
+        with self.lock:
+            self.write_buffer()
+            rows = self.db.execute(
+                "select state, count(*) from run_files where run_id = ? group by state", (self.run_id,)
+            ).fetchall()
+        return dict(rows)
+
+    def finish(self, success):
+        """写入剩余的状态并标记运行结束"""
+        with self.lock, self.db:
+            self.write_buffer()
+            self.db.execute(
+                "update runs set finished_at = ?, success = ? where id = ?", (now(), int(bool(success)), self.run_id)
+            )
+
+    def close(self):
+        with self.lock:
+            self.write_buffer()
+            self.db.close()
+
+
+# 当前运行的日志，未开始运行时为None（直接调用insert_backtesting_to_db等函数时不记录）
+_run_journal = None
+
+
+def start_run(mode, resume=False):
+    """
+    开始记录本次运行
+    :param mode: 写入方式
+    :param resume: 是否继续最近一次中断的运行（没有中断的运行时开始新的运行）
+    :return: (RunJournal, 是否为继续的运行)
+    """
+    global _run_journal
+    RUN_JOURNAL_PATH.parent.mkdir(parents=True, exist_ok=True)
+    journal = RunJournal()
+    unfinished = journal.last_unfinished_run() if resume else None
+    if unfinished:
+        run_id, previous_mode, started_at = unfinished
+        journal.reopen(run_id)
+        print(f"继续运行 {run_id}（{previous_mode}，开始于 {started_at}）")
+    else:
+        if resume:
+            print("没有中断的运行，开始新的运行")
+        journal.start(mode)
+    _run_journal = journal
+    return journal, bool(unfinished)
+
+
+def finish_run(success):
+    """
+    标记本次运行结束并打印各状态的文件数
+    :return: dict，状态 -> 文件数
+    """
+    global _run_journal
+    journal, _run_journal = _run_journal, None
+    if journal is None:
+        return {}
+    journal.finish(success)
+    summary = journal.summary()
+    journal.close()
+    print(f"运行 {journal.run_id}：" + "，".join(f"{state} {summary.get(state, 0)}" for state in STATES))
+    return summary
+
+
+def journal_record(file_name, state, file_hash=None, backtesting_id=None, flush=False):
+    """记录文件状态，没有正在记录的运行时不做任何事"""
+    if _run_journal is not None:
+        _run_journal.record(file_name, state, file_hash, backtesting_id, flush)
+
+
+def journal_record_many(entries, state, flush=False):
+    """
+    :param entries: [(file_name, file_hash, backtesting_id), ...]
+    """
+    if _run_journal is not None and entries:
+        _run_journal.record_many(entries, state, flush)
@@ -0,0 +1,35 @@
+"""
+BackTesting表和Trade表的字段（与build_backtesting_record、build_trade_rows返回的行一一对应）
+"""
+
+
+# BackTesting表字段（首列为ticker_id，即exchangeticker_id）
+BACKTESTING_FIELDS = (
+    'ticker_id', 'performance', 'trades_analysis', 'risk_performance_ratios', 'strategy',
+    'trading_range_start', 'trading_range_end', 'backtesting_range_start', 'backtesting_range_end',
+    'symbol', 'timeframe', 'point_value', 'chart_type', 'currency', 'tick_size', 'precision_setting',
+    'start_date', 'initial_capital', 'order_size', 'pyramiding', 'commission', 'slippage',
+    'verify_price_ticks', 'long_margin', 'short_margin', 'recalculate_after_order',
+    'recalculate_every_tick', 'recalculate_on_bar_close', 'use_bar_magnifier'
+)
+
+# Trade表字段（首列为backtesting_id）
+TRADE_FIELDS = (
+    'backtesting_id', 'trade_id', 'trade_type', 'signal_type', 'exec_time', 'exec_price', 'quantity',
+    'pnl_absolute', 'pnl_percent', 'runup_absolute', 'runup_percent',
+    'drawdown_absolute', 'drawdown_percent', 'cumulative_pnl_absolute', 'cumulative_pnl_percent'
+)
+
+# 回测设置（Properties中的输入，不含交易结果），重新写入模式（reload.py）按这些字段的hash判断是否为同一回测
+BACKTESTING_SETTINGS_FIELDS = (
+    'timeframe', 'point_value', 'chart_type', 'currency', 'tick_size', 'precision_setting',
+    'start_date', 'initial_capital', 'order_size', 'pyramiding', 'commission', 'slippage',
+    'verify_price_ticks', 'long_margin', 'short_margin', 'recalculate_after_order',
+    'recalculate_every_tick', 'recalculate_on_bar_close', 'use_bar_magnifier'
+)
+
+# 手续费、滑点重算（simulate.py）每个场景输出的指标
+SIMULATION_METRICS = (
+    'net_profit', 'gross_profit', 'gross_loss', 'profit_factor', 'percent_profitable',
+    'max_drawdown', 'sharpe_ratio', 'sortino_ratio'
+)
@@ -0,0 +1,227 @@
+"""
+手续费、滑点假设变化后的批量重算（what-if）
+
+- build_trade_pairs：把trade行按trade_id配成开仓/平仓对，得到开平仓价格、数量、方向等数组
+- simulate_pnl：一组(手续费, 滑点)参数网格下，每笔交易的盈亏和累计盈亏，形状为 (场景数, 交易数)，一次向量化算出
+- simulate_metrics：每个场景交给metrics.compute_metrics（每个场景当作一行）算出净利润、回撤、夏普等
+- run_simulations：从数据库读取已写入的回测，逐个回测按参数网格重算，结果批量写入本地分析库的simulation表
+成本模型：
+- 手续费按成交金额的百分比（TradingView的 % of order value），开仓、平仓各收一次
+- 滑点按tick计，导出的成交价已包含原滑点，先还原再按新滑点重新加上
+- 原参数下模型算出的盈亏与导出值的差（如资金费、四舍五入）作为每笔交易的固定项保留，原参数下结果与导出完全一致
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from config import *
+from schema import TRADE_FIELDS, SIMULATION_METRICS
+from metrics import compute_metrics, TRADE_ID_INDEX, TRADE_TYPE_INDEX, EXEC_TIME_INDEX, PNL_INDEX, RUNUP_INDEX, DRAWDOWN_INDEX
+
+
+EXEC_PRICE_INDEX = TRADE_FIELDS.index('exec_price') - 1
+QUANTITY_INDEX = TRADE_FIELDS.index('quantity') - 1
+
+BACKTESTING_PARAMS_QUERY = """
+SELECT id, commission, slippage, tick_size, point_value, initial_capital
+FROM BackTesting WHERE id IN ({})
+"""
+
+TRADE_QUERY = f"""
+SELECT {', '.join(TRADE_FIELDS)} FROM Trade WHERE backtesting_id IN ({{}}) ORDER BY backtesting_id, trade_id
+"""
+
+
+def build_trade_pairs(trade_rows):
+    """
+    按trade_id把开仓行和平仓行配对（未平仓的交易忽略）
+    :param trade_rows: build_trade_rows返回的trade行，或Trade表中按同样字段顺序读出的行
+    :return: dict，direction（多1空-1）、entry_price、exit_price、quantity、pnl、runup、drawdown为float64数组，
+             is_long为bool数组，exit_month为datetime64[M]数组
+    """
+    entries = {}
+    exits = []
+    for row in trade_rows:
+        trade_type = str(row[TRADE_TYPE_INDEX]).lower()
+        if trade_type.startswith('entry'):
+            entries[row[TRADE_ID_INDEX]] = row
+        elif trade_type.startswith('exit'):
+            exits.append(row)
+    exits.sort(key=lambda row: row[TRADE_ID_INDEX])
+
+    pairs = [(entries[row[TRADE_ID_INDEX]], row) for row in exits if row[TRADE_ID_INDEX] in entries]
+    is_long = np.array(['long' in str(exit_row[TRADE_TYPE_INDEX]).lower() for _, exit_row in pairs], dtype=bool)
+    return {
+        'direction': np.where(is_long, 1.0, -1.0),
+        'is_long': is_long,
+        'entry_price': np.array([float(entry[EXEC_PRICE_INDEX]) for entry, _ in pairs], dtype=np.float64),
+        'exit_price': np.array([float(exit_row[EXEC_PRICE_INDEX]) for _, exit_row in pairs], dtype=np.float64),
+        'quantity': np.array([float(exit_row[QUANTITY_INDEX]) for _, exit_row in pairs], dtype=np.float64),
+        'pnl': np.array([float(exit_row[PNL_INDEX]) for _, exit_row in pairs], dtype=np.float64),
+        'runup': np.array([abs(float(exit_row[RUNUP_INDEX])) for _, exit_row in pairs], dtype=np.float64),
+        'drawdown': np.array([abs(float(exit_row[DRAWDOWN_INDEX])) for _, exit_row in pairs], dtype=np.float64),
+        'exit_month': np.array([np.datetime64(exit_row[EXEC_TIME_INDEX], 'M') for _, exit_row in pairs],
+                               dtype='datetime64[M]'),
+    }
+
+
+def model_pnl(pairs, commission, slippage, tick_size, point_value):
+    """
+    成本模型下每笔交易的盈亏
+    :param pairs: build_trade_pairs的返回值
+    :param commission: 手续费（%），标量或 (场景数, 1) 数组
+    :param slippage: 滑点（tick），标量或 (场景数, 1) 数组
+    :param tick_size: 最小变动价位
+    :param point_value: 每点价值
+    :return: 与参数广播后的形状一致，(场景数, 交易数) 或 (交易数,)
+    """
+    direction = pairs['direction']
+    # 导出价格包含原滑点，这里传入的价格已还原成无滑点价格
+    entry = pairs['base_entry'] + direction * slippage * tick_size
+    exit_ = pairs['base_exit'] - direction * slippage * tick_size
+    notional = pairs['quantity'] * point_value
+    return direction * (exit_ - entry) * notional - (entry + exit_) * notional * commission / 100
+
+
+def prepare_pairs(pairs, commission, slippage, tick_size, point_value):
+    """
+    还原无滑点价格，并计算原参数下导出值与模型的差
+    :param commission: 原手续费（%）
+    :param slippage: 原滑点（tick）
+    :return: pairs（增加base_entry、base_exit、residual）
+    """
+    direction = pairs['direction']
+    pairs['base_entry'] = pairs['entry_price'] - direction * slippage * tick_size
+    pairs['base_exit'] = pairs['exit_price'] + direction * slippage * tick_size
+    pairs['residual'] = pairs['pnl'] - model_pnl(pairs, commission, slippage, tick_size, point_value)
+    return pairs
+
+
+def scenario_grid(commissions, slippages):
+    """
+    :return: (commission, slippage) 两个一维数组，为所有组合
+    """
+    commission_grid, slippage_grid = np.meshgrid(np.asarray(commissions, dtype=np.float64),
+                                                 np.asarray(slippages, dtype=np.float64), indexing='ij')
+    return commission_grid.ravel(), slippage_grid.ravel()
+
+
+def simulate_pnl(pairs, commissions, slippages, tick_size, point_value):
+    """
+    参数网格下每个场景、每笔交易的盈亏和累计盈亏
+    :param pairs: 经prepare_pairs处理的build_trade_pairs返回值
+    :param commissions: 场景的手续费（%），一维数组
+    :param slippages: 场景的滑点（tick），一维数组，与commissions等长
+    :return: (pnl, cumulative_pnl)，形状均为 (场景数, 交易数)
+    """
+    pnl = model_pnl(pairs, np.asarray(commissions)[:, None], np.asarray(slippages)[:, None], tick_size, point_value) \
+        + pairs['residual']
+    return pnl, np.cumsum(pnl, axis=1)
+
+
+def simulate_metrics(pairs, commissions, slippages, tick_size, point_value, initial_capital):
+    """
+    参数网格下每个场景的指标
+    交易中的run-up、drawdown按盈亏变化量平移
+    :return: dict，指标 -> (场景数,)，只含所有交易（'all'）的指标
+    """
+    pnl, _ = simulate_pnl(pairs, commissions, slippages, tick_size, point_value)
+    delta = pnl - pairs['pnl']
+    shape = pnl.shape
+    arrays = {
+        'pnl': pnl,
+        'runup': np.maximum(pairs['runup'] + delta, 0.0),
+        'drawdown': np.maximum(pairs['drawdown'] - delta, 0.0),
+        'is_long': np.broadcast_to(pairs['is_long'], shape),
+        'exit_month': np.broadcast_to(pairs['exit_month'], shape),
+        'valid': np.ones(shape, dtype=bool),
+    }
+    return compute_metrics(None, np.full(shape[0], initial_capital, dtype=np.float64), arrays=arrays)['all']
+
+
+def load_backtestings(cursor, backtesting_ids):
+    """
+    从数据库读取回测的成本参数和trade行
+    :param cursor: 数据库游标（DictCursor）
+    :param backtesting_ids: list
+    :return: dict，backtesting_id -> (参数dict, trade行list)
+    """
+    placeholders = ', '.join(['%s'] * len(backtesting_ids))
+    cursor.execute(BACKTESTING_PARAMS_QUERY.format(placeholders), backtesting_ids)
+    backtestings = {row['id']: (row, []) for row in cursor.fetchall()}
+
+    cursor.execute(TRADE_QUERY.format(placeholders), backtesting_ids)
+    for row in cursor.fetchall():
+        if row['backtesting_id'] in backtestings:
+            backtestings[row['backtesting_id']][1].append(tuple(row[field] for field in TRADE_FIELDS[1:]))
+    return backtestings
+
+
+def simulate_backtesting(backtesting_id, params, trade_rows, commissions, slippages,
+                         chunk_size=SIMULATION_CHUNK_SCENARIOS):
+    """
+    单个回测在参数网格下重算
+    :param params: dict，commission、slippage、tick_size、point_value、initial_capital
+    :param chunk_size: 每次向量化计算的场景数（限制 场景数x交易数 数组的内存）
+    :return: pandas.DataFrame，每个场景一行
+    """
+    tick_size = float(params['tick_size'] or 0)
+    point_value = float(params['point_value'] or 1)
+    pairs = prepare_pairs(build_trade_pairs(trade_rows), float(params['commission'] or 0),
+                          float(params['slippage'] or 0), tick_size, point_value)
+
+    frames = []
+    for start in range(0, len(commissions), chunk_size):
+        chunk_commissions = commissions[start:start + chunk_size]
+        chunk_slippages = slippages[start:start + chunk_size]
+        metrics = simulate_metrics(pairs, chunk_commissions, chunk_slippages, tick_size, point_value,
+                                   float(params['initial_capital'] or 0))
+        frame = pd.DataFrame({name: metrics[name] for name in SIMULATION_METRICS})
+        frame.insert(0, 'slippage', chunk_slippages)
+        frame.insert(0, 'commission', chunk_commissions)
+        frame.insert(0, 'backtesting_id', backtesting_id)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def run_simulations(pool, backtesting_ids, commissions=SIMULATION_COMMISSIONS, slippages=SIMULATION_SLIPPAGES,
+                    load_batch_size=METRICS_BATCH_SIZE):
+    """
+    批量重算已写入的回测，结果写入本地分析库的simulation表（同一回测同一参数的旧结果被覆盖）
+    :param pool: ConnectionPool
+    :param backtesting_ids: list
+    :param commissions: 手续费（%）取值
+    :param slippages: 滑点（tick）取值
+    :param load_batch_size: 每次从数据库读取的回测数
+    :return: pandas.DataFrame，所有回测、所有场景的结果
+    """
+    from analytics import get_local_analytics
+
+    scenario_commissions, scenario_slippages = scenario_grid(commissions, slippages)
+    start_time = time.perf_counter()
+    frames = []
+
+    def load(connection, ids):
+        with connection.cursor() as cursor:
+            backtestings = load_backtestings(cursor, ids)
+        connection.commit()
+        return backtestings
+
+    for start in range(0, len(backtesting_ids), load_batch_size):
+        ids = list(backtesting_ids[start:start + load_batch_size])
+        backtestings = pool.run_in_transaction(load, ids)
+        for backtesting_id, (params, trade_rows) in backtestings.items():
+            frames.append(simulate_backtesting(backtesting_id, params, trade_rows,
+                                               scenario_commissions, scenario_slippages))
+
+    if not frames:
+        print("没有可重算的回测")
+        return pd.DataFrame(columns=['backtesting_id', 'commission', 'slippage'] + list(SIMULATION_METRICS))
+
+    results = pd.concat(frames, ignore_index=True)
+    elapsed = time.perf_counter() - start_time
+    print(f"重算 {len(frames)} 个回测，{len(results)} 个场景，耗时 {elapsed:.2f}s，{len(results) / elapsed:.0f} 场景/s")
+
+    get_local_analytics().add_simulations(results)
+    return results
@@ -0,0 +1,123 @@
+"""
+测试环境：导入仓库模块之前（config在导入时读取配置）把数据、日志目录指向临时目录，关闭解析缓存和本地分析库
+"""
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+TEST_DIR = Path(tempfile.mkdtemp(prefix='backtesting_tests_'))
+os.environ.update({
+    'BACKTESTING_CONFIG': str(TEST_DIR / 'backtesting.json'),  # 不读取当前目录的配置文件
+    'BT_BACKTESTING_DIR': str(TEST_DIR / 'backtesting'),
+    'BT_LOG_DIR': str(TEST_DIR / 'logs'),
+    'BT_PARSED_CACHE_ENABLED': '0',
+    'BT_ANALYTICS_ENABLED': '0',
+})
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def backtesting_dirs():
+    """清空的new、processed、backup目录"""
+    from config import BACKTESTING_NEW_DIR, BACKTESTING_PROCESSED_DIR, BACKTESTING_BACKUP_DIR
+    for directory in (BACKTESTING_NEW_DIR, BACKTESTING_PROCESSED_DIR, BACKTESTING_BACKUP_DIR):
+        shutil.rmtree(directory, ignore_errors=True)
+        directory.mkdir(parents=True)
+    return BACKTESTING_NEW_DIR, BACKTESTING_PROCESSED_DIR
+
+
+@pytest.fixture
+def ingest_index():
+    """空的写入索引（进程内共享的实例换成新打开的实例）"""
+    import ingest_index as module
+    from config import INGEST_INDEX_PATH
+    reset_ingest_index(module)
+    INGEST_INDEX_PATH.unlink(missing_ok=True)
+    yield module.get_ingest_index()
+    reset_ingest_index(module)
+
+
+def reset_ingest_index(module):
+    if module._ingest_index is not None:
+        module._ingest_index.close()
+        module._ingest_index = None
+
+
+def restart_ingest_index():
+    """模拟新进程：重新打开写入索引（新的owner，之前进程的待确认记录变为stale）"""
+    import ingest_index as module
+    reset_ingest_index(module)
+    return module.get_ingest_index()
+
+
+class SimulatedCrash(BaseException):
+    """模拟进程中断（不是Exception，不会被写入流程捕获）"""
+
+
+def crash(*args, **kwargs):
+    raise SimulatedCrash()
+
+
+@pytest.fixture
+def journal():
+    """本次测试的运行日志"""
+    from run_journal import start_run, finish_run
+    run_journal, _ = start_run('test')
+    yield run_journal
+    finish_run(True)
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """ConnectionPool连接到内存中的FakeDatabase；维表缓存换成新的实例（缓存的id属于之前的数据库）"""
+    import Backtesting
+    from db_pool import ConnectionPool
+    from dimension_cache import DimensionCache
+    from fake_mysql import FakeDatabase
+    database = FakeDatabase()
+    monkeypatch.setattr(ConnectionPool, 'connect', lambda self: database.connect())
+    monkeypatch.setattr(Backtesting, 'dimension_cache', DimensionCache())
+    return database
+
+
+def copy_exports(export_files, new_dir, names):
+    """把export_files中的文件复制到new目录，:return: 复制后的路径"""
+    for name in names:
+        shutil.copy(export_files[name], new_dir / name)
+    return [new_dir / name for name in names]
+
+
+# 合成导出文件的交易数（List of trades为其2倍行）
+EXPORT_TRADES = 15
+
+
+@pytest.fixture(scope='session')
+def export_files(tmp_path_factory):
+    """
+    合成导出文件，测试时复制到new目录：strategy各不相同（文件名最后一个"_"之前的部分）
+    :return: dict，文件名 -> Path（含一个打包了2个文件的zip和一个无法解析的corrupt.xlsx）
+    """
+    from benchmarks.synthetic_export import write_export, write_export_zip
+    directory = tmp_path_factory.mktemp('exports')
+    files = {}
+    for i, (exchange, symbol) in enumerate([('BINANCE', 'BTC'), ('BYBIT', 'ETH'), ('OKX', 'SOL'), ('BINANCE', 'XRP')]):
+        name = f"Strategy {i}_{exchange}_{symbol}USDT_2024-01-0{i + 1}.xlsx"
+        write_export(directory / name, EXPORT_TRADES, seed=i, exchange=exchange, symbol=symbol)
+        files[name] = directory / name
+    zip_path = directory / 'bundle.zip'
+    write_export_zip(str(zip_path), 2, EXPORT_TRADES, seed=7)
+    files[zip_path.name] = zip_path
+    (directory / 'corrupt.xlsx').write_bytes(b'not an xlsx file')
+    files['corrupt.xlsx'] = directory / 'corrupt.xlsx'
+    return files
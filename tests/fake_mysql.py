@@ -0,0 +1,175 @@
+"""
+内存中的数据库，只支持写入流程用到的语句，不连接MySQL测试事务、重试、提交确认、写入索引和运行日志
+
+- select 列 from 表 [where a=%s and b=%s | where id in (...)]
+- insert into 表 (列) values (...), (...) [on duplicate key update ...]（维表重复时返回已有id）
+- 未提交的插入只对本连接可见，commit后写入tables；自增id在插入时分配，回滚后不复用（与InnoDB相同）
+- fail：在execute、commit（服务器未提交）或after_commit（服务器已提交、客户端收到连接断开）时抛出指定错误码
+- reject：插入某列为指定值的行时抛出指定错误码（让某个文件的事务失败）
+"""
+import re
+import threading
+
+from pymysql import OperationalError
+
+
+SELECT_PATTERN = re.compile(r"select (?P<columns>.+?) from (?P<table>\w+)(?: where (?P<where>.+))?$", re.I)
+INSERT_PATTERN = re.compile(
+    r"insert into (?P<table>\w+) \((?P<columns>[^)]+)\) values .+?(?P<upsert> on duplicate key update .+)?$", re.I
+)
+IN_PATTERN = re.compile(r"(?P<column>\w+) in \(", re.I)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.tables = {}
+        self.next_ids = {}
+        self.failures = []
+        self.rejects = []
+        self.commits = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    def connect(self):
+        with self.lock:
+            self.connections += 1
+        return FakeConnection(self)
+
+    def fail(self, when, code, times=1, table=None):
+        """
+        之后times次when时抛出OperationalError(code)
+        :param when: 'execute'、'commit'、'after_commit'
+        :param table: 只对写入该表的execute生效
+        """
+        with self.lock:
+            self.failures.extend([(when, code, table)] * times)
+
+    def reject(self, table, column, value, code=1406):
+        """插入table中column为value的行时抛出OperationalError(code)"""
+        self.rejects.append((table, column, value, code))
+
+    def take_failure(self, when, table=None):
+        with self.lock:
+            for i, (failure_when, code, failure_table) in enumerate(self.failures):
+                if failure_when == when and failure_table in (None, table):
+                    del self.failures[i]
+                    return OperationalError(code, f"fake error {code}")
+        return None
+
+    def rows(self, table):
+        with self.lock:
+            return list(self.tables.get(table, []))
+
+    def allocate_id(self, table):
+        with self.lock:
+            row_id = self.next_ids.get(table, 1)
+            self.next_ids[table] = row_id + 1
+        return row_id
+
+
+class FakeConnection:
+    def __init__(self, database):
+        self.database = database
+        self.pending = []
+        self.open = True
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def visible_rows(self, table):
+        return self.database.rows(table) + [row for pending_table, row in self.pending if pending_table == table]
+
+    def ping(self, reconnect=True):
+        if not self.open:
+            if not reconnect:
+                raise OperationalError(2006, "MySQL server has gone away")
+            self.open = True
+
+    def commit(self):
+        error = self.database.take_failure('commit')
+        if error:
+            self.pending = []
+            self.open = False
+            raise error
+        with self.database.lock:
+            for table, row in self.pending:
+                self.database.tables.setdefault(table, []).append(row)
+            self.database.commits += 1
+        self.pending = []
+        error = self.database.take_failure('after_commit')
+        if error:
+            self.open = False
+            raise error
+
+    def rollback(self):
+        self.pending = []
+
+    def close(self):
+        self.pending = []
+        self.open = False
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.result = []
+        self.lastrowid = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        query = ' '.join(query.split())
+        params = list(params) if params is not None else []
+        match = INSERT_PATTERN.match(query)
+        error = self.connection.database.take_failure('execute', match.group('table') if match else None)
+        if error:
+            raise error
+        if match:
+            return self.insert(match.group('table'), match.group('columns').split(', '), params, match.group('upsert'))
+        match = SELECT_PATTERN.match(query)
+        if match:
+            return self.select(match.group('table'), match.group('columns').split(', '), match.group('where'), params)
+        raise NotImplementedError(query)
+
+    def insert(self, table, columns, params, upsert):
+        for start in range(0, len(params), len(columns)):
+            row = dict(zip(columns, params[start:start + len(columns)]))
+            for reject_table, column, value, code in self.connection.database.rejects:
+                if reject_table == table and row.get(column) == value:
+                    raise OperationalError(code, f"fake error {code}")
+            existing = [r['id'] for r in self.connection.visible_rows(table)
+                        if all(r.get(column) == value for column, value in row.items())] if upsert else []
+            if existing:
+                self.lastrowid = existing[0]
+                continue
+            row['id'] = self.lastrowid = self.connection.database.allocate_id(table)
+            self.connection.pending.append((table, row))
+        return len(params) // len(columns)
+
+    def select(self, table, columns, where, params):
+        rows = self.connection.visible_rows(table)
+        if where:
+            match = IN_PATTERN.match(where)
+            if match:
+                values = set(params)
+                rows = [row for row in rows if row.get(match.group('column')) in values]
+            else:
+                conditions = [condition.split('=')[0].strip() for condition in where.split(' and ')]
+                rows = [row for row in rows if all(row.get(column) == value for column, value in zip(conditions, params))]
+
+        def output(column):
+            source, _, alias = column.partition(' as ')
+            return source.strip(), (alias or source).strip()
+        outputs = [output(column) for column in columns]
+        self.result = [{alias: row.get(source) for source, alias in outputs} for row in rows]
+        return len(self.result)
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return list(self.result)
@@ -0,0 +1,67 @@
+import asyncio
+
+import async_ingest
+from async_ingest import AsyncIngester
+from config import DB_LOG_FILE
+
+
+class Ingester(AsyncIngester):
+    """不连接数据库、不启动进程池：解析直接返回，事务由测试指定"""
+    def __init__(self, transaction):
+        super().__init__(pool=None, parse_pool=None, concurrency=2)
+        self.transaction = transaction
+
+    async def parse(self, func, file_path, *args):
+        return ('BINANCE', 'BTC', 'USDT', (file_path.name,)), [('trade',)], 1
+
+    async def run_in_transaction(self, func, *args, verify_commit=None):
+        return await self.transaction(args[0])
+
+
+def write_file(directory, name):
+    path = directory / name
+    path.write_bytes(name.encode())
+    return path
+
+
+def journal_states(journal):
+    return {file_name: state for file_name, _, state, _ in journal.files()}
+
+
+def test_error_outside_pymysql_fails_only_that_file(backtesting_dirs, ingest_index, journal):
+    new_dir, processed_dir = backtesting_dirs
+    good, bad = write_file(new_dir, 'good.xlsx'), write_file(new_dir, 'bad.xlsx')
+
+    async def transaction(backtesting_record):
+        await asyncio.sleep(0)
+        if backtesting_record[3] == ('bad.xlsx',):
+            raise ValueError('List of trades第3块格式错误')
+        return 42, 1
+
+    async def run():
+        ingester = Ingester(transaction)
+        return await asyncio.gather(ingester.ingest_file(good, 'good-hash'), ingester.ingest_file(bad, 'bad-hash'))
+
+    assert asyncio.run(run()) == [(1, 2), (0, 0)]
+    assert (processed_dir / 'good.xlsx').exists() and bad.exists()
+    assert journal_states(journal) == {'good.xlsx': 'moved', 'bad.xlsx': 'failed'}
+    assert ingest_index.lookup_file('good-hash') == 42
+    assert ingest_index.lookup_file('bad-hash') is None
+    assert 'bad.xlsx: ValueError' in DB_LOG_FILE.read_text(encoding='utf-8')
+
+
+def test_index_error_after_commit_is_logged(backtesting_dirs, ingest_index, journal, monkeypatch):
+    new_dir, _ = backtesting_dirs
+    path = write_file(new_dir, 'index.xlsx')
+
+    def record_committed_files(entries):
+        raise OSError('disk I/O error')
+    monkeypatch.setattr(async_ingest, 'record_committed_files', record_committed_files)
+
+    async def transaction(backtesting_record):
+        return 7, 1
+
+    assert asyncio.run(Ingester(transaction).ingest_file(path, 'index-hash')) == (0, 0)
+    assert path.exists()
+    assert journal_states(journal) == {'index.xlsx': 'failed'}
+    assert 'index.xlsx: OSError' in DB_LOG_FILE.read_text(encoding='utf-8')
@@ -0,0 +1,120 @@
+"""
+Trade表批量写入：分块边界不依赖数据库；insert与load_data写入结果的对比需要测试库，
+通过环境变量BT_TEST_DB指定（mysql://用户:密码@主机:端口/库名，会重建该库中的Trade表，不要指向生产库），未设置时跳过
+"""
+import os
+from datetime import datetime
+from decimal import Decimal
+from urllib.parse import unquote, urlparse
+
+import pymysql
+import pytest
+from pymysql.converters import escape_item
+
+from benchmarks.bench_bulk_loader import CREATE_TRADE_TABLE, edge_trade_rows, make_trade_rows
+from bulk_loader import bulk_insert_trades, insert_trades_statements, tsv_field
+from config import BULK_INSERT_ROWS
+from db_pool import SQL_CONVERSIONS, connect_kwargs
+from fake_mysql import FakeDatabase
+from schema import TRADE_FIELDS
+
+
+BOUNDARY_COUNTS = (1, BULK_INSERT_ROWS - 1, BULK_INSERT_ROWS, BULK_INSERT_ROWS + 1, 2 * BULK_INSERT_ROWS + 1)
+
+
+def trade_rows(count):
+    """前几行是容易写得不一样的值（NULL、NaN、带微秒的datetime、需要转义的字符串）"""
+    edge = edge_trade_rows()
+    return (edge + make_trade_rows(count))[:count]
+
+
+@pytest.mark.parametrize('count', BOUNDARY_COUNTS)
+def test_insert_statements_split_at_chunk_boundaries(count):
+    rows = trade_rows(count)
+
+    statements = list(insert_trades_statements(9, rows))
+
+    assert len(statements) == -(-count // BULK_INSERT_ROWS)
+    assert [len(params) // len(TRADE_FIELDS) for _, params in statements] == \
+        [min(BULK_INSERT_ROWS, count - start) for start in range(0, count, BULK_INSERT_ROWS)]
+    for query, params in statements:
+        assert query.count('%s') == len(params)
+    written = [
+        tuple(params[start:start + len(TRADE_FIELDS)])
+        for _, params in statements for start in range(0, len(params), len(TRADE_FIELDS))
+    ]
+    assert written == [(9,) + row for row in rows]
+
+
+@pytest.mark.parametrize('count', BOUNDARY_COUNTS)
+def test_insert_mode_writes_every_row_once(count):
+    rows = trade_rows(count)
+    connection = FakeDatabase().connect()
+
+    with connection.cursor() as cursor:
+        assert bulk_insert_trades(cursor, 9, rows, mode='insert') == count
+    connection.commit()
+
+    stored = connection.database.rows('Trade')
+    assert [tuple(row[field] for field in TRADE_FIELDS) for row in stored] == [(9,) + row for row in rows]
+
+
+@pytest.mark.parametrize('value, literal', [
+    (None, 'NULL'),
+    (Decimal('NaN'), 'NULL'),
+    (float('nan'), 'NULL'),
+    (Decimal('-0.00000001'), '-0.00000001'),
+    (Decimal('1E+2'), '100'),
+    (Decimal('20010.5'), '20010.5'),
+    (datetime(2022, 1, 2, 9, 30), "'2022-01-02 09:30:00'"),
+    (datetime(2022, 1, 2, 9, 30, 0, 500000), "'2022-01-02 09:30:00.500000'"),
+    (3, '3'),
+])
+def test_tsv_field_matches_insert_literal(value, literal):
+    assert escape_item(value, 'utf8mb4', SQL_CONVERSIONS) == literal
+    assert tsv_field(value) == ('\\N' if literal == 'NULL' else literal.strip("'"))
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        bulk_insert_trades(None, 1, [], mode='executemany')
+
+
+@pytest.fixture(scope='module')
+def test_db():
+    url = os.environ.get('BT_TEST_DB')
+    if not url:
+        pytest.skip("未设置BT_TEST_DB，跳过需要MySQL的测试")
+    parsed = urlparse(url)
+    config = {
+        'host': parsed.hostname, 'port': parsed.port or 3306,
+        'user': unquote(parsed.username or 'root'), 'password': unquote(parsed.password or ''),
+        'database': parsed.path.lstrip('/'), 'charset': 'utf8mb4',
+    }
+    connection = pymysql.connect(**connect_kwargs(config, local_infile=True))
+    yield connection
+    connection.close()
+
+
+def load_rows(connection, rows, mode):
+    with connection.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS Trade")
+        cursor.execute(CREATE_TRADE_TABLE)
+        bulk_insert_trades(cursor, 1, rows, mode=mode)
+        connection.commit()
+        cursor.execute(f"SELECT {', '.join(TRADE_FIELDS)} FROM Trade ORDER BY id")
+        return cursor.fetchall()
+
+
+@pytest.mark.parametrize('count', BOUNDARY_COUNTS)
+def test_insert_and_load_data_write_identical_rows(test_db, count):
+    rows = trade_rows(count)
+
+    inserted = load_rows(test_db, rows, 'insert')
+    loaded = load_rows(test_db, rows, 'load_data')
+
+    assert len(inserted) == count
+    assert inserted == loaded
+    for row, stored in zip(rows, inserted):
+        blank = [field for field, value in zip(TRADE_FIELDS[1:], row) if value is None or value != value]
+        assert all(stored[field] is None for field in blank)
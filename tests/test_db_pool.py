@@ -0,0 +1,131 @@
+import pytest
+from pymysql import OperationalError
+
+import db_pool
+from config import DB_RETRY_MAX_DELAY
+from db_pool import CommitUnknownError, ConnectionPool, commit_transaction
+from reload import committed_backtesting_query
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """记录退避等待的秒数（不真正等待），抖动取上限"""
+    delays = []
+    monkeypatch.setattr(db_pool.time, 'sleep', delays.append)
+    monkeypatch.setattr(db_pool.random, 'uniform', lambda low, high: high)
+    return delays
+
+
+class InsertBacktesting:
+    """写入一行BackTesting的事务函数，记录执行次数"""
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, connection, strategy):
+        self.calls += 1
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO BackTesting (strategy, symbol) VALUES (%s, %s)", (strategy, 'BTCUSDT'))
+            backtesting_id = cursor.lastrowid
+        commit_transaction(connection, [backtesting_id])
+        return [backtesting_id]
+
+
+def rows_committed(connection, backtesting_ids):
+    with connection.cursor() as cursor:
+        cursor.execute(committed_backtesting_query(backtesting_ids), backtesting_ids)
+        return len(cursor.fetchall()) == len(backtesting_ids)
+
+
+def test_retries_retryable_errors_with_capped_backoff(fake_db, sleeps):
+    fake_db.fail('execute', 1213, times=2)
+    fake_db.fail('execute', 2006, times=3)
+    func = InsertBacktesting()
+    pool = ConnectionPool(size=1, retries=5, base_delay=1, max_delay=3)
+
+    assert pool.run_in_transaction(func, 'S1') == [1]
+
+    assert func.calls == 6
+    assert sleeps == [1, 2, 3, 3, 3]
+    assert [row['strategy'] for row in fake_db.rows('BackTesting')] == ['S1']
+
+
+def test_gives_up_after_retries(fake_db, sleeps):
+    fake_db.fail('execute', 2013, times=4)
+    func = InsertBacktesting()
+    pool = ConnectionPool(size=1, retries=3, base_delay=0.5, max_delay=30)
+
+    with pytest.raises(OperationalError) as excinfo:
+        pool.run_in_transaction(func, 'S1')
+
+    assert excinfo.value.args[0] == 2013
+    assert func.calls == 4
+    assert sleeps == [0.5, 1, 2]
+    assert fake_db.rows('BackTesting') == []
+    assert pool.created == 1
+
+
+def test_does_not_retry_other_errors(fake_db, sleeps):
+    fake_db.fail('execute', 1062)
+    func = InsertBacktesting()
+
+    with pytest.raises(OperationalError):
+        ConnectionPool(size=1).run_in_transaction(func, 'S1')
+
+    assert func.calls == 1
+    assert sleeps == []
+
+
+def test_retryable_error_on_commit_is_retried(fake_db, sleeps):
+    fake_db.fail('commit', 1213)
+    func = InsertBacktesting()
+
+    ConnectionPool(size=1, retries=3, base_delay=1).run_in_transaction(func, 'S1', verify_commit=rows_committed)
+
+    assert func.calls == 2
+    assert len(fake_db.rows('BackTesting')) == 1
+
+
+def test_lost_commit_that_was_applied_is_not_inserted_twice(fake_db, sleeps):
+    fake_db.fail('after_commit', 2013)
+    func = InsertBacktesting()
+
+    result = ConnectionPool(size=1, retries=3, base_delay=1).run_in_transaction(
+        func, 'S1', verify_commit=rows_committed
+    )
+
+    assert result == [1]
+    assert func.calls == 1
+    assert len(fake_db.rows('BackTesting')) == 1
+    assert sleeps == [1]
+
+
+def test_lost_commit_that_was_not_applied_is_rerun(fake_db, sleeps):
+    fake_db.fail('commit', 2006)
+    func = InsertBacktesting()
+
+    result = ConnectionPool(size=1, retries=3, base_delay=1).run_in_transaction(
+        func, 'S1', verify_commit=rows_committed
+    )
+
+    assert result == [2]
+    assert func.calls == 2
+    assert [row['id'] for row in fake_db.rows('BackTesting')] == [2]
+
+
+def test_lost_commit_without_verification_is_not_retried(fake_db, sleeps):
+    fake_db.fail('after_commit', 2013)
+    func = InsertBacktesting()
+
+    with pytest.raises(CommitUnknownError) as excinfo:
+        ConnectionPool(size=1, retries=3).run_in_transaction(func, 'S1')
+
+    assert excinfo.value.result == [1]
+    assert func.calls == 1
+    assert sleeps == []
+
+
+def test_default_backoff_is_capped_at_configured_max_delay(sleeps):
+    pool = ConnectionPool()
+    assert pool.max_delay == DB_RETRY_MAX_DELAY
+    assert [pool.backoff(attempt) for attempt in range(20)][-1] == DB_RETRY_MAX_DELAY
+    assert max(pool.backoff(attempt) for attempt in range(20)) == DB_RETRY_MAX_DELAY
@@ -0,0 +1,105 @@
+"""
+写入索引：按内容hash跳过已写入的文件、与BackTesting表的校验、RDS提交后记录到索引之前进程中断（待确认的提交）
+"""
+import pytest
+
+import Backtesting
+from conftest import SimulatedCrash, copy_exports, crash, restart_ingest_index
+from fake_mysql import FakeDatabase
+from ingest_index import file_sha256
+
+
+def test_skip_ingested_files_moves_indexed_files(export_files, backtesting_dirs, ingest_index, journal):
+    new_dir, processed_dir = backtesting_dirs
+    indexed, pending = copy_exports(
+        export_files, new_dir, ['Strategy 0_BINANCE_BTCUSDT_2024-01-01.xlsx', 'Strategy 1_BYBIT_ETHUSDT_2024-01-02.xlsx']
+    )
+    (processed_dir / indexed.name).write_bytes(b'earlier file with the same name')
+    ingest_index.record_files([(file_sha256(indexed), indexed.name, 5)])
+
+    assert Backtesting.skip_ingested_files([indexed, pending]) == [(pending, file_sha256(pending))]
+
+    assert [path.name for path in new_dir.iterdir()] == [pending.name]
+    assert (processed_dir / f"{indexed.stem}_1{indexed.suffix}").read_bytes() == export_files[indexed.name].read_bytes()
+    assert [(file_name, state) for file_name, _, state, _ in journal.files()] == \
+        [(indexed.name, 'moved'), (pending.name, 'discovered')]
+
+
+def test_verify_prunes_missing_backtesting_ids(ingest_index):
+    connection = FakeDatabase().connect()
+    with connection.cursor() as cursor:
+        cursor.execute("insert into BackTesting (strategy, symbol) values (%s, %s)", ['Strategy 0', 'BTC'])
+        connection.commit()
+        ingest_index.record_files([('a' * 64, 'kept.xlsx', cursor.lastrowid), ('b' * 64, 'deleted.xlsx', 99)])
+
+        assert ingest_index.verify(cursor) == [('b' * 64, 'deleted.xlsx', 99)]
+        assert ingest_index.lookup_file('b' * 64) == 99
+
+        assert ingest_index.verify(cursor, prune=True) == [('b' * 64, 'deleted.xlsx', 99)]
+        assert ingest_index.lookup_file('b' * 64) is None
+        assert ingest_index.lookup_file('a' * 64) == 1
+        assert ingest_index.verify(cursor) == []
+
+
+def test_verify_ingest_index_uses_pool(ingest_index, fake_db):
+    ingest_index.record_files([('c' * 64, 'deleted.xlsx', 7)])
+
+    assert Backtesting.verify_ingest_index(prune=True) == [('c' * 64, 'deleted.xlsx', 7)]
+    assert ingest_index.stats()['files'] == 0
+
+
+@pytest.mark.parametrize('streaming', [False, True], ids=['batch', 'streaming'])
+def test_crash_after_commit_is_not_reinserted(streaming, export_files, backtesting_dirs, ingest_index, fake_db,
+                                              monkeypatch):
+    new_dir, processed_dir = backtesting_dirs
+    name = 'Strategy 0_BINANCE_BTCUSDT_2024-01-01.xlsx'
+    copy_exports(export_files, new_dir, [name])
+    if streaming:
+        monkeypatch.setattr(Backtesting, 'STREAMING_FILE_SIZE', 0)
+    record_committed_files = Backtesting.record_committed_files
+    monkeypatch.setattr(Backtesting, 'record_committed_files', crash)
+
+    with pytest.raises(SimulatedCrash):
+        Backtesting.insert_backtesting_to_db()
+    assert len(fake_db.rows('BackTesting')) == 1
+    assert ingest_index.lookup_file(file_sha256(new_dir / name)) is None
+
+    monkeypatch.setattr(Backtesting, 'record_committed_files', record_committed_files)
+    ingest_index = restart_ingest_index()
+    assert Backtesting.insert_backtesting_to_db()
+
+    assert [row['id'] for row in fake_db.rows('BackTesting')] == [1]
+    assert [path.name for path in processed_dir.iterdir()] == [name]
+    assert ingest_index.lookup_file(file_sha256(processed_dir / name)) == 1
+    assert ingest_index.stats()['pending_commits'] == 0
+
+
+def test_crash_before_commit_is_reinserted(export_files, backtesting_dirs, ingest_index, fake_db, monkeypatch):
+    new_dir, processed_dir = backtesting_dirs
+    name = 'Strategy 1_BYBIT_ETHUSDT_2024-01-02.xlsx'
+    copy_exports(export_files, new_dir, [name])
+    commit_transaction = Backtesting.commit_transaction
+    monkeypatch.setattr(Backtesting, 'commit_transaction', crash)
+
+    with pytest.raises(SimulatedCrash):
+        Backtesting.insert_backtesting_to_db()
+    assert fake_db.rows('BackTesting') == []
+    assert ingest_index.stats()['pending_commits'] == 1
+
+    monkeypatch.setattr(Backtesting, 'commit_transaction', commit_transaction)
+    ingest_index = restart_ingest_index()
+    assert Backtesting.insert_backtesting_to_db()
+
+    # 中断的事务分配的id 1没有提交，重新写入为id 2
+    assert [row['id'] for row in fake_db.rows('BackTesting')] == [2]
+    assert [path.name for path in processed_dir.iterdir()] == [name]
+    assert ingest_index.lookup_file(file_sha256(processed_dir / name)) == 2
+    assert ingest_index.stats()['pending_commits'] == 0
+
+
+def test_pending_commits_of_this_process_are_not_resolved(ingest_index, fake_db):
+    ingest_index.record_pending([('d' * 64, 'running.xlsx', 3, 'Strategy 0', 'BTC')])
+
+    assert Backtesting.resolve_pending_commits() == 0
+    assert fake_db.connections == 0
+    assert ingest_index.stats()['pending_commits'] == 1
@@ -0,0 +1,64 @@
+"""
+各写入方式对同一批文件的结果相同：提交到数据库的回测和交易、移动到processed的文件、留在new目录的失败文件、运行日志中的状态
+（async模式需要aiomysql，不在这里测试）
+"""
+import shutil
+from argparse import Namespace
+
+import pytest
+
+import cli
+from benchmarks.synthetic_export import export_name
+from conftest import EXPORT_TRADES
+from ingest_index import file_sha256
+from run_journal import RunJournal
+
+
+# 写入数据库时失败的文件（BackTesting插入被拒绝）
+REJECTED_FILE = 'Strategy 3_BINANCE_XRPUSDT_2024-01-04.xlsx'
+REJECTED_STRATEGY = 'Strategy 3_BINANCE_XRPUSDT'
+
+ZIP_MEMBERS = [export_name(index, seed=7)[0] for index in range(2)]
+
+
+def last_run_states():
+    """:return: 最近一次运行中 文件名 -> 状态"""
+    journal = RunJournal()
+    journal.reopen(journal.db.execute("select max(id) from runs").fetchone()[0])
+    states = {file_name: state for file_name, _, state, _ in journal.files()}
+    journal.close()
+    return states
+
+
+def committed_backtests(database):
+    """:return: [(strategy, symbol, trade行数), ...]，按strategy排序"""
+    trade_counts = {}
+    for trade in database.rows('Trade'):
+        trade_counts[trade['backtesting_id']] = trade_counts.get(trade['backtesting_id'], 0) + 1
+    return sorted((row['strategy'], row['symbol'], trade_counts.get(row['id'], 0)) for row in database.rows('BackTesting'))
+
+
+@pytest.mark.parametrize('mode', ['sequential', 'parallel', 'pipeline'])
+def test_modes_commit_move_and_journal_the_same_files(mode, export_files, backtesting_dirs, ingest_index, fake_db):
+    new_dir, processed_dir = backtesting_dirs
+    for path in export_files.values():
+        shutil.copy(path, new_dir / path.name)
+    good_files = [name for name in export_files if name.endswith('.xlsx') and name not in (REJECTED_FILE, 'corrupt.xlsx')]
+    good_files += ZIP_MEMBERS
+    hashes = {name: file_sha256(export_files[name]) for name in good_files if name in export_files}
+    fake_db.reject('BackTesting', 'strategy', REJECTED_STRATEGY)
+
+    assert cli.ingest(Namespace(mode=mode, resume=False)) == 1
+
+    assert committed_backtests(fake_db) == sorted(
+        (name.rsplit('_', 1)[0], name.split('_')[2][:-len('USDT')], EXPORT_TRADES * 2) for name in good_files
+    )
+    assert sorted(path.name for path in processed_dir.iterdir()) == sorted(good_files)
+    assert sorted(path.name for path in new_dir.iterdir()) == sorted([REJECTED_FILE, 'corrupt.xlsx'])
+    assert last_run_states() == {
+        **{name: 'moved' for name in good_files}, REJECTED_FILE: 'failed', 'corrupt.xlsx': 'failed'
+    }
+    stored_ids = {row['strategy']: row['id'] for row in fake_db.rows('BackTesting')}
+    for name, file_hash in hashes.items():
+        assert ingest_index.lookup_file(file_hash) == stored_ids[name.rsplit('_', 1)[0]]
+    assert ingest_index.stats()['files'] == len(good_files)
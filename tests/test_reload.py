@@ -0,0 +1,95 @@
+from datetime import datetime
+from decimal import Context, Decimal
+
+from reload import delete_trades, diff_trades, same_value
+
+
+STORED_SCALE = Decimal('0.00000001')  # Trade表DECIMAL(20, 8)
+STORED_CONTEXT = Context(prec=20)    # 与trade_rows设置的全局精度无关
+
+
+def incoming_row(trade_id, trade_type, pnl, runup):
+    """build_trade_rows返回的trade行，空单元格为Decimal('NaN')"""
+    return (
+        trade_id, trade_type, 'Long', datetime(2024, 1, trade_id, 10, 0, 0), Decimal('100.5'), 1,
+        pnl, Decimal('1.25'), runup, Decimal('NaN'), Decimal('3'), Decimal('0.3'), pnl, Decimal('NaN')
+    )
+
+
+def stored_row(row):
+    """写入后再读出的行：NaN写入为NULL，Decimal按存储的小数位数补齐"""
+    return tuple(
+        None if isinstance(value, Decimal) and value.is_nan()
+        else value.quantize(STORED_SCALE, context=STORED_CONTEXT) if isinstance(value, Decimal)
+        else value
+        for value in row
+    )
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, query, params=None):
+        self.statements.append((query, params))
+        return len(params) - 1
+
+
+def test_same_value_treats_nan_as_null():
+    assert same_value(None, Decimal('NaN'))
+    assert same_value(None, float('nan'))
+    assert same_value(None, None)
+    assert not same_value(None, Decimal('1'))
+    assert not same_value(Decimal('1.00000000'), Decimal('NaN'))
+    assert same_value(Decimal('1.23000000'), Decimal('1.23'))
+
+
+def test_reload_unchanged_file_with_blank_cells():
+    incoming = [
+        incoming_row(1, 'entry long', Decimal('10.5'), Decimal('NaN')),
+        incoming_row(1, 'exit long', Decimal('10.5'), Decimal('12')),
+        incoming_row(2, 'entry long', Decimal('-3'), Decimal('NaN')),
+    ]
+    stored = [(trade_id, stored_row(row)) for trade_id, row in enumerate(incoming, start=100)]
+
+    insert_rows, delete_ids, unchanged, stats = diff_trades(stored, incoming)
+
+    assert stats == {'added': 0, 'changed': 0, 'removed': 0}
+    assert (insert_rows, delete_ids, unchanged) == ([], [], 3)
+
+
+def test_reload_detects_changed_and_removed_trades():
+    old = [
+        incoming_row(1, 'entry long', Decimal('10.5'), Decimal('NaN')),
+        incoming_row(2, 'entry long', Decimal('-3'), Decimal('NaN')),
+    ]
+    stored = [(trade_id, stored_row(row)) for trade_id, row in enumerate(old, start=100)]
+    incoming = [
+        incoming_row(1, 'entry long', Decimal('10.5'), Decimal('7')),
+        incoming_row(3, 'entry long', Decimal('1'), Decimal('NaN')),
+    ]
+
+    insert_rows, delete_ids, unchanged, stats = diff_trades(stored, incoming)
+
+    assert stats == {'added': 1, 'changed': 1, 'removed': 1}
+    assert insert_rows == incoming
+    assert sorted(delete_ids) == [100, 101]
+    assert unchanged == 0
+
+
+def test_delete_trades_is_one_statement():
+    cursor = RecordingCursor()
+    trade_ids = list(range(1, 2502))
+
+    assert delete_trades(cursor, 7, trade_ids) == len(trade_ids)
+
+    [(query, params)] = cursor.statements
+    assert query.startswith("DELETE FROM Trade WHERE backtesting_id = %s AND id IN (")
+    assert query.count('%s') == len(trade_ids) + 1
+    assert params == [7] + trade_ids
+
+
+def test_delete_trades_without_ids():
+    cursor = RecordingCursor()
+    assert delete_trades(cursor, 7, []) == 0
+    assert cursor.statements == []
@@ -0,0 +1,155 @@
+"""
+运行日志：状态机（discovered -> parsed -> committed -> moved / failed）、缓冲写入、--resume继续中断的运行，
+以及进程在RDS提交之后、移动文件之前中断时，--resume不重复写入
+"""
+from argparse import Namespace
+
+import pytest
+
+import Backtesting
+import cli
+import run_journal
+from conftest import SimulatedCrash, copy_exports, crash, restart_ingest_index
+from ingest_index import file_sha256
+from run_journal import RunJournal, finish_run, start_run
+
+
+NAME = 'Strategy 0_BINANCE_BTCUSDT_2024-01-01.xlsx'
+
+
+@pytest.fixture
+def run(tmp_path):
+    journal = RunJournal(tmp_path / 'journal.sqlite', flush_rows=3)
+    journal.start('test')
+    yield journal
+    journal.close()
+
+
+def stored_states(journal):
+    """另一个连接看到的（已写入SQLite的）状态"""
+    reader = RunJournal(journal.path)
+    reader.reopen(journal.run_id)
+    rows = reader.db.execute(
+        "select file_name, file_hash, state, backtesting_id from run_files where run_id = ? order by file_name",
+        (journal.run_id,)
+    ).fetchall()
+    reader.close()
+    return rows
+
+
+def test_states_keep_hash_and_backtesting_id(run):
+    run.record('a.xlsx', 'discovered', 'hash-a')
+    run.record('a.xlsx', 'parsed')
+    run.record('a.xlsx', 'committed', backtesting_id=5, flush=True)
+    assert stored_states(run) == [('a.xlsx', 'hash-a', 'committed', 5)]
+
+    run.record('a.xlsx', 'moved')
+    run.record_many([('b.xlsx', 'hash-b', None), ('c.xlsx', 'hash-c', None)], 'discovered')
+    run.record('c.xlsx', 'failed')
+
+    assert run.files() == [
+        ('a.xlsx', 'hash-a', 'moved', 5), ('b.xlsx', 'hash-b', 'discovered', None), ('c.xlsx', 'hash-c', 'failed', None)
+    ]
+    assert run.files(('discovered', 'failed')) == [
+        ('b.xlsx', 'hash-b', 'discovered', None), ('c.xlsx', 'hash-c', 'failed', None)
+    ]
+    assert run.summary() == {'moved': 1, 'discovered': 1, 'failed': 1}
+
+
+def test_states_are_buffered_until_flush_rows(run):
+    run.record('a.xlsx', 'discovered')
+    run.record('b.xlsx', 'discovered')
+    assert stored_states(run) == []
+
+    run.record('c.xlsx', 'discovered')
+    assert [row[0] for row in stored_states(run)] == ['a.xlsx', 'b.xlsx', 'c.xlsx']
+
+
+def test_runs_are_separate(run):
+    run.record('a.xlsx', 'moved')
+    run.finish(True)
+    first_run = run.run_id
+    assert run.last_unfinished_run() is None
+
+    run.start('test')
+    run.record('b.xlsx', 'failed')
+    assert run.files() == [('b.xlsx', None, 'failed', None)]
+    assert run.last_unfinished_run()[0] == run.run_id
+
+    run.reopen(first_run)
+    assert run.files() == [('a.xlsx', None, 'moved', None)]
+
+
+def test_start_run_resumes_last_unfinished_run(backtesting_dirs):
+    interrupted = RunJournal()
+    interrupted.start('sequential')
+    interrupted.close()
+
+    journal, resumed = start_run('pipeline', resume=True)
+    assert resumed and journal.run_id == interrupted.run_id
+    finish_run(True)
+
+    # 结束的运行不再继续
+    journal, _ = start_run('pipeline', resume=True)
+    assert journal.run_id != interrupted.run_id
+    finish_run(True)
+
+
+def test_finish_committed_moves(export_files, backtesting_dirs, ingest_index, journal, fake_db):
+    new_dir, processed_dir = backtesting_dirs
+    committed, changed = copy_exports(
+        export_files, new_dir, [NAME, 'Strategy 1_BYBIT_ETHUSDT_2024-01-02.xlsx']
+    )
+    (processed_dir / 'already moved.xlsx').write_bytes(b'moved before the state was written')
+    journal.record_many([
+        (committed.name, file_sha256(committed), 1), (changed.name, 'hash before the file was replaced', 2),
+        ('already moved.xlsx', 'hash-moved', 3),
+    ], 'committed')
+    journal.record('failed.xlsx', 'failed')
+
+    assert Backtesting.finish_committed_moves(journal) == 1
+
+    assert fake_db.connections == 0
+    assert sorted(path.name for path in processed_dir.iterdir()) == sorted(['already moved.xlsx', committed.name])
+    assert [path.name for path in new_dir.iterdir()] == [changed.name]
+    assert ingest_index.lookup_file(file_sha256(processed_dir / committed.name)) == 1
+    assert {file_name: state for file_name, _, state, _ in journal.files()} == {
+        committed.name: 'moved', changed.name: 'committed', 'already moved.xlsx': 'moved', 'failed.xlsx': 'failed'
+    }
+
+
+def interrupt_run(monkeypatch):
+    """模拟进程中断：缓冲区中还没写入的状态丢失，运行没有结束；重新打开写入索引"""
+    interrupted = run_journal._run_journal
+    interrupted.buffer.clear()
+    interrupted.db.close()
+    monkeypatch.setattr(run_journal, '_run_journal', None)
+    return restart_ingest_index(), interrupted.run_id
+
+
+@pytest.mark.parametrize('crash_at', ['record_committed_files', 'move_to_processed'])
+def test_resume_after_crash_between_commit_and_move(crash_at, export_files, backtesting_dirs, ingest_index, fake_db,
+                                                    monkeypatch):
+    new_dir, processed_dir = backtesting_dirs
+    copy_exports(export_files, new_dir, [NAME])
+    original = getattr(Backtesting, crash_at)
+    monkeypatch.setattr(Backtesting, crash_at, crash)
+
+    with pytest.raises(SimulatedCrash):
+        cli.ingest(Namespace(mode='sequential', resume=False))
+    assert len(fake_db.rows('BackTesting')) == 1
+
+    monkeypatch.setattr(Backtesting, crash_at, original)
+    ingest_index, run_id = interrupt_run(monkeypatch)
+    assert cli.ingest(Namespace(mode='sequential', resume=True)) == 0
+
+    assert [row['id'] for row in fake_db.rows('BackTesting')] == [1]
+    assert [path.name for path in processed_dir.iterdir()] == [NAME]
+    assert ingest_index.lookup_file(file_sha256(processed_dir / NAME)) == 1
+    journal = RunJournal()
+    journal.reopen(run_id)
+    # 中断前已记录committed时保留backtesting_id；否则由写入索引的待确认提交确认后直接移动
+    backtesting_id = 1 if crash_at == 'move_to_processed' else None
+    assert journal.files() == [(NAME, file_sha256(processed_dir / NAME), 'moved', backtesting_id)]
+    assert journal.last_unfinished_run() is None
+    journal.close()
@@ -0,0 +1,123 @@
+"""
+build_trade_rows（按列转换，dict和CompactWorkbook两种输入）与build_trade_rows_rowwise（逐行转换）结果相同
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from benchmarks.synthetic_export import TRADE_HEADER, write_export
+from compact_workbook import compact_workbook
+from trade_rows import build_trade_rows, build_trade_rows_rowwise, iter_trade_row_chunks
+from utils import parse_excel
+
+
+NAN = float('nan')
+START = datetime(2024, 1, 1, 9, 30)
+
+
+def trades_sheet(rows):
+    """parse_excel格式的List of trades（第0行为表头）"""
+    sheet = {chr(65 + i): [name] for i, name in enumerate(TRADE_HEADER)}
+    for row in rows:
+        for letter, value in zip(sheet, row):
+            sheet[letter].append(value)
+    return {'List of trades': sheet}
+
+
+def trade_row(i, exec_time=None, price=None, quantity=1, pnl=None, trade_id=None, trade_type=None):
+    return [
+        i // 2 + 1 if trade_id is None else trade_id,
+        trade_type or ('Exit Long' if i % 2 else 'Entry Long'),
+        'Long',
+        START + timedelta(hours=i) if exec_time is None else exec_time,
+        20000.25 + i if price is None else price,
+        quantity,
+        round(i * 0.37 - 5, 2) if pnl is None else pnl,
+        0.05, 12.5 + i, 0.06, -3.25, -0.02, round(i * 0.11, 2), 0.1,
+    ]
+
+
+def datetime_rows():
+    """日期列全是datetime（含带微秒的无效值），数值列有NaN（空单元格），Trade #有NaN（无效行）"""
+    rows = [trade_row(i) for i in range(40)]
+    rows[3][3] = START.replace(microsecond=500000)
+    rows[5][6] = NAN
+    rows[7][8:10] = [NAN, NAN]
+    rows[9][0] = NAN
+    rows[11][5] = 2.0
+    rows[13][0] = 7.9
+    return rows
+
+
+def string_rows():
+    """日期列、价格列全是字符串：千分位、两端空白、格式错误的值"""
+    rows = [trade_row(i, exec_time=str(START + timedelta(hours=i)), price=f'{20000.25 + i * 1000:,}')
+            for i in range(40)]
+    rows[2][4] = ' 1,234,567.5 '
+    rows[4][4] = 'N/A'
+    rows[6][3] = '2024/01/01 09:30'
+    rows[8][3] = '2024-01-01 09:30:00 '
+    rows[10][1] = 'ENTRY SHORT'
+    rows[12][0] = '12'
+    return rows
+
+
+def mixed_rows():
+    """datetime与字符串、数值与字符串混杂的列"""
+    rows = [trade_row(i, exec_time=START + timedelta(hours=i) if i % 3 else str(START + timedelta(hours=i)),
+                      price=f'{20000 + i * 0.25:,}' if i % 2 else 20000 + i * 0.25)
+            for i in range(40)]
+    rows[1][6] = 'N/A'
+    rows[5][1] = NAN
+    rows[14][5] = '3'
+    rows[20][3] = None
+    return rows
+
+
+def assert_same_rows(expected, actual):
+    # Decimal('NaN') != Decimal('NaN')，所以逐字段比较类型和str
+    assert len(expected) == len(actual)
+    for expected_row, actual_row in zip(expected, actual):
+        assert [(type(v), str(v)) for v in expected_row] == [(type(v), str(v)) for v in actual_row], \
+            (expected_row, actual_row)
+
+
+@pytest.mark.parametrize('rows', [datetime_rows(), string_rows(), mixed_rows()], ids=['datetime', 'string', 'mixed'])
+def test_columnar_matches_rowwise(rows):
+    excel_data = trades_sheet(rows)
+
+    expected, expected_total = build_trade_rows_rowwise(excel_data)
+    assert expected_total == len(rows)
+    assert len(expected) < len(rows)  # 每种数据都有格式错误的行
+
+    for data in (excel_data, compact_workbook(excel_data)):
+        actual, total = build_trade_rows(data)
+        assert total == expected_total
+        assert_same_rows(expected, actual)
+
+
+def test_chunks_match_rowwise():
+    rows = datetime_rows() + string_rows()
+    excel_data = trades_sheet(rows)
+    expected, _ = build_trade_rows_rowwise(excel_data)
+
+    sheet = excel_data['List of trades']
+    chunks = [
+        compact_workbook({'List of trades': {letter: values[:1] + values[start:start + 15]
+                                             for letter, values in sheet.items()}})['List of trades']
+        for start in range(1, len(rows) + 1, 15)
+    ]
+    actual = [row for chunk_rows, _ in iter_trade_row_chunks(chunks) for row in chunk_rows]
+    assert_same_rows(expected, actual)
+
+
+def test_synthetic_export_matches_rowwise(tmp_path):
+    path = tmp_path / 'export.xlsx'
+    write_export(path, 200)
+
+    excel_data = parse_excel(path)
+    expected, total = build_trade_rows_rowwise(excel_data)
+    actual, _ = build_trade_rows(parse_excel(path, compact=True))
+
+    assert len(expected) == total
+    assert_same_rows(expected, actual)
@@ -0,0 +1,262 @@
+"""
+将"List of trades"转换成trade表的行
+
+- build_trade_rows：按列批量转换，用mask记录格式错误的行
+  - build_trade_columns
+    - convert_compact_column：CompactColumn按存储方式整列转换（字符串列每个不同的值只转换一次，数值、日期列按数组判断有效性），
+      其他情况（list、类型混杂的列）用convert_column
+- iter_trade_row_chunks：对utils.iter_sheet_chunks读出的每一块做同样的转换（大文件分块写入）
+- build_trade_rows_rowwise：逐行转换（原insert_trade_data中的实现），用于核对按列转换的结果
+"""
+from datetime import datetime
+from decimal import Decimal, getcontext
+from itertools import compress
+from operator import methodcaller
+
+import numpy as np
+
+from compact_workbook import CompactColumn, KIND_DATETIME, KIND_INT, KIND_NUMBER, KIND_STR
+
+
+TRADE_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# List of trades中转成Decimal的列：价格、P&L金额、P&L%、Run-up金额、Run-up%、Drawdown金额、Drawdown%、累计P&L金额、累计P&L%
+TRADE_DECIMAL_COLUMNS = ('E', 'G', 'H', 'I', 'J', 'K', 'L', 'M', 'N')
+
+# trade行中各字段对应的列（不含backtesting_id）
+TRADE_COLUMNS = ('A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L', 'M', 'N')
+
+# 转成int的列：Trade #、Quantity
+TRADE_INT_COLUMNS = ('A', 'F')
+
+# int64能表示的范围，超出时按值转换
+MAX_INT64 = 2 ** 63
+
+
+def parse_decimal(value):
+    return Decimal(str(value).replace(',', '').strip()) # value有的是str有的是float，所以统一str()
+
+
+def convert_column(func, values):
+    """
+    整列转换：先整列一次性转换，出现格式错误时才逐个转换并记录错误位置
+    :param func: 单个值的转换函数
+    :param values: list
+    :return: (转换后的list, 是否有效的bool数组)，无效位置的值为None
+    """
+    try:
+        return list(map(func, values)), np.ones(len(values), dtype=bool)
+    except Exception:
+        pass
+
+    converted = []
+    valid = np.ones(len(values), dtype=bool)
+    for i, value in enumerate(values):
+        try:
+            converted.append(func(value))
+        except Exception:
+            converted.append(None)
+            valid[i] = False
+    return converted, valid
+
+
+def convert_categories(func, column):
+    """
+    字符串列：每个不同的字符串只转换一次，再按编号取出
+    :param column: KIND_STR的CompactColumn
+    :return: 同convert_column
+    """
+    converted, category_valid = convert_column(func, column.categories.tolist())
+    lookup = np.empty(len(converted), dtype=object)
+    lookup[:] = converted
+    codes = column.body()
+    return lookup[codes].tolist(), category_valid[codes]
+
+
+def convert_int_array(data):
+    """
+    数值列转int（等价于逐个int(value)：小数截断，NaN、inf无效）
+    :param data: float64或int64数组
+    :return: 同convert_column，超出int64范围时返回None（由调用方按值转换）
+    """
+    if data.dtype.kind == 'i':
+        return data.tolist(), np.ones(len(data), dtype=bool)
+    valid = np.isfinite(data)
+    if np.abs(data[valid]).max(initial=0) >= MAX_INT64:
+        return None
+    values = np.where(valid, data, 0).astype(np.int64).tolist()
+    for i in np.flatnonzero(~valid).tolist():
+        values[i] = None
+    return values, valid
+
+
+def convert_datetime_array(data):
+    """
+    日期列转datetime（等价于逐个parse_trade_datetime：带微秒的值与TRADE_DATETIME_FORMAT不符，无效）
+    :param data: datetime64[us]数组
+    :return: 同convert_column
+    """
+    seconds = data.astype('datetime64[s]')
+    valid = (seconds == data) & ~np.isnat(data)
+    values = seconds.tolist()
+    for i in np.flatnonzero(~valid).tolist():
+        values[i] = None
+    return values, valid
+
+
+def convert_compact_column(letter, column, func):
+    """
+    按CompactColumn的存储方式整列转换，结果与convert_column(func, 该列的值)相同
+    :param letter: 列名
+    :param column: CompactColumn
+    :param func: 该列单个值的转换函数
+    :return: 同convert_column，不适用时返回None
+    """
+    if column.kind == KIND_STR:
+        return convert_categories(func, column)
+    if column.kind in (KIND_INT, KIND_NUMBER) and letter in TRADE_INT_COLUMNS:
+        return convert_int_array(column.body())
+    if column.kind in (KIND_INT, KIND_NUMBER) and letter in TRADE_DECIMAL_COLUMNS:
+        # 数值的str()中没有千分位和空白，省去parse_decimal的replace、strip
+        values = list(map(Decimal, map(str, column.body_list())))
+        return values, np.ones(len(values), dtype=bool)
+    if column.kind == KIND_DATETIME and letter == 'D':
+        return convert_datetime_array(column.body())
+    return None
+
+
+def parse_trade_datetime(value):
+    """
+    等价于datetime.strptime(str(value), TRADE_DATETIME_FORMAT)
+    excel中已是datetime的值，以及定长的"YYYY-MM-DD HH:MM:SS"字符串不经过strptime
+    """
+    if isinstance(value, datetime):
+        # pandas.Timestamp是datetime的子类，统一转回datetime
+        if value.microsecond == 0 and value.tzinfo is None and not getattr(value, 'nanosecond', 0):
+            return datetime(value.year, value.month, value.day, value.hour, value.minute, value.second)
+    elif isinstance(value, str) and len(value) == 19 and value[4] == value[7] == '-' \
+            and value[10] == ' ' and value[13] == value[16] == ':' \
+            and (value[:4] + value[5:7] + value[8:10] + value[11:13] + value[14:16] + value[17:]).isdigit() \
+            and value.isascii():
+        return datetime(int(value[:4]), int(value[5:7]), int(value[8:10]),
+                        int(value[11:13]), int(value[14:16]), int(value[17:]))
+    return datetime.strptime(str(value), TRADE_DATETIME_FORMAT)
+
+
+def build_trade_columns(trades):
+    """
+    按列转换List of trades（不含表头行）
+    :param trades: parse_excel得到的List of trades sheet，dict：列名->list
+    :return: (columns, valid)，columns为列名->转换后list，valid为每行是否有效的bool数组
+    """
+    total_trades = len(trades['A']) - 1
+
+    # 小数点后位数
+    getcontext().prec = 8
+
+    converters = {
+        'A': int,                          # Trade #
+        'B': methodcaller('lower'),        # trade_type
+        'C': str,                          # signal_type
+        'D': parse_trade_datetime,         # exec_time
+        'F': int,                          # Quantity
+    }
+    converters.update({letter: parse_decimal for letter in TRADE_DECIMAL_COLUMNS})
+
+    columns = {}
+    valid = np.ones(total_trades, dtype=bool)
+    for letter in TRADE_COLUMNS:
+        if letter not in trades:
+            # 缺列：所有行都无效
+            columns[letter] = [None] * total_trades
+            valid[:] = False
+            continue
+        column = trades[letter]
+        converted = convert_compact_column(letter, column, converters[letter]) \
+            if isinstance(column, CompactColumn) else None
+        columns[letter], column_valid = converted or convert_column(converters[letter], column[1:])
+        valid &= column_valid
+
+    return columns, valid
+
+
+def build_trade_rows(excel_data):
+    """
+    从excel数据构建trade表的所有行（按列批量转换，不访问数据库，可在子进程中执行）
+    :param excel_data: dict
+    :return: (trade_rows, total_trades)，trade_rows中每行为不含backtesting_id的tuple
+    """
+    trades = excel_data['List of trades']
+    total_trades = len(trades['A']) - 1
+
+    columns, valid = build_trade_columns(trades)
+
+    # 格式错误的行（行号与excel中的行对应，表头为第0行）
+    rejected_rows = np.flatnonzero(~valid) + 1
+    if len(rejected_rows):
+        print(f"跳过格式错误的交易记录 {len(rejected_rows)} 条，行号: {rejected_rows.tolist()}")
+
+    trade_rows = list(compress(zip(*(columns[letter] for letter in TRADE_COLUMNS)), valid))
+    return trade_rows, total_trades
+
+
+def iter_trade_row_chunks(chunks):
+    """
+    逐块构建trade行，转换完一块交给调用方后才读取下一块
+    :param chunks: 可迭代的List of trades分块（utils.iter_sheet_chunks的返回值，每块第0行为表头）
+    :return: 生成器，yield (trade_rows, 本块的交易行数)
+    """
+    offset = 0 # 之前各块的行数，用于输出与excel对应的行号
+    for chunk in chunks:
+        chunk_total = len(chunk['A']) - 1
+        columns, valid = build_trade_columns(chunk)
+
+        rejected_rows = np.flatnonzero(~valid) + 1 + offset
+        if len(rejected_rows):
+            print(f"跳过格式错误的交易记录 {len(rejected_rows)} 条，行号: {rejected_rows.tolist()}")
+
+        yield list(compress(zip(*(columns[letter] for letter in TRADE_COLUMNS)), valid)), chunk_total
+        offset += chunk_total
+
+
+def build_trade_rows_rowwise(excel_data):
+    """
+    从excel数据构建trade表的所有行（逐行转换）
+    :param excel_data: dict
+    :return: (trade_rows, total_trades)，trade_rows中每行为不含backtesting_id的tuple
+    """
+    trades = excel_data['List of trades']
+    total_trades = len(trades['A']) - 1
+
+    # 小数点后位数
+    getcontext().prec = 8
+
+    trade_rows = []
+    for i in range(1, len(trades['A'])):
+        try:
+            # 获取当前行数据
+            trade_num = trades['A'][i]
+            trade_type = trades['B'][i].lower()
+
+            trade_rows.append((
+                int(trade_num),
+                trade_type,
+                str(trades['C'][i]),
+                datetime.strptime(str(trades['D'][i]), TRADE_DATETIME_FORMAT),
+                parse_decimal(trades['E'][i]),  # 价格
+                int(trades['F'][i]),            # Quantity
+                parse_decimal(trades['G'][i]),  # P&L金额
+                parse_decimal(trades['H'][i]),  # P&L%
+                parse_decimal(trades['I'][i]),  # Run-up金额
+                parse_decimal(trades['J'][i]),  # Run-up%
+                parse_decimal(trades['K'][i]),  # Drawdown金额
+                parse_decimal(trades['L'][i]),  # Drawdown%
+                parse_decimal(trades['M'][i]),  # 累计P&L金额
+                parse_decimal(trades['N'][i])   # 累计P&L%
+            ))
+
+        except Exception as e:
+            print(f"跳过格式错误的交易记录 #{trade_num}: {str(e)}")
+            continue
+
+    return trade_rows, total_trades
@@ -1,17 +1,25 @@
+import hashlib
+import logging
 import os
 import zipfile
 import shutil
 import stat  # 用于处理文件属性
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import pandas as pd
+import pymysql
 from pymysql import Error, InterfaceError, DatabaseError, DataError, OperationalError, \
                     IntegrityError, InternalError, ProgrammingError, NotSupportedError
 from config import *
+from db_pool import connect_kwargs
+from ingest_index import get_ingest_index
+from instrumentation import log_event, timed
+from metadata_parsing import DATE_FORMATS
 
 
 def create_db_connection():
     try:
-        connection = pymysql.connect(**db_config)
+        connection = pymysql.connect(**connect_kwargs(db_config))
         print("成功连接到阿里云RDS数据库")
         return connection
 
@@ -28,13 +36,52 @@ def create_db_connection():
         print(f"连接数据库发生意外错误: {e}")
 
 
+def handle_db_error(connection, e):
+    """
+    回滚事务并按pymysql异常类型打印错误信息
+    :param connection: 数据库连接实例
+    :param e: pymysql.Error
+    """
+    try:
+        connection.rollback()
+    except Error:
+        pass # 连接已断开时rollback本身也会失败
+
+    print_db_error(e)
+
+
+def print_db_error(e):
+    """
+    按pymysql异常类型打印错误信息（事务已回滚）
+    :param e: pymysql.Error
+    """
+    if isinstance(e, IntegrityError):
+        # 处理唯一约束、外键约束等违反完整性错误
+        print(f"数据完整性错误: {e}. 已回滚事务")
+    elif isinstance(e, DataError):
+        # 处理数据格式、类型等错误
+        print(f"数据处理错误: {e}. 已回滚事务")
+    elif isinstance(e, ProgrammingError):
+        # 处理SQL语法错误、表不存在等问题
+        print(f"SQL编程错误: {e}. 已回滚事务")
+    elif isinstance(e, OperationalError):
+        # 处理数据库操作错误，如连接断开等
+        print(f"数据库操作错误: {e}. 已回滚事务")
+        if 'Lost connection' in str(e):
+            print("您已断开数据库连接")
+    elif isinstance(e, InternalError):
+        # 处理数据库内部错误
+        print(f"数据库内部错误: {e}. 已回滚事务")
+    elif isinstance(e, NotSupportedError):
+        # 处理不支持的数据库特性
+        print(f"不支持的数据库特性: {e}. 已回滚事务")
+    else:
+        # 捕获其他PyMySQL错误
+        print(f"数据库错误: {e}. 已回滚事务")
+
+
 def parse_date(date_str):
-    formats = [
-        "%b %d, %Y, %H:%M",  # Oct 10, 2022, 12:00
-        "%Y-%m-%d %H:%M:%S",  # 2022-10-10 12:00:00
-        "%m/%d/%Y %H:%M"  # 10/10/2022 12:00
-    ]
-    for fmt in formats:
+    for fmt in DATE_FORMATS:
         try:
             return datetime.strptime(date_str.strip(), fmt)
         except ValueError:
@@ -42,65 +89,286 @@ def parse_date(date_str):
     raise ValueError(f"Cannot parse date: {date_str}")
 
 
-def parse_excel(path):
+# insert_backtesting_data和insert_trade_data用到的sheet
+BACKTESTING_SHEETS = ('Properties', 'Performance', 'Trades analysis', 'Risk performance ratios', 'List of trades')
+
+# zip中需要解压的成员
+ZIP_MEMBER_SUFFIXES = ('.xls', '.xlsx', '.xlsm', '.xlsb', '.cvs')
+
+
+def column_letter(index):
+    """
+    列序号(从0开始)转excel列名：0->A, 25->Z, 26->AA ...
+    :param index: int
+    :return: str
+    """
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+@timed('parse_excel')
+def parse_excel(path, sheet_names=BACKTESTING_SHEETS, compact=False):
+    """
+    将excel文件转成dict，其中key=sheet，每个value中key=列名A、B、C...、Z、AA...
+    用openpyxl只读模式逐行读取所需sheet，不构建DataFrame；xls/csv等openpyxl不支持的格式退回parse_excel_pandas
+    空单元格与pandas一致记为float('nan')
+    :param path: str or Path
+    :param sheet_names: 需要读取的sheet，None表示全部
+    :param compact: 是否返回CompactWorkbook（每读完一个sheet就转换，不同时持有整个工作簿的list）
+    :return: dict 或 CompactWorkbook
+    """
+    if not str(path).lower().endswith(('.xlsx', '.xlsm')):
+        excel_data = parse_excel_pandas(path, sheet_names)
+        if compact:
+            from compact_workbook import compact_workbook
+            return compact_workbook(excel_data)
+        return excel_data
+
+    from openpyxl import load_workbook
+    if compact:
+        from compact_workbook import CompactWorkbook, compact_sheet
+
+    nan = float('nan')
+    excel_data = {}
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet_name in workbook.sheetnames:
+            if sheet_names is not None and sheet_name not in sheet_names:
+                continue
+
+            columns = []
+            row_count = 0    # 已读取的行数
+            last_row = 0     # 最后一个非空行，用于与pandas一致去掉末尾空行
+            for row in workbook[sheet_name].iter_rows(values_only=True):
+                # 出现更宽的行时补齐新列
+                while len(columns) < len(row):
+                    columns.append([nan] * row_count)
+                for i, column in enumerate(columns):
+                    value = row[i] if i < len(row) else None
+                    column.append(nan if value is None else value)
+                row_count += 1
+                if any(value is not None for value in row):
+                    last_row = row_count
+
+            sheet_data = {
+                column_letter(i): column[:last_row] for i, column in enumerate(columns)
+            }
+            excel_data[sheet_name] = compact_sheet(sheet_data) if compact else sheet_data
+            del columns, sheet_data
+    finally:
+        workbook.close()
+    return CompactWorkbook(excel_data) if compact else excel_data
+
+
+def parse_excel_pandas(path, sheet_names=None):
     """
-    将excel文件转成dict，其中key=sheet，每个value中key=列名A、B、C...
+    将excel文件转成dict（pandas实现，用于xls/csv及基准对比），其中key=sheet，每个value中key=列名A、B、C...
     :param path: str or Path
+    :param sheet_names: 需要读取的sheet，None表示全部
     :return: dict
     """
+    import pandas as pd
+
     excel_data = {}
     with pd.ExcelFile(path) as xls:
         for sheet_name in xls.sheet_names:
+            if sheet_names is not None and sheet_name not in sheet_names:
+                continue
             # Read each sheet and convert to dictionary
             df = pd.read_excel(xls, sheet_name=sheet_name, header=None)
             # Convert to dictionary where keys are column letters and values are lists
             excel_data[sheet_name] = {
-                chr(65 + i): df.iloc[:, i].tolist() for i in range(df.shape[1])
+                column_letter(i): df.iloc[:, i].tolist() for i in range(df.shape[1])
             }
     return excel_data
 
 
+def iter_sheet_chunks(path, sheet_name, chunk_rows=TRADE_CHUNK_ROWS):
+    """
+    分块读取一个sheet，每块最多chunk_rows行，读完一块交给调用方后才读下一块（内存占用与sheet行数无关）
+    每块与parse_excel的sheet格式相同（列名 -> list，第0行为表头），空单元格为nan，末尾空行去掉
+    xls/csv等openpyxl不支持的格式退回parse_excel整表读取后再分块
+    :param path: str or Path
+    :param sheet_name: sheet名
+    :param chunk_rows: 每块的数据行数（不含表头）
+    :return: 生成器，yield dict
+    """
+    if not str(path).lower().endswith(('.xlsx', '.xlsm')):
+        sheet_data = parse_excel_pandas(path, [sheet_name])[sheet_name]
+        total = len(next(iter(sheet_data.values()), [])) - 1
+        for start in range(1, total + 1, chunk_rows):
+            yield {letter: [values[0]] + values[start:start + chunk_rows] for letter, values in sheet_data.items()}
+        return
+
+    from openpyxl import load_workbook
+
+    nan = float('nan')
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook[sheet_name].iter_rows(values_only=True)
+        header = list(next(rows, ()))
+        chunk = []
+        empty_rows = [] # 连续的空行，后面还有非空行时才保留（与parse_excel一致）
+        width = len(header)
+
+        def to_columns(chunk_rows_data):
+            columns = {}
+            for i in range(width):
+                column = [nan if i >= len(header) or header[i] is None else header[i]]
+                column.extend(nan if i >= len(row) or row[i] is None else row[i] for row in chunk_rows_data)
+                columns[column_letter(i)] = column
+            return columns
+
+        for row in rows:
+            if all(value is None for value in row):
+                empty_rows.append(row)
+                continue
+            chunk.extend(empty_rows)
+            empty_rows = []
+            chunk.append(row)
+            width = max(width, len(row))
+            if len(chunk) >= chunk_rows:
+                yield to_columns(chunk)
+                chunk = []
+        if chunk:
+            yield to_columns(chunk)
+    finally:
+        workbook.close()
+
+
 def db_log(msg):
-    with open("logs/db/transactions.log", "a") as f:
+    DB_LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with open(DB_LOG_FILE, "a", encoding="utf-8") as f:
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         f.write(f"[{timestamp}] {msg}\n")
+    log_event('db_error', level=logging.ERROR, message=msg)
 
 
-def unzip_file(zip_path, output_dir=BACKTESTING_NEW_DIR):
+def claim_output_path(output_dir, file_name):
     """
-    解压 zip 文件，提取所有 Excel 文件
+    原子地占用输出文件名：同名文件已存在（不同文件夹中的同名成员、其他线程正在解压）时改为"name (1).xlsx"
+    （在扩展名前加编号而不是下划线，不影响insert_backtesting_data按最后一个"_"截取strategy）
+    :return: (output_path, 已打开的二进制写文件对象)
+    """
+    stem, ext = os.path.splitext(file_name)
+    n = 0
+    while True:
+        candidate = file_name if n == 0 else f"{stem} ({n}){ext}"
+        output_path = os.path.join(output_dir, candidate)
+        try:
+            fd = os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0))
+        except FileExistsError:
+            n += 1
+            continue
+        return output_path, os.fdopen(fd, 'wb')
+
+
+def iter_unzip_file(zip_path, output_dir=BACKTESTING_NEW_DIR):
+    """
+    逐个成员分块流式解压zip中的Excel文件，每解压完一个就yield其路径
     :param zip_path: str | Path
     :param output_dir: str | Path
-    :return: bool
+    :return: 生成器，yield (output_path, 文件字节数)
     """
     # 确保输出目录存在
     os.makedirs(output_dir, exist_ok=True)
+    ingest_index = get_ingest_index()
+
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        for file_info in zip_ref.infolist():
+            # 跳过__MACOSX文件夹
+            if file_info.filename.startswith('__MACOSX'):
+                continue
+
+            if not file_info.filename.lower().endswith(ZIP_MEMBER_SUFFIXES):
+                continue
+
+            # 跳过已写入数据库的成员（重复上传的压缩包）
+            if ingest_index.is_member_ingested(file_info.CRC, file_info.file_size):
+                print(f"跳过已写入数据库的文件: {file_info.filename}")
+                continue
+
+            # 将文件写入目标目录(os.path.basename只保留文件名，省去路径名，路径名有编码问题)
+            output_path, f = claim_output_path(output_dir, os.path.basename(file_info.filename))
+            digest = hashlib.sha256()
+            try:
+                with f, zip_ref.open(file_info) as member:
+                    for chunk in iter(lambda: member.read(UNZIP_CHUNK_SIZE), b''):
+                        f.write(chunk)
+                        digest.update(chunk)
+            except BaseException:
+                os.remove(output_path) # 不留下不完整的文件
+                raise
+
+            ingest_index.record_member(file_info.CRC, file_info.file_size, digest.hexdigest(),
+                                       file_info.filename, os.path.basename(zip_path))
+            yield output_path, file_info.file_size
+
+
+@timed('unzip_file')
+def unzip_file(zip_path, output_dir=BACKTESTING_NEW_DIR):
+    """
+    解压 zip 文件，提取所有 Excel 文件
+    :param zip_path: str | Path
+    :param output_dir: str | Path
+    :return: 解压出的字节数，失败返回None（0表示没有需要解压的文件，也算成功）
+    """
+    start_time = time.perf_counter()
+    try:
+        total_bytes = sum(size for _, size in iter_unzip_file(zip_path, output_dir))
+    except Exception as e:
+        print(f"处理文件 {zip_path} 时出错: ", type(e), e)
+        return None
 
+    elapsed = time.perf_counter() - start_time
+    print(f"解压成功: {os.path.basename(zip_path)}，{total_bytes / 2**20:.1f} MB，{total_bytes / 2**20 / max(elapsed, 1e-9):.1f} MB/s")
+    return total_bytes
+
+
+def unzip_and_backup(zip_file):
+    """
+    解压单个zip文件并移动到BACKTESTING_BACKUP_DIR
+    :param zip_file: Path
+    :return: 解压出的字节数，失败返回None
+    """
+    print("===== 正在处理：", zip_file.name, "=====")
+
+    total_bytes = unzip_file(zip_file) # 解压
+    if total_bytes is None or not backup_zip(zip_file):
+        return None
+    return total_bytes
+
+
+def backup_zip(zip_file):
+    """
+    将已解压的zip文件移动到BACKTESTING_BACKUP_DIR
+    :param zip_file: Path
+    :return: bool
+    """
     try:
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            for file_info in zip_ref.infolist():
-                # 跳过__MACOSX文件夹
-                if file_info.filename.startswith('__MACOSX'):
-                    continue
-
-                if file_info.filename.lower().endswith(('.xls', '.xlsx', '.xlsm', '.xlsb', '.cvs')):
-                    # 将文件写入目标目录(os.path.basename只保留文件名，省去路径名，路径名有编码问题)
-                    output_path = os.path.join(output_dir, os.path.basename(file_info.filename))
-                    with open(output_path, 'wb') as f:
-                        f.write(zip_ref.read(file_info))
-
-        print("解压成功")
+        # 默认只读，添加写权限
+        os.chmod(zip_file, stat.S_IWRITE)
+
+        # 将zip文件移动到backup目录
+        BACKTESTING_BACKUP_DIR.mkdir(parents=True, exist_ok=True)
+        shutil.move(zip_file, BACKTESTING_BACKUP_DIR / zip_file.name)
+        print("备份成功")
         return True
 
     except Exception as e:
-        print(f"处理文件 {zip_path} 时出错: ", type(e), e)
+        print(f"移动删除文件{zip_file.name}时异常：", type(e), e)
         return False
 
 
-def unzip_all_and_backup():
+def unzip_all_and_backup(workers=UNZIP_WORKERS):
     """
-    1.解压：将BACKTESTING_NEW_DIR中所有zip文件中的excel文件解压到该目录
+    1.解压：将BACKTESTING_NEW_DIR中所有zip文件中的excel文件解压到该目录（多个zip文件由线程池并行解压）
     2.备份：将成功解压的zip文件移动到BACKTESTING_BACKUP_DIR
+    :param workers: 并行解压的线程数
     """
     # 确保备份目录存在
     BACKTESTING_BACKUP_DIR.mkdir(parents=True, exist_ok=True)
@@ -112,26 +380,19 @@ def unzip_all_and_backup():
 
     # 统计成功解压备份文件数
     count = 0
+    total_bytes = 0
+    start_time = time.perf_counter()
 
-    for zip_file in zip_file_list:
-        print("===== 正在处理：", zip_file.name, "=====")
-
-        if not unzip_file(zip_file): # 解压
-            continue
-
-        try:
-            # 默认只读，添加写权限
-            os.chmod(zip_file, stat.S_IWRITE)
-
-            # 将zip文件移动到backup目录
-            shutil.move(zip_file, BACKTESTING_BACKUP_DIR / zip_file.name)
-            count += 1
-            print("备份成功")
-
-        except Exception as e:
-            print(f"移动删除文件{zip_file.name}时异常：", type(e), e)
+    # zlib解压和文件读写会释放GIL，用线程池即可
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for extracted_bytes in pool.map(unzip_and_backup, zip_file_list):
+            if extracted_bytes is not None:
+                count += 1
+                total_bytes += extracted_bytes
 
-    print(f"解压备份结束，共成功({count}/{len(zip_file_list)})")
+    elapsed = time.perf_counter() - start_time
+    print(f"解压备份结束，共成功({count}/{len(zip_file_list)})，"
+          f"{total_bytes / 2**20:.1f} MB，{total_bytes / 2**20 / max(elapsed, 1e-9):.1f} MB/s")
 
 
 if __name__ == "__main__":
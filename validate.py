@@ -0,0 +1,380 @@
+"""
+只校验、不写入（dry-run）：在进程池中并行解析目录或zip中的回测文件，检查写入时依赖的所有字段，输出JSON报告
+
+不连接数据库，也不修改写入索引；格式错误的文件在写入前发现，不再占用连接和半个事务
+- validate_workbook：按build_backtesting_record、build_trade_rows的读取方式检查
+  - 缺少的sheet、指标sheet缺少的列
+  - Properties中缺少或被改名的标签、Trading range/Backtesting range/Start Date能否被DateParser解析、
+    Symbol能否拆分出exchange、数值标签不能转换时会被写成默认值
+  - List of trades缺少的列、格式错误被跳过的行（行号）、没有有效交易
+  - 最后整体调用一次build_backtesting_record，其他未覆盖的异常也记为错误
+- validate_file / validate_zip_member：进程池中执行；大文件与写入时一样分块检查List of trades，zip成员解压到临时文件
+- validate_paths：汇总报告，quarantine时把有错误的文件从new目录移到BACKTESTING_INVALID_DIR，之后的写入只处理校验通过的文件
+每个问题的级别：error（写入会失败或被跳过）、warning（能写入，但写入的值可能不对）
+用法：python cli.py validate [--workers N] [--report 路径] [--quarantine] [目录/文件/zip ...]
+"""
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from config import *
+from compact_workbook import METRIC_COLUMNS
+from metadata_parsing import DateParser, FILE_NAME_PATTERN, split_symbol
+from trade_rows import TRADE_COLUMNS, build_trade_columns
+from utils import parse_excel, iter_sheet_chunks, BACKTESTING_SHEETS, ZIP_MEMBER_SUFFIXES
+from Backtesting import build_backtesting_record, read_properties, is_streaming_file
+
+
+ERROR, WARNING = 'error', 'warning'
+
+# 指标sheet
+METRIC_SHEETS = ('Performance', 'Trades analysis', 'Risk performance ratios')
+
+# Properties中写入BackTesting表的标签 -> 转换方式（与build_backtesting_record一致）
+PROPERTY_FIELDS = {
+    'Trading range': 'date_range',
+    'Backtesting range': 'date_range',
+    'Start Date': 'date',
+    'Symbol': 'symbol',
+    'Currency': 'str',
+    'Timeframe': 'str',
+    'Point value': 'float',
+    'Chart type': 'str',
+    'Tick size': 'float',
+    'Precision': 'str',
+    'Initial capital': 'float',
+    'Order size': 'int',
+    'Pyramiding': 'int',
+    'Commission': 'float',
+    'Slippage': 'int',
+    'Verify price for limit orders': 'int',
+    'Margin for long positions': 'float',
+    'Margin for short positions': 'float',
+    'Recalculate after order is filled': 'str',
+    'Recalculate on every tick': 'str',
+    'Recalculate on bar close': 'str',
+    'Backtesting precision. Use bar magnifier': 'str',
+}
+
+# 缺少时写入会失败的标签（其余缺少时写入空值或默认值）
+REQUIRED_PROPERTIES = ('Symbol', 'Currency')
+
+# 报告中每个问题最多列出的行号
+MAX_LISTED_ROWS = 20
+
+# 目录中要校验的文件
+EXCEL_PATTERNS = ("*.[xX][lL][sS]*", "*.[cC][sS][vV]")
+
+
+def issue(level, check, message, **details):
+    """
+    :param level: ERROR / WARNING
+    :param check: 检查项名称
+    :param message: 说明
+    :return: dict
+    """
+    return dict(level=level, check=check, message=message, **details)
+
+
+def is_empty(value):
+    return value is None or str(value).strip() in ('', 'nan')
+
+
+def check_number(value, kind):
+    """数值标签能否转换（与safe_float、safe_int相同的规则）"""
+    if isinstance(value, str) and kind == 'float' and '%' in value:
+        value = value.rstrip('%')
+    try:
+        float(value) if kind == 'float' else int(value)
+        return True
+    except (ValueError, TypeError):
+        return False
+
+
+def check_properties(properties_sheet):
+    """
+    :param properties_sheet: parse_excel格式或CompactSheet
+    :return: list，问题
+    """
+    issues = []
+    if 'A' not in properties_sheet or 'B' not in properties_sheet:
+        return [issue(ERROR, 'missing_column', "Properties缺少A列或B列", sheet='Properties')]
+
+    props = read_properties(properties_sheet)
+    date_parser = DateParser()
+    for label, kind in PROPERTY_FIELDS.items():
+        if label not in props:
+            level = ERROR if label in REQUIRED_PROPERTIES else WARNING
+            issues.append(issue(level, 'missing_property', f"Properties缺少标签（或已改名）: {label}", property=label))
+            continue
+
+        value = props[label]
+        if kind == 'float' and isinstance(value, float) and value != value:
+            # 空单元格读出为nan，safe_float原样返回，写入DOUBLE列会失败
+            issues.append(issue(ERROR, 'property_nan', f"{label}为空（nan），写入会失败", property=label))
+            continue
+        if kind == 'date' and not value or kind in ('date_range', 'float', 'int') and is_empty(value):
+            continue
+        try:
+            if kind == 'date_range':
+                if date_parser.parse_range(value) == (None, None):
+                    issues.append(issue(WARNING, 'date_range', f"{label}不是日期范围，写入NULL: {value!r}",
+                                        property=label))
+            elif kind == 'date':
+                date_parser.parse(value)
+            elif kind == 'symbol':
+                split_symbol(value, props.get('Currency'))
+            elif kind in ('float', 'int') and not check_number(value, kind):
+                issues.append(issue(WARNING, 'property_default', f"{label}不能转换为{kind}，写入默认值: {value!r}",
+                                    property=label))
+        except (ValueError, TypeError, AttributeError) as e:
+            issues.append(issue(ERROR, 'property_format', f"{label}无法解析: {value!r}（{e}）", property=label))
+    return issues
+
+
+def check_metric_sheet(sheet_name, sheet_data):
+    """指标sheet需要A列标签和B ~ G列的值"""
+    missing = [letter for letter in ('A',) + tuple(letter for letter, _ in METRIC_COLUMNS) if letter not in sheet_data]
+    if missing:
+        return [issue(ERROR, 'missing_column', f"{sheet_name}缺少列: {missing}", sheet=sheet_name, columns=missing)]
+    return []
+
+
+def check_trade_chunks(chunks):
+    """
+    按build_trade_columns检查List of trades（整表为一块，大文件分块）
+    :param chunks: 可迭代的sheet分块（第0行为表头）
+    :return: (问题list, 交易行数, 有效行数)
+    """
+    issues = []
+    total = valid_total = 0
+    rejected_rows = []
+    for chunk in chunks:
+        missing = [letter for letter in TRADE_COLUMNS if letter not in chunk]
+        if missing:
+            return [issue(ERROR, 'missing_column', f"List of trades缺少列: {missing}",
+                          sheet='List of trades', columns=missing)], total, 0
+        _, valid = build_trade_columns(chunk)
+        rejected_rows.extend((np.flatnonzero(~valid) + 1 + total).tolist())
+        total += len(valid)
+        valid_total += int(valid.sum())
+
+    if rejected_rows:
+        issues.append(issue(WARNING, 'rejected_trades', f"格式错误、写入时会跳过的交易记录 {len(rejected_rows)} 条",
+                            count=len(rejected_rows), rows=rejected_rows[:MAX_LISTED_ROWS]))
+    if not valid_total:
+        issues.append(issue(ERROR, 'no_trades', "没有有效的交易记录，写入时不会提交"))
+    return issues, total, valid_total
+
+
+def validate_workbook(excel_data, file_name, trade_chunks=None):
+    """
+    检查一个已解析的工作簿
+    :param excel_data: parse_excel的返回值（大文件可不含List of trades）
+    :param file_name: 文件名（用于strategy）
+    :param trade_chunks: List of trades的分块，None时使用excel_data中的整表
+    :return: (问题list, 交易行数, 有效行数)
+    """
+    issues = []
+    if not FILE_NAME_PATTERN.match(file_name):
+        issues.append(issue(WARNING, 'file_name', "文件名中没有\"_\"，strategy取整个文件名"))
+
+    missing_sheets = [
+        sheet_name for sheet_name in BACKTESTING_SHEETS
+        if sheet_name not in excel_data and not (sheet_name == 'List of trades' and trade_chunks is not None)
+    ]
+    for sheet_name in missing_sheets:
+        issues.append(issue(ERROR, 'missing_sheet', f"缺少sheet: {sheet_name}", sheet=sheet_name))
+
+    if 'Properties' in excel_data:
+        issues.extend(check_properties(excel_data['Properties']))
+    for sheet_name in METRIC_SHEETS:
+        if sheet_name in excel_data:
+            issues.extend(check_metric_sheet(sheet_name, excel_data[sheet_name]))
+
+    total = valid_total = 0
+    if trade_chunks is None and 'List of trades' in excel_data:
+        trade_chunks = [excel_data['List of trades']]
+    if trade_chunks is not None:
+        trade_issues, total, valid_total = check_trade_chunks(trade_chunks)
+        issues.extend(trade_issues)
+
+    # 上面的检查没有发现错误时，按写入时的方式完整构建一次backtesting行
+    if not any(item['level'] == ERROR for item in issues):
+        try:
+            build_backtesting_record(excel_data, file_name)
+        except Exception as e:
+            issues.append(issue(ERROR, 'build_record', f"构建backtesting行失败: {type(e).__name__}: {e}"))
+    return issues, total, valid_total
+
+
+def validate_file(file_path, file_name=None, source=None):
+    """
+    解析并检查单个文件（进程池中执行）
+    :param file_path: Path
+    :param file_name: 报告中的文件名，默认file_path的文件名（zip成员为成员的文件名）
+    :param source: 报告中的来源，默认file_path
+    :return: dict，该文件的校验结果
+    """
+    file_name = file_name or file_path.name
+    start = time.perf_counter()
+    try:
+        if is_streaming_file(file_path):
+            excel_data = parse_excel(file_path, BACKTESTING_SHEETS[:-1])
+            issues, total, valid_total = validate_workbook(
+                excel_data, file_name, iter_sheet_chunks(file_path, 'List of trades', TRADE_CHUNK_ROWS)
+            )
+        else:
+            issues, total, valid_total = validate_workbook(parse_excel(file_path, compact=True), file_name)
+    except Exception as e:
+        issues, total, valid_total = [issue(ERROR, 'parse', f"解析文件失败: {type(e).__name__}: {e}")], 0, 0
+
+    levels = {item['level'] for item in issues}
+    return {
+        'file': file_name,
+        'source': str(source or file_path),
+        'status': ERROR if ERROR in levels else WARNING if WARNING in levels else 'ok',
+        'size': os.path.getsize(file_path),
+        'trades': total,
+        'valid_trades': valid_total,
+        'issues': issues,
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+def validate_zip_member(zip_path, member_name):
+    """
+    解压zip成员到临时文件后检查（不解压到new目录，不记录写入索引）
+    :return: validate_file的返回值
+    """
+    file_name = os.path.basename(member_name)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = Path(tmp_dir) / file_name
+        with zipfile.ZipFile(zip_path) as zip_ref, zip_ref.open(member_name) as member, open(tmp_path, 'wb') as f:
+            shutil.copyfileobj(member, f, UNZIP_CHUNK_SIZE)
+        return validate_file(tmp_path, file_name, f"{zip_path}!{member_name}")
+
+
+def zip_members(zip_path):
+    """:return: zip中与iter_unzip_file相同规则需要解压的成员名"""
+    with zipfile.ZipFile(zip_path) as zip_ref:
+        return [
+            info.filename for info in zip_ref.infolist()
+            if not info.filename.startswith('__MACOSX') and info.filename.lower().endswith(ZIP_MEMBER_SUFFIXES)
+        ]
+
+
+def collect_tasks(paths):
+    """
+    :param paths: 目录、excel文件、zip文件
+    :return: [(函数, 参数), ...]
+    """
+    tasks = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files = sorted(file for pattern in EXCEL_PATTERNS for file in path.glob(pattern))
+            zips = sorted(path.glob('*.zip'))
+        elif path.suffix.lower() == '.zip':
+            files, zips = [], [path]
+        else:
+            files, zips = [path], []
+        tasks.extend((validate_file, (file_path,)) for file_path in files)
+        for zip_path in zips:
+            try:
+                tasks.extend((validate_zip_member, (zip_path, member)) for member in zip_members(zip_path))
+            except (zipfile.BadZipFile, OSError) as e:
+                print(f"无法读取zip: {zip_path}: {e}")
+    return tasks
+
+
+def quarantine(results, invalid_dir=BACKTESTING_INVALID_DIR):
+    """
+    将有错误的文件移到invalid_dir（只移动普通文件，zip成员只在报告中列出）
+    :return: 移动的文件数
+    """
+    invalid_dir.mkdir(parents=True, exist_ok=True)
+    moved = 0
+    for result in results:
+        source = Path(result['source'])
+        if result['status'] != ERROR or not source.is_file():
+            continue
+        try:
+            shutil.move(source, invalid_dir / source.name)
+            moved += 1
+        except Exception as e:
+            print(f"移动文件失败： {source.name}: {e}")
+    return moved
+
+
+def write_report(report, report_path=None):
+    """
+    :param report_path: 默认VALIDATION_REPORT_DIR/validation_<时间>.json
+    :return: 报告路径
+    """
+    if report_path is None:
+        VALIDATION_REPORT_DIR.mkdir(parents=True, exist_ok=True)
+        report_path = VALIDATION_REPORT_DIR / f"validation_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    Path(report_path).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+    return report_path
+
+
+def validate_paths(paths=None, workers=INGEST_PARSE_WORKERS, report_path=None, move_invalid=False):
+    """
+    并行校验所有文件并写出报告
+    :param paths: 目录、excel文件、zip文件，默认new目录
+    :param workers: 进程数
+    :param report_path: 报告路径，默认VALIDATION_REPORT_DIR下按时间命名
+    :param move_invalid: 是否将有错误的文件移到BACKTESTING_INVALID_DIR
+    :return: dict，报告
+    """
+    print("===== 开始validate_paths =====")
+    tasks = collect_tasks(paths or [BACKTESTING_NEW_DIR])
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(func, *args): args for func, args in tasks}
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                # 读取zip成员等在validate_file之外的失败
+                source = '!'.join(map(str, futures[future]))
+                results.append({'file': os.path.basename(source), 'source': source, 'status': ERROR, 'size': None,
+                                'trades': 0, 'valid_trades': 0, 'seconds': 0,
+                                'issues': [issue(ERROR, 'read', f"读取失败: {type(e).__name__}: {e}")]})
+    results.sort(key=lambda result: result['source'])
+    elapsed = time.perf_counter() - start
+
+    counts = {status: sum(result['status'] == status for result in results) for status in ('ok', WARNING, ERROR)}
+    report = {
+        'generated_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'paths': [str(path) for path in (paths or [BACKTESTING_NEW_DIR])],
+        'files': len(results),
+        'counts': counts,
+        'elapsed_seconds': round(elapsed, 3),
+        'results': results,
+    }
+
+    for result in results:
+        for item in result['issues']:
+            print(f"[{item['level']}] {result['file']}: {item['message']}")
+    if move_invalid:
+        report['quarantined'] = quarantine(results)
+        print(f"有错误的文件已移到 {BACKTESTING_INVALID_DIR}: {report['quarantined']} 个")
+
+    path = write_report(report, report_path)
+    print(f"共校验 {len(results)} 个文件，耗时 {elapsed:.2f}s：通过 {counts['ok']}，警告 {counts[WARNING]}，"
+          f"错误 {counts[ERROR]}；报告: {path}")
+    return report
+
+
+if __name__ == "__main__":
+    validate_paths()
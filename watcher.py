@@ -0,0 +1,223 @@
+"""
+监听BACKTESTING_NEW_DIR的常驻进程：新文件落地后立即写入数据库
+
+- 有watchdog时用inotify等系统事件，否则每WATCH_POLL_INTERVAL秒扫描一次目录
+- 文件大小和修改时间WATCH_SETTLE_SECONDS秒内不再变化才处理（避免读到未上传完的文件）
+- zip文件用unzip_file的流式解压，解压出的文件无需等待直接处理
+- Excel文件经内容hash去重、进程池解析后，通过常驻连接池写入，提交后移动到processed目录
+- 写入失败的文件保留在new目录，WATCH_RETRY_SECONDS秒后或文件变化后重试
+用法：python watcher.py
+"""
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+from config import *
+from utils import iter_unzip_file, backup_zip
+from db_pool import ConnectionPool
+from instrumentation import run_with_metrics, merge_metrics, write_metrics_report
+from Backtesting import skip_ingested_files, parse_backtesting_file, \
+    write_and_move_batch, print_dimension_cache_stats, is_streaming_file, streaming_item
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+
+class WatchDaemon:
+    def __init__(self, watch_dir=BACKTESTING_NEW_DIR, poll_interval=WATCH_POLL_INTERVAL,
+                 settle_seconds=WATCH_SETTLE_SECONDS, retry_seconds=WATCH_RETRY_SECONDS,
+                 parse_workers=INGEST_PARSE_WORKERS, db_workers=INGEST_DB_WORKERS):
+        """
+        :param watch_dir: 监听的目录
+        :param poll_interval: 检查文件是否落地完成的间隔（无watchdog时也是扫描目录的间隔）
+        :param settle_seconds: 文件多少秒不变化视为写完
+        :param retry_seconds: 失败的文件多少秒后重试
+        :param parse_workers: 解析进程数
+        :param db_workers: 写数据库线程数
+        """
+        self.watch_dir = Path(watch_dir).resolve()
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.retry_seconds = retry_seconds
+        self.parse_workers = parse_workers
+        self.db_workers = db_workers
+
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.candidates = {}   # path -> (size, mtime, 最后一次变化的时间)
+        self.ready = set()     # 解压出的文件，无需等待落地
+        self.in_flight = set() # 正在处理的文件
+        self.failed = {}       # path -> (size, mtime, 失败时间)
+
+        self.pool = None
+        self.parse_pool = None
+        self.executor = None
+
+    def add(self, path):
+        """登记一个新出现或发生变化的文件"""
+        path = Path(path).resolve()
+        if path.parent != self.watch_dir or not self.is_supported(path):
+            return
+        with self.lock:
+            self.candidates.setdefault(path, (None, None, time.monotonic()))
+
+    @staticmethod
+    def is_supported(path):
+        name = path.name.lower()
+        return name.endswith('.zip') or name.endswith('.csv') or '.xls' in name
+
+    def scan(self):
+        """扫描目录中的所有文件（启动时、或没有watchdog时每次轮询）"""
+        for path in self.watch_dir.iterdir():
+            if path.is_file():
+                self.add(path)
+
+    def settled_files(self):
+        """
+        返回已落地完成、可以处理的文件，并从候选中移除
+        :return: list[Path]
+        """
+        now = time.monotonic()
+        settled = []
+        with self.lock:
+            for path, (size, mtime, changed_at) in list(self.candidates.items()):
+                if path in self.in_flight:
+                    continue
+                try:
+                    stat_result = path.stat()
+                except FileNotFoundError:
+                    # 已被移走
+                    del self.candidates[path]
+                    self.ready.discard(path)
+                    continue
+
+                current = (stat_result.st_size, stat_result.st_mtime)
+                if path in self.failed:
+                    failed_size, failed_mtime, failed_at = self.failed[path]
+                    if current == (failed_size, failed_mtime) and now - failed_at < self.retry_seconds:
+                        continue
+                    del self.failed[path]
+
+                if path in self.ready:
+                    self.ready.discard(path)
+                elif current != (size, mtime):
+                    self.candidates[path] = current + (now,)
+                    continue
+                elif now - changed_at < self.settle_seconds:
+                    continue
+
+                del self.candidates[path]
+                self.in_flight.add(path)
+                settled.append(path)
+        return settled
+
+    def process(self, path):
+        """处理单个已落地的文件"""
+        try:
+            if path.name.lower().endswith('.zip'):
+                success = self.process_zip(path)
+            else:
+                success = self.process_excel(path)
+        except Exception as e:
+            print(f"处理文件 {path.name} 时出错: ", type(e), e)
+            success = False
+
+        with self.lock:
+            self.in_flight.discard(path)
+            if not success and path.exists():
+                stat_result = path.stat()
+                self.failed[path] = (stat_result.st_size, stat_result.st_mtime, time.monotonic())
+                self.candidates[path] = (stat_result.st_size, stat_result.st_mtime, time.monotonic())
+
+    def process_zip(self, zip_file):
+        print("===== 正在解压：", zip_file.name, "=====")
+        for output_path, _ in iter_unzip_file(zip_file, self.watch_dir):
+            # 解压出的文件已完整，直接处理
+            output_path = Path(output_path).resolve()
+            with self.lock:
+                self.candidates[output_path] = (None, None, time.monotonic())
+                self.ready.add(output_path)
+        return backup_zip(zip_file)
+
+    def process_excel(self, file_path):
+        print("-正在处理%s-" % file_path.name)
+        pending = skip_ingested_files([file_path])
+        if not pending:
+            return True
+        if is_streaming_file(file_path):
+            files_done, _ = write_and_move_batch(self.pool, [streaming_item(*pending[0])])
+            return files_done == 1
+        parsed = merge_metrics(self.parse_pool.submit(run_with_metrics, parse_backtesting_file, file_path, pending[0][1]).result())
+        files_done, _ = write_and_move_batch(self.pool, [pending[0] + parsed])
+        return files_done == 1
+
+    def start_observer(self):
+        """有watchdog时启动系统事件监听，返回observer；否则返回None（轮询）"""
+        if Observer is None:
+            print("未安装watchdog，使用轮询监听")
+            return None
+
+        daemon = self
+
+        class Handler(FileSystemEventHandler):
+            def on_created(self, event):
+                if not event.is_directory:
+                    daemon.add(event.src_path)
+
+            def on_modified(self, event):
+                if not event.is_directory:
+                    daemon.add(event.src_path)
+
+            def on_moved(self, event):
+                if not event.is_directory:
+                    daemon.add(event.dest_path)
+
+        observer = Observer()
+        observer.schedule(Handler(), str(self.watch_dir), recursive=False)
+        observer.start()
+        print("使用文件系统事件监听")
+        return observer
+
+    def stop(self, *args):
+        self.stopped.set()
+
+    def run(self):
+        """启动监听，直到收到SIGINT/SIGTERM"""
+        print(f"===== 开始监听 {self.watch_dir} =====")
+        self.watch_dir.mkdir(parents=True, exist_ok=True)
+        BACKTESTING_PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
+
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+
+        self.pool = ConnectionPool(size=self.db_workers)
+        self.parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.db_workers)
+        observer = self.start_observer()
+        self.scan()
+
+        try:
+            while not self.stopped.wait(self.poll_interval):
+                if observer is None:
+                    self.scan()
+                for path in self.settled_files():
+                    self.executor.submit(self.process, path)
+        finally:
+            print("===== 停止监听，等待正在处理的文件完成 =====")
+            if observer is not None:
+                observer.stop()
+                observer.join()
+            self.executor.shutdown(wait=True)
+            self.parse_pool.shutdown(wait=True)
+            self.pool.close()
+            print_dimension_cache_stats()
+            write_metrics_report('watcher')
+
+
+if __name__ == "__main__":
+    WatchDaemon().run()